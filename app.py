@@ -2,119 +2,317 @@ import os
 import streamlit as st
 import pandas as pd
 
-from src.analytics import daily_active_users, monthly_active_users, churn_rate, activation_rate, conversion_funnel
+from src.analytics import churn_rate
 from src.cohorts import build_signup_cohorts, cohort_retention_matrix
-from src.feature_usage import feature_usage_counts, feature_usage_by_plan, top_features
-from src.revenue_metrics import monthly_mrr, arpu, ltv_estimate
-from src.visualizations import dau_mau_chart, retention_heatmap, feature_usage_bar, funnel_chart, mrr_trend_chart, churn_trend_chart
+from src.feature_usage import feature_usage_counts, top_features
+from src.revenue_metrics import monthly_mrr, arpu, cohort_ltv, ltv_estimate
+from src.funnel import activation_from_flags, funnel_breakdown, funnel_from_flags, user_stage_flags
+from src.ingest import LiveDataset, build_feature_cube, feature_usage_by_plan_from_cube, load_aggregates, load_tables
+from src.instrumentation import begin_trace, count_rows, end_trace, export_trace, input_rows, span, spans_frame, trace_path
+from src.loader import DATA_URI_ENV, resolve_base_dir
+from src.metric_cache import MetricCache, data_version, filter_fingerprint
+from src.parallel import MetricExecutor, parallel_cohort_retention_matrix, parallel_feature_usage_counts
+from src.intervals import PlanIndex
+from src.rollups import build_rollups, load_rollups, dau_from_rollup, mau_from_rollup, user_dimensions
+from src.sql_backend import BACKENDS, SqlBackend
+from src.sketches import activity_sketches, active_users_from_sketches, relative_error
+from src.visualizations import FigureCache, dau_mau_chart, retention_heatmap, feature_usage_bar, funnel_chart, funnel_breakdown_chart, mrr_trend_chart, churn_trend_chart
+
+PAGES = ["Overview", "Cohorts", "Feature Usage", "Revenue"]
+
+# Event columns each page reads; user_id and event_timestamp back the filters.
+EVENT_COLUMNS = {
+    "Overview": ("user_id", "event_type", "event_timestamp"),
+    "Cohorts": ("user_id", "event_timestamp"),
+    "Feature Usage": ("user_id", "feature_name", "event_timestamp"),
+    "Revenue": ("user_id", "event_timestamp"),
+}
+FUNNEL_BREAKDOWNS = {"Country": "country", "Acquisition channel": "acquisition_channel", "Plan": "plan_type"}
+
+@st.cache_data
+def load_data(base_dir: str, event_columns=None, version: int = None):
+    return load_tables(base_dir, event_columns, version)
+
+@st.cache_resource
+def load_live_dataset(base_dir: str, event_columns=None):
+    # Later ingest batches are appended by refresh(), not by reloading.
+    return LiveDataset(base_dir, event_columns, loader=load_data)
+
+@st.cache_resource
+def get_metric_cache():
+    return MetricCache()
+
+@st.cache_resource
+def get_figure_cache():
+    return FigureCache()
+
+@st.cache_resource
+def load_sql_backend(base_dir: str):
+    return SqlBackend(base_dir)
+
+@st.cache_resource
+def get_metric_executor():
+    return MetricExecutor()
+
+@st.cache_data
+def load_activity_rollups(base_dir: str, version: int, _users, _subs, _events):
+    rollups = load_rollups(base_dir)
+    if rollups is None:
+        rollups = build_rollups(_events, _users, _subs)
+    return rollups
+
+@st.cache_data
+def load_feature_cube(base_dir: str, version: int, _users, _subs, _events):
+    # One PlanIndex per data version attributes every feature event to its plan.
+    aggregates = load_aggregates(base_dir)
+    if aggregates is not None:
+        return aggregates[0]
+    return build_feature_cube(_events, user_dimensions(_users, _subs), PlanIndex(_subs))
 
 @st.cache_data
-def load_data(base_dir: str):
-    raw_dir = os.path.join(base_dir, "data", "raw")
-    users = pd.read_csv(os.path.join(raw_dir, "users.csv"), parse_dates=["signup_date"])
-    subs = pd.read_csv(os.path.join(raw_dir, "subscriptions.csv"), parse_dates=["subscription_start_date", "subscription_end_date"])
-    events = pd.read_csv(os.path.join(raw_dir, "events.csv"), parse_dates=["event_timestamp"])
-    revenue = pd.read_csv(os.path.join(raw_dir, "revenue.csv"), parse_dates=["month"])
-    return users, subs, events, revenue
-
-def apply_filters(users, subs, events, revenue, country, plan, channel, date_range):
-    if country:
-        users = users[users["country"].isin(country)]
-    if channel:
-        users = users[users["acquisition_channel"].isin(channel)]
-    if plan:
-        subs = subs[subs["plan_type"].isin(plan)]
-    if date_range:
-        start, end = date_range
-        events = events[(events["event_timestamp"] >= start) & (events["event_timestamp"] <= end)]
-        subs = subs[(subs["subscription_start_date"] <= end) & ((subs["subscription_end_date"].isna()) | (subs["subscription_end_date"] >= start))]
-        revenue = revenue[(revenue["month"] >= start.to_period("M").to_timestamp()) & (revenue["month"] <= end.to_period("M").to_timestamp())]
-    user_ids = users["user_id"].unique()
-    subs = subs[subs["user_id"].isin(user_ids)]
-    events = events[events["user_id"].isin(user_ids)]
-    return users, subs, events, revenue
+def load_activity_sketches(base_dir: str, version: int, _daily):
+    return activity_sketches(_daily)
+
+def approx_caption(subject: str, sql) -> str:
+    # DuckDB's approx_count_distinct has its own sketch and error bound; only ours is known here.
+    if sql is not None:
+        return f"{subject} DuckDB approx_count_distinct estimates."
+    return f"{subject} HyperLogLog estimates (standard error ±{relative_error():.1%})."
 
 def main():
     st.set_page_config(page_title="SaaS Product Analytics Dashboard", layout="wide")
     st.title("📊 SaaS Product Analytics Dashboard")
-    base_dir = os.path.dirname(__file__)
-    users, subs, events, revenue = load_data(base_dir)
+    base_dir = resolve_base_dir(os.environ.get(DATA_URI_ENV, os.path.dirname(__file__)))
 
     st.sidebar.header("Filters")
-    countries = sorted(users["country"].unique().tolist())
-    plans = sorted(subs["plan_type"].unique().tolist())
-    channels = sorted(users["acquisition_channel"].unique().tolist())
+    filter_box = st.sidebar.container()
+    page = st.sidebar.radio("Page", PAGES)
+    approx = st.sidebar.checkbox("Approximate distinct counts (HyperLogLog)", value=False)
+    parallel = st.sidebar.checkbox("Parallel metrics (process pool)", value=False)
+    backend = st.sidebar.selectbox("Query backend", BACKENDS)
+    perf_box = st.sidebar.expander("Performance")
+    record = perf_box.checkbox("Record timings", value=False)
+    track_memory = perf_box.checkbox("Track peak memory (slower)", value=False, disabled=not record)
+    export = perf_box.checkbox("Export spans to file", value=False, disabled=not record)
+    trace = begin_trace("rerun", enabled=record, track_memory=track_memory)
+    if trace is not None:
+        trace.root.set("page", page)
+        trace.root.set("backend", backend)
+
+    # The SQL backend queries the files on disk; only pandas loads the tables.
+    sql = load_sql_backend(base_dir) if backend == "DuckDB" else None
+    if sql is None:
+        with span("load_data") as s:
+            live = load_live_dataset(base_dir, EVENT_COLUMNS[page])
+            s.set("refreshed", live.refresh())
+            index = live.index
+            s.rows_out = len(index.events)
+        users, subs, events, revenue = index.users, index.subs, index.events, index.revenue
+        countries = sorted(users["country"].unique().tolist())
+        plans = sorted(subs["plan_type"].unique().tolist())
+        channels = sorted(users["acquisition_channel"].unique().tolist())
+        min_ts, max_ts = index.date_bounds()
+    else:
+        countries, plans, channels = sql.dimension_values()
+        min_ts, max_ts = sql.date_bounds()
 
-    selected_countries = st.sidebar.multiselect("Country", countries, default=countries)
-    selected_plans = st.sidebar.multiselect("Plan type", plans, default=plans)
-    selected_channels = st.sidebar.multiselect("Acquisition channel", channels, default=channels)
+    selected_countries = filter_box.multiselect("Country", countries, default=countries)
+    selected_plans = filter_box.multiselect("Plan type", plans, default=plans)
+    selected_channels = filter_box.multiselect("Acquisition channel", channels, default=channels)
 
-    min_date = events["event_timestamp"].min().date()
-    max_date = events["event_timestamp"].max().date()
-    date_range = st.sidebar.date_input("Date range", [min_date, max_date])
+    min_date, max_date = min_ts.date(), max_ts.date()
+    date_range = filter_box.date_input("Date range", [min_date, max_date])
     if isinstance(date_range, (tuple, list)) and len(date_range) == 2:
         date_range = (pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1]))
     else:
         date_range = None
 
-    page = st.sidebar.radio("Page", ["Overview", "Cohorts", "Feature Usage", "Revenue"])
+    filters = (selected_countries, selected_plans, selected_channels, date_range)
+    if sql is None:
+        with span("apply_filters", rows_in=count_rows((users, subs, events, revenue))) as s:
+            users_f, subs_f, events_f, revenue_f = index.filter(*filters)
+            s.rows_out = count_rows((users_f, subs_f, events_f, revenue_f))
 
-    users_f, subs_f, events_f, revenue_f = apply_filters(users, subs, events, revenue, selected_countries, selected_plans, selected_channels, date_range)
+    cache = get_metric_cache()
+    cache.set_data_version(data_version(base_dir))
+    fingerprint = filter_fingerprint(selected_countries, selected_plans, selected_channels, date_range)
+
+    executor = get_metric_executor() if parallel else None
+
+    # The positional args are always frames filtered by `filters`, so the
+    # fingerprint and data version identify them; hashing the events on every
+    # rerun would cost more than most metrics, so they are keyed as "filtered".
+    def metric(name, fn, *args, **kwargs):
+        with span(name, rows_in=input_rows(args, kwargs)) as s:
+            misses = cache.misses
+            result = cache.get_or_compute(name, fingerprint, fn, *args, args_key="filtered", **kwargs)
+            s.set("cache", "miss" if cache.misses > misses else "hit")
+            s.rows_out = count_rows(result)
+        return result
+
+    def metrics(calls):
+        with span("metrics", names=",".join(calls)) as s:
+            misses = cache.misses
+            results = cache.get_or_compute_many(fingerprint, calls, runner=executor.run_all if executor else None, args_key="filtered")
+            s.set("cache_misses", cache.misses - misses)
+        return results
+
+    figures = get_figure_cache()
+
+    def show(chart, *args, target=st, **kwargs):
+        # Unchanged inputs reuse the cached figure JSON instead of rebuilding the chart.
+        with span("plotly_chart", chart=chart.__name__) as s:
+            hits = figures.hits
+            fig = figures.get_or_build(chart, *args, **kwargs)
+            s.set("cache", "hit" if figures.hits > hits else "miss")
+            s.rows_in = count_rows(fig)
+            target.plotly_chart(fig, use_container_width=True)
 
     if page == "Overview":
         st.subheader("Overview")
         col1, col2, col3, col4 = st.columns(4)
 
-        dau_df = daily_active_users(events_f) if not events_f.empty else pd.DataFrame(columns=["date", "dau"])
-        mau_df = monthly_active_users(events_f) if not events_f.empty else pd.DataFrame(columns=["month", "mau"])
-
-        churn = churn_rate(subs_f) * 100 if not subs_f.empty else 0.0
-        activation = activation_rate(users_f, events_f) * 100 if not users_f.empty else 0.0
+        if sql is not None:
+            dau_df = metric("sql_dau", sql.daily_active_users, *filters, approx=approx)
+            mau_df = metric("sql_mau", sql.monthly_active_users, *filters, approx=approx)
+            churn = metric("sql_churn_rate", sql.churn_rate, *filters) * 100
+            funnel_df = metric("sql_conversion_funnel", sql.conversion_funnel, *filters)
+            mrr_df = metric("sql_monthly_mrr", sql.monthly_mrr, *filters)
+            n_users = int(funnel_df["count"].iloc[0])
+            activation = funnel_df["count"].iloc[1] / n_users * 100 if n_users else 0.0
+            latest_mrr = mrr_df["mrr"].iloc[-1] if not mrr_df.empty else 0.0
+        else:
+            with span("activity_rollups"):
+                daily, monthly = load_activity_rollups(base_dir, live.version, users, subs, events)
+            if approx:
+                with span("activity_sketches"):
+                    sketches = load_activity_sketches(base_dir, live.version, daily)
+                calls = {
+                    "dau_approx": (active_users_from_sketches, (sketches, "D", selected_countries, selected_channels, None, date_range), {}),
+                    "mau_approx": (active_users_from_sketches, (sketches, "M", selected_countries, selected_channels, None, date_range), {}),
+                }
+            else:
+                calls = {
+                    "dau": (dau_from_rollup, (daily, selected_countries, selected_channels, None, date_range), {}),
+                    "mau": (mau_from_rollup, (monthly, daily, selected_countries, selected_channels, None, date_range), {}),
+                }
+            calls["churn_rate"] = (churn_rate, (subs_f,), {})
+            # One pass over the filtered frames feeds both the activation KPI and the funnel.
+            calls["stage_flags"] = (user_stage_flags, (users_f, events_f, subs_f), {})
+            dau_df, mau_df, churn, flags = metrics(calls).values()
+            churn *= 100
+            activation = activation_from_flags(flags, len(users_f)) * 100
+            n_users = len(users_f)
+            funnel_df = funnel_from_flags(flags, n_users)
+            latest_mrr = revenue_f.sort_values("month")["mrr"].iloc[-1] if not revenue_f.empty else 0.0
 
-        col1.metric("Users", len(users_f))
+        col1.metric("Users", n_users)
         col2.metric("Churn rate", f"{churn:.1f}%")
         col3.metric("Activation rate", f"{activation:.1f}%")
-        if not revenue_f.empty:
-            latest_mrr = revenue_f.sort_values("month")["mrr"].iloc[-1]
-        else:
-            latest_mrr = 0.0
         col4.metric("Latest MRR", f"${latest_mrr:,.0f}")
 
-        st.plotly_chart(dau_mau_chart(dau_df, mau_df), use_container_width=True)
-        funnel_df = conversion_funnel(users_f, events_f, subs_f)
-        st.plotly_chart(funnel_chart(funnel_df), use_container_width=True)
+        show(dau_mau_chart, dau_df, mau_df)
+        if approx:
+            st.caption(approx_caption("DAU/MAU are", sql))
+        show(funnel_chart, funnel_df)
+        # Breakdowns slice the per-user stage flags, which only the pandas backend builds.
+        breakdown_by = "None" if sql is not None else st.selectbox("Funnel breakdown", ["None", "Country", "Acquisition channel", "Plan"])
+        if breakdown_by != "None":
+            by = FUNNEL_BREAKDOWNS[breakdown_by]
+            breakdown = metric("funnel_breakdown", funnel_breakdown, flags, users_f, subs_f, by=by)
+            show(funnel_breakdown_chart, breakdown, by)
 
     elif page == "Cohorts":
         st.subheader("Cohort Analysis")
-        cohorts_df = build_signup_cohorts(users_f)
-        matrix = cohort_retention_matrix(users_f, events_f)
+        grain_col, by_col = st.columns(2)
+        grain = grain_col.radio("Cohort grain", ["Monthly", "Weekly"], horizontal=True)
+        by_label = by_col.selectbox("Group cohorts by", ["None", "Country", "Acquisition channel"])
+        freq = "M" if grain == "Monthly" else "W"
+        by = {"None": None, "Country": "country", "Acquisition channel": "acquisition_channel"}[by_label]
+
+        if sql is not None:
+            cohorts_df = metric("sql_signup_cohorts", sql.build_signup_cohorts, *filters)
+            matrix = metric("sql_retention_matrix", sql.cohort_retention_matrix, *filters, approx=approx, freq=freq, by=by)
+        elif executor and not approx:
+            cohorts_df = metric("signup_cohorts", build_signup_cohorts, users_f)
+            matrix = metric("retention_matrix", parallel_cohort_retention_matrix, executor, users_f, events_f, freq=freq, by=by)
+        else:
+            cohorts_df = metric("signup_cohorts", build_signup_cohorts, users_f)
+            matrix = metric("retention_matrix", cohort_retention_matrix, users_f, events_f, approx=approx, freq=freq, by=by)
         st.write("Signup cohorts (users per month):")
         st.dataframe(cohorts_df)
-        st.plotly_chart(retention_heatmap(matrix), use_container_width=True)
-        st.info("Each row is a signup month cohort; each column is retention after N months since signup.")
+        if by and not matrix.empty:
+            groups = matrix.index.get_level_values(0).unique().tolist()
+            for tab, group in zip(st.tabs([str(g) for g in groups]), groups):
+                show(retention_heatmap, matrix.xs(group, level=0), target=tab)
+        else:
+            show(retention_heatmap, matrix)
+        period = "month" if freq == "M" else "week"
+        st.info(f"Each row is a signup {period} cohort; each column is retention after N {period}s since signup.")
+        if approx:
+            st.caption(approx_caption("Retained-user counts are", sql))
 
     elif page == "Feature Usage":
         st.subheader("Feature Usage")
-        feats = feature_usage_counts(events_f)
-        st.plotly_chart(feature_usage_bar(feats), use_container_width=True)
-        by_plan = feature_usage_by_plan(events_f, subs_f)
+        if sql is not None:
+            feats = metric("sql_feature_usage", sql.feature_usage_counts, *filters)
+            by_plan = metric("sql_feature_usage_by_plan", sql.feature_usage_by_plan, *filters)
+            topf = metric("sql_top_features", sql.top_features, *filters, n=10)
+        else:
+            if executor:
+                feats = metric("feature_usage", parallel_feature_usage_counts, executor, events_f)
+            else:
+                feats = metric("feature_usage", feature_usage_counts, events_f)
+            cube = load_feature_cube(base_dir, live.version, users, subs, events)
+            by_plan = metric(
+                "feature_usage_by_plan", feature_usage_by_plan_from_cube, cube, selected_countries, selected_channels, selected_plans, date_range
+            )
+            topf = metric("top_features", top_features, events_f, n=10)
+        show(feature_usage_bar, feats)
         if not by_plan.empty:
             st.write("Feature usage by plan type")
             st.dataframe(by_plan)
-        topf = top_features(events_f, n=10)
         st.write("Top features:")
         st.dataframe(topf)
 
     elif page == "Revenue":
         st.subheader("Revenue Intelligence")
-        mrr_df = monthly_mrr(revenue_f)
-        st.plotly_chart(mrr_trend_chart(mrr_df), use_container_width=True)
-        st.plotly_chart(churn_trend_chart(revenue_f), use_container_width=True)
-        arpu_df = arpu(subs_f, revenue_f) if not revenue_f.empty else pd.DataFrame(columns=["month", "arpu"])
+        if sql is not None:
+            revenue_f = metric("sql_revenue", sql.revenue, *filters)
+            mrr_df = metric("sql_monthly_mrr", sql.monthly_mrr, *filters)
+            arpu_df = metric("sql_arpu", sql.arpu, *filters)
+        else:
+            mrr_df = monthly_mrr(revenue_f)
+            arpu_df = metric("arpu", arpu, subs_f, revenue_f) if not revenue_f.empty else pd.DataFrame(columns=["month", "arpu"])
+        show(mrr_trend_chart, mrr_df)
+        show(churn_trend_chart, revenue_f)
+        st.caption("A subscription bills through the month it ends; its churn MRR is booked in the following month, the first without it.")
         if not arpu_df.empty:
             st.line_chart(arpu_df.set_index("month"))
-        ltv = ltv_estimate(subs_f, revenue_f) if not subs_f.empty else 0.0
+        if sql is not None:
+            ltv = metric("sql_ltv", sql.ltv_estimate, *filters)
+            ltv_segments = metric("sql_cohort_ltv", sql.cohort_ltv, *filters)
+        else:
+            ltv = metric("ltv", ltv_estimate, subs_f) if not subs_f.empty else 0.0
+            ltv_segments = metric("cohort_ltv", cohort_ltv, subs_f, users_f)
         st.metric("Estimated LTV", f"${ltv:,.0f}")
+        st.write("LTV by signup cohort, plan and acquisition channel")
+        st.dataframe(ltv_segments)
+
+    stats = cache.stats()
+    st.sidebar.caption(f"Metric cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']}/{stats['max_entries']} entries")
+    fig_stats = figures.stats()
+    st.sidebar.caption(f"Figure cache: {fig_stats['hits']} hits, {fig_stats['misses']} misses, {fig_stats['bytes'] / 2**20:.1f} MiB")
+
+    trace = end_trace()
+    if trace is not None:
+        spans = spans_frame(trace)
+        perf_box.caption(f"Last rerun: {trace.duration_s * 1000:,.0f} ms across {len(spans)} spans")
+        perf_box.dataframe(spans, hide_index=True, use_container_width=True)
+        if export:
+            path = trace_path(base_dir)
+            export_trace(trace, path)
+            perf_box.caption(f"Spans appended to {os.path.relpath(path, base_dir)} (OTLP/JSON, one trace per line)")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,589 @@
+import importlib
+import inspect
+import os
+import pkgutil
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+import app
+import src
+from src import analytics, cohorts, feature_usage, funnel, generate_dataset, ingest, intervals, loader, metric_cache
+from src import parallel, report, revenue_metrics, rollups, schema, sketches, sql_backend, storage, streaming, utils, visualizations
+from src.filter_engine import FilterIndex
+from src.intervals import PlanIndex, SubscriptionIntervals
+from src.metric_cache import MetricCache, filter_fingerprint
+from src.parallel import MetricExecutor
+from src.report import BatchReport
+from src.sql_backend import SqlBackend
+from src.streaming import EventAggregates
+from src.visualizations import FigureCache
+
+@dataclass(frozen=True)
+class Case:
+    """One timed call: setup(fixture) returns the positional args, outside the timer."""
+
+    name: str
+    fn: object
+    setup: object
+    kwargs: dict = field(default_factory=dict)
+
+    @property
+    def module(self) -> str:
+        return self.name.split(".")[0]
+
+    @property
+    def target(self) -> str:
+        return self.name.split("[")[0]
+
+class Fixture:
+    """Inputs for one dataset size, built lazily and shared by every case."""
+
+    def __init__(self, base_dir: str, n_users: int, seed: int = 42):
+        self.base_dir = base_dir
+        self.n_users = n_users
+        self.seed = seed
+
+    def rng(self) -> np.random.Generator:
+        return np.random.default_rng(self.seed)
+
+    @cached_property
+    def tables(self):
+        return ingest.load_tables(self.base_dir)
+
+    @property
+    def users(self):
+        return self.tables[0]
+
+    @property
+    def subs(self):
+        return self.tables[1]
+
+    @property
+    def events(self):
+        return self.tables[2]
+
+    @property
+    def revenue(self):
+        return self.tables[3]
+
+    @cached_property
+    def raw_tables(self) -> dict:
+        return {name: storage.read_table(self.base_dir, name) for name in ("users", "subscriptions", "events")}
+
+    @cached_property
+    def filters(self) -> tuple:
+        """A typical dashboard slice: some countries, paid plans, most channels, a mid-range window."""
+        countries = sorted(self.users["country"].astype(str).unique())[:4]
+        channels = ["ads", "organic", "referral"]
+        start, end = self.events["event_timestamp"].min(), self.events["event_timestamp"].max()
+        span = (end - start) / 4
+        return countries, ["pro", "enterprise"], channels, ((start + span).normalize(), (end - span).normalize())
+
+    @property
+    def date_range(self):
+        return self.filters[3]
+
+    @cached_property
+    def index(self) -> FilterIndex:
+        return FilterIndex(*self.tables)
+
+    @cached_property
+    def filtered(self):
+        return self.index.filter(*self.filters)
+
+    @cached_property
+    def dims(self) -> pd.DataFrame:
+        return rollups.user_dimensions(self.users, self.subs)
+
+    @cached_property
+    def rollups(self):
+        return rollups.build_rollups(self.events, self.users, self.subs)
+
+    @property
+    def daily(self):
+        return self.rollups[0]
+
+    @property
+    def monthly(self):
+        return self.rollups[1]
+
+    @cached_property
+    def new_events(self) -> pd.DataFrame:
+        # The latest 1% of events stand in for an incremental batch.
+        return self.events.nlargest(max(1, len(self.events) // 100), "event_timestamp")
+
+    @cached_property
+    def activity_sketches(self) -> pd.DataFrame:
+        return sketches.activity_sketches(self.daily)
+
+    @cached_property
+    def hashes(self) -> np.ndarray:
+        return sketches.hash_user_ids(self.events["user_id"])
+
+    @cached_property
+    def day_keys(self) -> pd.DataFrame:
+        return pd.DataFrame({"date": self.events["event_timestamp"].dt.normalize().to_numpy()})
+
+    @cached_property
+    def day_sketch(self) -> pd.DataFrame:
+        return sketches.build_sketches(self.day_keys, self.events["user_id"])
+
+    @cached_property
+    def ordinals(self) -> np.ndarray:
+        return cohorts.period_ordinals(self.events["event_timestamp"])
+
+    @cached_property
+    def activity_counts(self) -> pd.DataFrame:
+        return cohorts.cohort_activity_counts(self.users, self.events)
+
+    @cached_property
+    def cohort_sizes(self) -> pd.DataFrame:
+        return cohorts.cohort_sizes(self.users)
+
+    @cached_property
+    def flags(self) -> pd.DataFrame:
+        return funnel.user_stage_flags(self.users, self.events, self.subs)
+
+    @cached_property
+    def intervals(self) -> SubscriptionIntervals:
+        return SubscriptionIntervals(self.subs)
+
+    @cached_property
+    def month_range(self):
+        return self.revenue["month"].min(), self.revenue["month"].max()
+
+    @cached_property
+    def ltv_segments(self) -> pd.DataFrame:
+        return revenue_metrics.cohort_segments(self.subs, self.users)
+
+    @cached_property
+    def survival_counts(self) -> pd.DataFrame:
+        return revenue_metrics.survival_counts(self.subs, self.ltv_segments)
+
+    @cached_property
+    def feature_cube(self) -> pd.DataFrame:
+        return ingest.build_feature_cube(self.events, self.dims, self.plans)
+
+    @cached_property
+    def fresh_cube(self) -> pd.DataFrame:
+        return ingest.build_feature_cube(self.new_events, self.dims, self.plans)
+
+    @cached_property
+    def cohort_cells(self) -> pd.DataFrame:
+        return ingest.build_cohort_cells(self.monthly, self.users)
+
+    @cached_property
+    def batch_files(self) -> list:
+        root = storage.parquet_path(self.base_dir, "events")
+        return [os.path.relpath(os.path.join(d, f), root) for d, _, fs in os.walk(root) for f in fs if f.endswith(".parquet")][:1]
+
+    @cached_property
+    def event_chunk(self) -> pd.DataFrame:
+        return self.events.head(streaming.CHUNK_ROWS)
+
+    @cached_property
+    def plans(self) -> PlanIndex:
+        return PlanIndex(self.subs)
+
+    @cached_property
+    def known_users(self) -> np.ndarray:
+        return self.users["user_id"].astype(object).unique()
+
+    @cached_property
+    def aggregates(self) -> EventAggregates:
+        return EventAggregates(self.plans, self.known_users).fold(self.events)
+
+    @cached_property
+    def executor(self) -> MetricExecutor:
+        executor = MetricExecutor()
+        # Start the pool outside the timed calls; spawning workers is a one-off.
+        executor.run_all({"warmup": (len, ([],), {})})
+        return executor
+
+    @cached_property
+    def metric_calls(self) -> dict:
+        return {
+            "dau": (analytics.daily_active_users, (self.events,), {}),
+            "mau": (analytics.monthly_active_users, (self.events,), {}),
+            "churn_rate": (analytics.churn_rate, (self.subs,), {}),
+        }
+
+    @cached_property
+    def metric_cache(self) -> MetricCache:
+        cache = MetricCache()
+        cache.get_or_compute("dau", filter_fingerprint(*self.filters), analytics.daily_active_users, self.events)
+        return cache
+
+    @cached_property
+    def sql(self) -> SqlBackend:
+        return SqlBackend(self.base_dir)
+
+    @cached_property
+    def scratch_dir(self) -> str:
+        path = tempfile.mkdtemp(prefix="bench-")
+        os.makedirs(storage.processed_dir(path))
+        os.makedirs(storage.raw_dir(path))
+        return path
+
+    @cached_property
+    def dataset_copy(self) -> str:
+        # Cases that write derived data get their own copy of the tables, so
+        # the shared dataset and its data_version stay fixed for later cases.
+        path = os.path.join(self.scratch_dir, "copy")
+        shutil.copytree(storage.processed_dir(self.base_dir), storage.processed_dir(path), ignore=shutil.ignore_patterns("rollups", "aggregates", "manifest.json"))
+        return path
+
+    @cached_property
+    def built_copy(self) -> str:
+        # The copy with current rollups and aggregates, for the load cases.
+        ingest.build_aggregates(self.dataset_copy)
+        return self.dataset_copy
+
+    @cached_property
+    def users_csv(self) -> str:
+        path = os.path.join(self.scratch_dir, "users.csv")
+        self.raw_tables["users"].to_csv(path, index=False)
+        return path
+
+    @cached_property
+    def dau(self) -> pd.DataFrame:
+        return analytics.daily_active_users(self.events)
+
+    @cached_property
+    def mau(self) -> pd.DataFrame:
+        return analytics.monthly_active_users(self.events)
+
+    @cached_property
+    def retention(self) -> pd.DataFrame:
+        return cohorts.cohort_retention_matrix(self.users, self.events)
+
+    @cached_property
+    def weekly_retention(self) -> pd.DataFrame:
+        return cohorts.cohort_retention_matrix(self.users, self.events, freq="W")
+
+    @cached_property
+    def feature_counts(self) -> pd.DataFrame:
+        return feature_usage.feature_usage_counts(self.events)
+
+    @cached_property
+    def funnel(self) -> pd.DataFrame:
+        return funnel.funnel_from_flags(self.flags, len(self.users))
+
+    @cached_property
+    def breakdown(self) -> pd.DataFrame:
+        return funnel.funnel_breakdown(self.flags, self.users, self.subs, "country")
+
+    @cached_property
+    def report_frames(self) -> dict:
+        with MetricExecutor(max_workers=1) as executor:
+            return BatchReport(self.base_dir, executor).run(list(report.METRICS), ["country", "plan_type"])[0]
+
+    @cached_property
+    def event_series(self) -> tuple:
+        # One point per event, far past the chart point cap.
+        return self.index.event_ts, self.index.event_user_pos.astype(np.float64)
+
+    @cached_property
+    def figure_cache(self) -> FigureCache:
+        cache = FigureCache()
+        cache.get_or_build(visualizations.retention_heatmap, self.weekly_retention)
+        return cache
+
+    def close(self) -> None:
+        if "executor" in self.__dict__:
+            self.executor.close()
+        if "scratch_dir" in self.__dict__:
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+def _fold(plans, known_users, chunk):
+    return EventAggregates(plans, known_users).fold(chunk)
+
+def _read_chunks(base_dir):
+    return sum(len(chunk) for chunk in streaming.read_event_chunks(base_dir))
+
+def _live_dataset(base_dir):
+    return ingest.LiveDataset(base_dir).index
+
+def _cached_dau(cache, fingerprint, events):
+    # The fixture's cache already holds this entry, so this times a hit.
+    return metric_cache.cached_metric("dau", fingerprint, analytics.daily_active_users, events, cache=cache)
+
+def _share(df):
+    # A fresh executor per call, so the per-frame handle cache never hits.
+    return MetricExecutor(max_workers=2).share(df)
+
+def _batch_report(base_dir, executor, by):
+    return BatchReport(base_dir, executor).run(list(report.METRICS), by)[0]
+
+def _write_events(events, base_dir):
+    root = storage.parquet_path(base_dir, "events")
+    storage.write_events_partitioned(events, root, tag="bench")
+
+CASES = [
+    # app hot path
+    Case("app.load_data", app.load_data.__wrapped__, lambda d: (d.base_dir,)),
+    # analytics
+    Case("analytics.daily_active_users", analytics.daily_active_users, lambda d: (d.events,)),
+    Case("analytics.daily_active_users[approx]", analytics.daily_active_users, lambda d: (d.events,), {"approx": True}),
+    Case("analytics.monthly_active_users", analytics.monthly_active_users, lambda d: (d.events,)),
+    Case("analytics.monthly_active_users[approx]", analytics.monthly_active_users, lambda d: (d.events,), {"approx": True}),
+    Case("analytics.churn_rate", analytics.churn_rate, lambda d: (d.subs,)),
+    Case("analytics.activation_rate", analytics.activation_rate, lambda d: (d.users, d.events)),
+    Case("analytics.conversion_funnel", analytics.conversion_funnel, lambda d: (d.users, d.events, d.subs)),
+    # cohorts
+    Case("cohorts.build_signup_cohorts", cohorts.build_signup_cohorts, lambda d: (d.users,)),
+    Case("cohorts.period_ordinals", cohorts.period_ordinals, lambda d: (d.events["event_timestamp"],)),
+    Case("cohorts.period_starts", cohorts.period_starts, lambda d: (d.ordinals,)),
+    Case("cohorts.cohort_sizes", cohorts.cohort_sizes, lambda d: (d.users,)),
+    Case("cohorts.cohort_activity_counts", cohorts.cohort_activity_counts, lambda d: (d.users, d.events)),
+    Case("cohorts.retention_matrix_from_counts", cohorts.retention_matrix_from_counts, lambda d: (d.activity_counts, d.cohort_sizes)),
+    Case("cohorts.cohort_retention_matrix", cohorts.cohort_retention_matrix, lambda d: (d.users, d.events)),
+    Case("cohorts.cohort_retention_matrix[weekly]", cohorts.cohort_retention_matrix, lambda d: (d.users, d.events), {"freq": "W"}),
+    Case("cohorts.cohort_retention_matrix[by_country]", cohorts.cohort_retention_matrix, lambda d: (d.users, d.events), {"by": "country"}),
+    Case("cohorts.cohort_retention_matrix_approx", cohorts.cohort_retention_matrix_approx, lambda d: (d.users, d.events)),
+    # feature usage
+    Case("feature_usage.feature_usage_counts", feature_usage.feature_usage_counts, lambda d: (d.events,)),
+    Case("feature_usage.feature_usage_by_plan", feature_usage.feature_usage_by_plan, lambda d: (d.events, d.subs)),
+    Case("feature_usage.top_features", feature_usage.top_features, lambda d: (d.events,)),
+    # filter engine
+    Case("filter_engine.FilterIndex", FilterIndex, lambda d: d.tables),
+    Case("filter_engine.FilterIndex.filter", FilterIndex.filter, lambda d: (d.index, *d.filters)),
+    Case("filter_engine.FilterIndex.filter[date_only]", FilterIndex.filter, lambda d: (d.index, None, None, None, d.date_range)),
+    Case("filter_engine.FilterIndex.user_mask", FilterIndex.user_mask, lambda d: (d.index, d.filters[0], d.filters[2])),
+    Case("filter_engine.FilterIndex.date_bounds", FilterIndex.date_bounds, lambda d: (d.index,)),
+    # funnel
+    Case("funnel.user_stage_flags", funnel.user_stage_flags, lambda d: (d.users, d.events, d.subs)),
+    Case("funnel.funnel_counts", funnel.funnel_counts, lambda d: (d.flags,)),
+    Case("funnel.activation_from_flags", funnel.activation_from_flags, lambda d: (d.flags, len(d.users))),
+    Case("funnel.funnel_from_flags", funnel.funnel_from_flags, lambda d: (d.flags, len(d.users))),
+    Case("funnel.funnel_breakdown", funnel.funnel_breakdown, lambda d: (d.flags, d.users, d.subs)),
+    # dataset generation
+    Case("generate_dataset.random_dates", generate_dataset.random_dates, lambda d: (pd.Timestamp("2023-01-01"), pd.Timestamp("2024-06-30"), d.n_users, d.rng())),
+    Case("generate_dataset.generate_users", generate_dataset.generate_users, lambda d: (d.n_users, "2023-01-01", "2024-06-30", d.rng())),
+    Case("generate_dataset.generate_subscriptions", generate_dataset.generate_subscriptions, lambda d: (d.raw_tables["users"], d.rng())),
+    Case("generate_dataset.generate_events", generate_dataset.generate_events, lambda d: (d.raw_tables["users"], "2023-01-01", "2024-06-30", d.rng(), 35)),
+    Case("generate_dataset.generate_revenue", generate_dataset.generate_revenue, lambda d: (d.raw_tables["subscriptions"],)),
+    Case("generate_dataset.write_table", generate_dataset.write_table, lambda d: (d.raw_tables["users"], "users", d.scratch_dir)),
+    Case("generate_dataset.write_events", generate_dataset.write_events, lambda d: ([d.raw_tables["events"]], d.scratch_dir, "parquet")),
+    # ingest
+    Case("ingest.read_manifest", ingest.read_manifest, lambda d: (d.base_dir,)),
+    Case("ingest.manifest_version", ingest.manifest_version, lambda d: (d.base_dir,)),
+    Case("ingest.build_feature_cube", ingest.build_feature_cube, lambda d: (d.events, d.dims, d.plans)),
+    Case("ingest.merge_feature_cube", ingest.merge_feature_cube, lambda d: (d.feature_cube, d.fresh_cube)),
+    Case("ingest.build_cohort_cells", ingest.build_cohort_cells, lambda d: (d.monthly, d.users)),
+    Case("ingest.save_aggregates", ingest.save_aggregates, lambda d: (d.scratch_dir, d.feature_cube, d.cohort_cells)),
+    Case("ingest.load_aggregates", ingest.load_aggregates, lambda d: (d.built_copy,)),
+    Case("ingest.build_aggregates", ingest.build_aggregates, lambda d: (d.dataset_copy,)),
+    Case("ingest.feature_counts_from_cube", ingest.feature_counts_from_cube, lambda d: (d.feature_cube, d.filters[0], d.filters[2], d.date_range)),
+    Case("ingest.feature_usage_by_plan_from_cube", ingest.feature_usage_by_plan_from_cube, lambda d: (d.feature_cube, d.filters[0], d.filters[2], d.filters[1], d.date_range)),
+    Case("ingest.retention_from_cells", ingest.retention_from_cells, lambda d: (d.cohort_cells, d.users, d.filters[0], d.filters[2])),
+    Case("ingest.read_batch_events", ingest.read_batch_events, lambda d: (d.base_dir, d.batch_files)),
+    Case("storage.read_events_snapshot", storage.read_events_snapshot, lambda d: (d.base_dir, ingest.manifest_version(d.base_dir))),
+    Case("ingest.load_tables", ingest.load_tables, lambda d: (d.base_dir,)),
+    Case("ingest.LiveDataset", _live_dataset, lambda d: (d.base_dir,)),
+    # subscription intervals
+    Case("intervals.period_bounds", intervals.period_bounds, lambda d: ("D", *d.month_range)),
+    Case("intervals.SubscriptionIntervals", SubscriptionIntervals, lambda d: (d.subs,)),
+    Case("intervals.SubscriptionIntervals.active", SubscriptionIntervals.active, lambda d: (d.intervals, "M", *d.month_range)),
+    Case("intervals.SubscriptionIntervals.active[daily]", SubscriptionIntervals.active, lambda d: (d.intervals, "D", *d.month_range)),
+    Case("intervals.SubscriptionIntervals.active_by_plan", SubscriptionIntervals.active_by_plan, lambda d: (d.intervals, "M", *d.month_range)),
+    Case("intervals.SubscriptionIntervals.ended", SubscriptionIntervals.ended, lambda d: (d.intervals, "M", *d.month_range)),
+    Case("intervals.PlanIndex", PlanIndex, lambda d: (d.subs,)),
+    Case("intervals.PlanIndex.plan_codes_at", PlanIndex.plan_codes_at, lambda d: (d.plans, d.events["user_id"], d.events["event_timestamp"])),
+    Case("intervals.PlanIndex.plans_at", PlanIndex.plans_at, lambda d: (d.plans, d.events["user_id"], d.events["event_timestamp"])),
+    Case("intervals.SubscriptionIntervals.mrr_bridge", SubscriptionIntervals.mrr_bridge, lambda d: (d.intervals, "M", *d.month_range)),
+    # concurrent source loading
+    Case("loader.load_sources", loader.load_sources, lambda d: (d.base_dir,)),
+    Case("loader.load_sources[1 thread]", loader.load_sources, lambda d: (d.base_dir,), {"max_workers": 1}),
+    Case("loader.check_header", loader.check_header, lambda d: (d.base_dir, "events")),
+    Case("loader.validate_table", loader.validate_table, lambda d: (d.raw_tables["events"], "events")),
+    # metric cache
+    Case("metric_cache.filter_fingerprint", metric_cache.filter_fingerprint, lambda d: d.filters),
+    Case("metric_cache.data_version", metric_cache.data_version, lambda d: (d.base_dir,)),
+    Case("metric_cache.cached_metric", _cached_dau, lambda d: (d.metric_cache, filter_fingerprint(*d.filters), d.events)),
+    Case("metric_cache.MetricCache.get_or_compute_many", MetricCache.get_or_compute_many, lambda d: (d.metric_cache, filter_fingerprint(*d.filters), d.metric_calls)),
+    # process pool
+    Case("parallel.period_partitions", parallel.period_partitions, lambda d: (d.index.events["event_timestamp"], 8)),
+    Case("parallel.MetricExecutor.share", _share, lambda d: (d.events,)),
+    Case("parallel.MetricExecutor.run_all", MetricExecutor.run_all, lambda d: (d.executor, d.metric_calls)),
+    Case("parallel.parallel_cohort_retention_matrix", parallel.parallel_cohort_retention_matrix, lambda d: (d.executor, d.users, d.events)),
+    Case("parallel.parallel_feature_usage_counts", parallel.parallel_feature_usage_counts, lambda d: (d.executor, d.events)),
+    # batch reports
+    Case("report.BatchReport", BatchReport, lambda d: (d.base_dir, MetricExecutor(max_workers=1))),
+    Case("report.BatchReport.run", _batch_report, lambda d: (d.base_dir, MetricExecutor(max_workers=1), ["country", "plan_type"])),
+    Case("report.BatchReport.run[pool]", _batch_report, lambda d: (d.base_dir, d.executor, ["country", "plan_type"])),
+    Case("report.streaming_report", report.streaming_report, lambda d: (d.base_dir, report.STREAMING_METRICS)),
+    Case("report.funnel_for_users", report.funnel_for_users, lambda d: (d.flags, d.filtered[0])),
+    Case("report.write_report", report.write_report, lambda d: (d.report_frames, d.scratch_dir, ["parquet", "csv"])),
+    # revenue
+    Case("revenue_metrics.monthly_mrr", revenue_metrics.monthly_mrr, lambda d: (d.revenue,)),
+    Case("revenue_metrics.net_mrr_growth", revenue_metrics.net_mrr_growth, lambda d: (d.revenue,)),
+    Case("revenue_metrics.arpu", revenue_metrics.arpu, lambda d: (d.subs, d.revenue)),
+    Case("revenue_metrics.ltv_estimate", revenue_metrics.ltv_estimate, lambda d: (d.subs,)),
+    Case("revenue_metrics.revenue_bridge", revenue_metrics.revenue_bridge, lambda d: (d.subs, *d.month_range)),
+    Case("revenue_metrics.cohort_segments", revenue_metrics.cohort_segments, lambda d: (d.subs, d.users)),
+    Case("revenue_metrics.survival_counts", revenue_metrics.survival_counts, lambda d: (d.subs, d.ltv_segments)),
+    Case("revenue_metrics.survival_curves_from_counts", revenue_metrics.survival_curves_from_counts, lambda d: (d.survival_counts, revenue_metrics.LTV_SEGMENTS)),
+    Case("revenue_metrics.ltv_from_counts", revenue_metrics.ltv_from_counts, lambda d: (d.survival_counts, revenue_metrics.LTV_SEGMENTS)),
+    Case("revenue_metrics.survival_curves", revenue_metrics.survival_curves, lambda d: (d.subs, d.users)),
+    Case("revenue_metrics.cohort_ltv", revenue_metrics.cohort_ltv, lambda d: (d.subs, d.users)),
+    # rollups
+    Case("rollups.user_dimensions", rollups.user_dimensions, lambda d: (d.users, d.subs)),
+    Case("rollups.build_daily_rollup", rollups.build_daily_rollup, lambda d: (d.events, d.dims)),
+    Case("rollups.build_monthly_rollup", rollups.build_monthly_rollup, lambda d: (d.daily,)),
+    Case("rollups.build_rollups", rollups.build_rollups, lambda d: (d.events, d.users, d.subs)),
+    Case("rollups.update_rollups", rollups.update_rollups, lambda d: (d.daily, d.monthly, d.new_events, d.dims)),
+    Case("rollups.dau_from_rollup", rollups.dau_from_rollup, lambda d: (d.daily, d.filters[0], d.filters[2], d.filters[1], d.date_range)),
+    Case("rollups.mau_from_rollup", rollups.mau_from_rollup, lambda d: (d.monthly, d.daily, d.filters[0], d.filters[2], d.filters[1], d.date_range)),
+    Case("rollups.save_rollups", rollups.save_rollups, lambda d: (d.daily, d.monthly, d.scratch_dir)),
+    Case("rollups.load_rollups", rollups.load_rollups, lambda d: (d.built_copy,)),
+    # compact schema
+    Case("schema.build_dictionaries", schema.build_dictionaries, lambda d: (d.raw_tables,)),
+    Case("schema.compact_tables", schema.compact_tables, lambda d: tuple(d.raw_tables.values())),
+    Case("schema.memory_report", schema.memory_report, lambda d: (d.raw_tables, dict(zip(d.raw_tables, d.tables)))),
+    # HyperLogLog sketches
+    Case("sketches.hash_user_ids", sketches.hash_user_ids, lambda d: (d.events["user_id"],)),
+    Case("sketches.register_ranks", sketches.register_ranks, lambda d: (d.hashes,)),
+    Case("sketches.build_sketches", sketches.build_sketches, lambda d: (d.day_keys, d.events["user_id"])),
+    Case("sketches.merge_sketches", sketches.merge_sketches, lambda d: (d.day_sketch, ["date"])),
+    Case("sketches.estimate", sketches.estimate, lambda d: (d.day_sketch, ["date"])),
+    Case("sketches.distinct_count", sketches.distinct_count, lambda d: (d.day_sketch,)),
+    Case("sketches.daily_active_users_approx", sketches.daily_active_users_approx, lambda d: (d.events,)),
+    Case("sketches.monthly_active_users_approx", sketches.monthly_active_users_approx, lambda d: (d.events,)),
+    Case("sketches.activity_sketches", sketches.activity_sketches, lambda d: (d.daily,)),
+    Case("sketches.active_users_from_sketches", sketches.active_users_from_sketches, lambda d: (d.activity_sketches, "D", d.filters[0], d.filters[2], d.filters[1], d.date_range)),
+    Case("sketches.active_users_from_sketches[monthly]", sketches.active_users_from_sketches, lambda d: (d.activity_sketches, "M", d.filters[0], d.filters[2], d.filters[1], d.date_range)),
+    # DuckDB backend
+    Case("sql_backend.SqlBackend", SqlBackend, lambda d: (d.base_dir,)),
+    Case("sql_backend.SqlBackend.dimension_values", SqlBackend.dimension_values, lambda d: (d.sql,)),
+    Case("sql_backend.SqlBackend.date_bounds", SqlBackend.date_bounds, lambda d: (d.sql,)),
+    Case("sql_backend.SqlBackend.user_count", SqlBackend.user_count, lambda d: (d.sql, *d.filters)),
+    Case("sql_backend.SqlBackend.daily_active_users", SqlBackend.daily_active_users, lambda d: (d.sql, *d.filters)),
+    Case("sql_backend.SqlBackend.monthly_active_users", SqlBackend.monthly_active_users, lambda d: (d.sql, *d.filters)),
+    Case("sql_backend.SqlBackend.churn_rate", SqlBackend.churn_rate, lambda d: (d.sql, *d.filters)),
+    Case("sql_backend.SqlBackend.conversion_funnel", SqlBackend.conversion_funnel, lambda d: (d.sql, *d.filters)),
+    Case("sql_backend.SqlBackend.activation_rate", SqlBackend.activation_rate, lambda d: (d.sql, *d.filters)),
+    Case("sql_backend.SqlBackend.build_signup_cohorts", SqlBackend.build_signup_cohorts, lambda d: (d.sql, *d.filters)),
+    Case("sql_backend.SqlBackend.cohort_retention_matrix", SqlBackend.cohort_retention_matrix, lambda d: (d.sql, *d.filters)),
+    Case("sql_backend.SqlBackend.feature_usage_counts", SqlBackend.feature_usage_counts, lambda d: (d.sql, *d.filters)),
+    Case("sql_backend.SqlBackend.top_features", SqlBackend.top_features, lambda d: (d.sql, *d.filters)),
+    Case("sql_backend.SqlBackend.feature_usage_by_plan", SqlBackend.feature_usage_by_plan, lambda d: (d.sql, *d.filters)),
+    Case("sql_backend.SqlBackend.revenue", SqlBackend.revenue, lambda d: (d.sql, *d.filters)),
+    Case("sql_backend.SqlBackend.monthly_mrr", SqlBackend.monthly_mrr, lambda d: (d.sql, *d.filters)),
+    Case("sql_backend.SqlBackend.arpu", SqlBackend.arpu, lambda d: (d.sql, *d.filters)),
+    Case("sql_backend.SqlBackend.ltv_estimate", SqlBackend.ltv_estimate, lambda d: (d.sql, *d.filters)),
+    Case("sql_backend.SqlBackend.cohort_ltv", SqlBackend.cohort_ltv, lambda d: (d.sql, *d.filters)),
+    # storage
+    Case("storage.read_table", storage.read_table, lambda d: (d.base_dir, "events")),
+    Case("storage.read_table[month_pruned]", storage.read_table, lambda d: (d.base_dir, "events", None, *d.date_range)),
+    Case("storage.write_table", storage.write_table, lambda d: (d.raw_tables["users"], d.scratch_dir, "users")),
+    Case("storage.write_events_partitioned", _write_events, lambda d: (d.raw_tables["events"], d.scratch_dir)),
+    # streaming aggregation
+    Case("streaming.read_event_chunks", _read_chunks, lambda d: (d.base_dir,)),
+    Case("streaming.EventAggregates.fold", _fold, lambda d: (d.plans, d.known_users, d.event_chunk)),
+    Case("streaming.EventAggregates.merge", lambda a, b: EventAggregates(a.plans, a.user_index).merge(a).merge(b), lambda d: (d.aggregates, d.aggregates)),
+    Case("streaming.EventAggregates.daily_active_users", EventAggregates.daily_active_users, lambda d: (d.aggregates,)),
+    Case("streaming.EventAggregates.monthly_active_users", EventAggregates.monthly_active_users, lambda d: (d.aggregates,)),
+    Case("streaming.EventAggregates.cohort_retention_matrix", EventAggregates.cohort_retention_matrix, lambda d: (d.aggregates, d.users)),
+    Case("streaming.EventAggregates.feature_usage_counts", EventAggregates.feature_usage_counts, lambda d: (d.aggregates,)),
+    Case("streaming.EventAggregates.feature_usage_by_plan", EventAggregates.feature_usage_by_plan, lambda d: (d.aggregates,)),
+    Case("streaming.EventAggregates.activation_rate", EventAggregates.activation_rate, lambda d: (d.aggregates, d.users)),
+    Case("streaming.EventAggregates.conversion_funnel", EventAggregates.conversion_funnel, lambda d: (d.aggregates, d.users, d.subs)),
+    Case("streaming.stream_event_aggregates", streaming.stream_event_aggregates, lambda d: (d.base_dir, d.users, d.subs)),
+    # utils
+    Case("utils.load_csv", utils.load_csv, lambda d: (d.users_csv, ["signup_date"])),
+    # figure construction
+    Case("visualizations.dau_mau_chart", visualizations.dau_mau_chart, lambda d: (d.dau, d.mau)),
+    Case("visualizations.retention_heatmap", visualizations.retention_heatmap, lambda d: (d.retention,)),
+    Case("visualizations.retention_heatmap[weekly]", visualizations.retention_heatmap, lambda d: (d.weekly_retention,)),
+    Case("visualizations.feature_usage_bar", visualizations.feature_usage_bar, lambda d: (d.feature_counts,)),
+    Case("visualizations.funnel_chart", visualizations.funnel_chart, lambda d: (d.funnel,)),
+    Case("visualizations.funnel_breakdown_chart", visualizations.funnel_breakdown_chart, lambda d: (d.breakdown, "country")),
+    Case("visualizations.mrr_trend_chart", visualizations.mrr_trend_chart, lambda d: (revenue_metrics.monthly_mrr(d.revenue),)),
+    Case("visualizations.churn_trend_chart", visualizations.churn_trend_chart, lambda d: (d.revenue,)),
+    Case("visualizations.lttb_indices", visualizations.lttb_indices, lambda d: (*d.event_series, visualizations.MAX_LINE_POINTS)),
+    Case("visualizations.line_traces", visualizations.line_traces, lambda d: ([(*d.event_series, "events")],)),
+    Case("visualizations.data_hash", visualizations.data_hash, lambda d: (d.events,)),
+    Case("visualizations.FigureCache.key", FigureCache.key, lambda d: (d.figure_cache, visualizations.retention_heatmap, (d.weekly_retention,), {})),
+    # The fixture's cache already holds this figure, so this times a hit.
+    Case("visualizations.FigureCache.get_or_build", FigureCache.get_or_build, lambda d: (d.figure_cache, visualizations.retention_heatmap, d.weekly_retention)),
+]
+
+# Public names deliberately left out, with the reason; keys are fnmatch patterns.
+EXCLUDED = {
+    "filter_engine.day_after": "constant time",
+    "funnel.FunnelStep": "plain step definition",
+    "generate_dataset.ensure_dirs": "path helper",
+    "generate_dataset.iter_event_chunks": "timed through generate_events",
+    "generate_dataset.parse_args": "CLI",
+    "ingest.aggregate_dir": "path helper",
+    "ingest.manifest_path": "path helper",
+    "ingest.append_batch": "mutates the dataset; its steps are timed by update_rollups, merge_feature_cube and build_cohort_cells",
+    "instrumentation.*": "span bookkeeping; its cost depends on the number of spans, not the dataset size",
+    "ingest.LiveDataset.refresh": "no-op without a newer batch; the cold load is timed by ingest.LiveDataset",
+    "intervals.SubscriptionIntervals.default_range": "constant time",
+    "loader.SchemaError": "plain exception",
+    "loader.parse_args": "CLI",
+    "loader.required_columns": "constant time",
+    "loader.resolve_base_dir": "path helper",
+    "loader.source_path": "path helper",
+    "metric_cache.MetricCache*": "bookkeeping; timed through cached_metric and get_or_compute_many",
+    "parallel.FrameHandle*": "plain handle",
+    "parallel.MetricExecutor": "pool start-up is a one-off",
+    "parallel.MetricExecutor.close": "pool shutdown",
+    "parallel.MetricExecutor.submit": "timed through run_all and the parallel_* metrics",
+    "parallel.MetricExecutor.rows": "timed through the parallel_* metrics",
+    "report.ReportMetric": "plain metric definition",
+    "report.BatchReport.*": "timed through run",
+    "report.parse_args": "CLI",
+    "revenue_metrics.default_as_of": "constant time",
+    "revenue_metrics.ltv_from_plan_counts": "timed through ltv_estimate",
+    "rollups.rollup_dir": "path helper",
+    "sketches.relative_error": "constant time",
+    "sql_backend.SqlBackend.query": "timed through the metric methods",
+    "sql_backend.SqlBackend.survival_counts": "timed through cohort_ltv and ltv_estimate",
+    "sql_backend.parity_cases": "runs every metric twice; see python -m src.sql_backend",
+    "sql_backend.parity_report": "runs every metric twice; see python -m src.sql_backend",
+    "sql_backend.default_filter_sets": "constant time",
+    "storage.raw_dir": "path helper",
+    "storage.processed_dir": "path helper",
+    "storage.parquet_path": "path helper",
+    "storage.csv_path": "path helper",
+    "storage.has_parquet": "path helper",
+    "storage.table_paths": "timed through metric_cache.data_version",
+    "storage.stat_version": "timed through metric_cache.data_version",
+    "storage.*source_version": "timed through save_rollups and load_rollups",
+    "storage.ingest_csv_to_parquet": "needs the raw CSV layout; the harness writes Parquet",
+    "streaming.EventAggregates": "timed through fold",
+    "streaming.EventAggregates.activated_users": "timed through conversion_funnel",
+    "streaming.EventAggregates.top_features": "timed through feature_usage_counts",
+    "visualizations.FigureCache": "empty cache",
+    "visualizations.FigureCache.stats": "constant time",
+}
+
+def public_targets() -> list:
+    """Every public function, class and method defined under src/, as module.name."""
+    targets = []
+    for info in pkgutil.iter_modules(src.__path__):
+        module = importlib.import_module(f"src.{info.name}")
+        for name, obj in vars(module).items():
+            if name.startswith("_") or name == "main" or getattr(obj, "__module__", None) != module.__name__:
+                continue
+            if inspect.isfunction(obj):
+                targets.append(f"{info.name}.{name}")
+            elif inspect.isclass(obj):
+                targets.append(f"{info.name}.{name}")
+                for attr, member in vars(obj).items():
+                    if not attr.startswith("_") and inspect.isfunction(member):
+                        targets.append(f"{info.name}.{name}.{attr}")
+    return sorted(targets)
+
+def uncovered() -> list:
+    covered = {case.target for case in CASES}
+    return [t for t in public_targets() if t not in covered and not any(fnmatch(t, pattern) for pattern in EXCLUDED)]
@@ -0,0 +1,49 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from src.analytics import daily_active_users, monthly_active_users
+from src.cohorts import cohort_retention_matrix
+from src.generate_dataset import generate_events, generate_users
+from src.sketches import relative_error
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def compare(users: pd.DataFrame, events: pd.DataFrame, precision: int) -> pd.DataFrame:
+    rows = []
+    for name, fn, col in [
+        ("daily_active_users", daily_active_users, "dau"),
+        ("monthly_active_users", monthly_active_users, "mau"),
+    ]:
+        exact, t_exact = _timed(fn, events)
+        approx, t_approx = _timed(fn, events, approx=True, precision=precision)
+        err = (approx[col] - exact[col]).abs() / exact[col]
+        rows.append({"metric": name, "exact_s": t_exact, "approx_s": t_approx, "mean_rel_err": err.mean(), "max_rel_err": err.max()})
+
+    exact, t_exact = _timed(cohort_retention_matrix, users, events)
+    approx, t_approx = _timed(cohort_retention_matrix, users, events, approx=True, precision=precision)
+    err = (approx - exact).abs().to_numpy()
+    rows.append({"metric": "cohort_retention_matrix", "exact_s": t_exact, "approx_s": t_approx, "mean_rel_err": np.nan, "max_rel_err": err.max()})
+    return pd.DataFrame(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare HyperLogLog and exact distinct-user metrics.")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--events-per-user", type=int, default=35)
+    parser.add_argument("--precision", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    users = generate_users(args.users, "2023-01-01", "2024-06-30", rng)
+    events = generate_events(users, "2023-01-01", "2024-06-30", rng, args.events_per_user)
+    print(f"{len(users)} users, {len(events)} events, precision={args.precision} (std error ±{relative_error(args.precision):.2%})")
+    print("cohort_retention_matrix error is the max absolute retention difference.")
+    print(compare(users, events, args.precision).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+try:
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+except ImportError:  # pragma: no cover - results are still written without plots
+    plt = None
+
+from benchmarks.cases import CASES, EXCLUDED, Fixture, uncovered
+from src import generate_dataset
+from src.storage import has_parquet
+
+SIZES = [20_000, 200_000, 2_000_000]
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCH_DIR, "data")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+# A call only counts as a regression when it is both relatively and
+# absolutely slower (or bigger), so sub-millisecond noise never trips it.
+TIME_TOLERANCE = 0.25
+MIN_TIME_DELTA = 0.005
+MEMORY_TOLERANCE = 0.25
+MIN_MEMORY_DELTA = 1 << 20
+# Slope of log(time) against log(users) above which a case is flagged as
+# superlinear; points faster than MIN_FIT_SECONDS are too noisy to fit.
+MAX_EXPONENT = 1.4
+MIN_FIT_SECONDS = 0.005
+
+def dataset_dir(n_users: int, events_per_user: int, seed: int) -> str:
+    return os.path.join(DATA_DIR, f"users{n_users}-e{events_per_user}-s{seed}")
+
+def ensure_dataset(n_users: int, events_per_user: int, seed: int) -> str:
+    """Generate the Parquet dataset for one size once and reuse it across runs."""
+    base_dir = dataset_dir(n_users, events_per_user, seed)
+    if not has_parquet(base_dir, "revenue"):
+        generate_dataset.main(
+            ["--users", str(n_users), "--events-per-user", str(events_per_user), "--seed", str(seed), "--format", "parquet", "--base-dir", base_dir]
+        )
+    return base_dir
+
+def _rows(result):
+    if isinstance(result, tuple):
+        return sum(_rows(r) or 0 for r in result)
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+def measure(fn, args, kwargs, repeat: int) -> dict:
+    """Wall time over `repeat` calls, then one more call under tracemalloc for the peak."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    rows_out = _rows(result)
+    del result
+    gc.collect()
+    # tracemalloc sees Python and NumPy allocations; Arrow's own pool is not included.
+    tracemalloc.start()
+    try:
+        fn(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"min_s": min(times), "median_s": statistics.median(times), "peak_bytes": peak, "rows_out": rows_out}
+
+def run_size(n_users: int, events_per_user: int, seed: int, cases, repeat: int, skip: set) -> list:
+    base_dir = ensure_dataset(n_users, events_per_user, seed)
+    fixture = Fixture(base_dir, n_users, seed)
+    rows = []
+    try:
+        n_events = len(fixture.events)
+        for case in cases:
+            row = {"case": case.name, "module": case.module, "n_users": n_users, "n_events": n_events, "events_per_user": events_per_user}
+            if case.name in skip:
+                rows.append({**row, "status": "skipped"})
+                continue
+            try:
+                args = case.setup(fixture)
+                row.update(measure(case.fn, args, case.kwargs, repeat), status="ok")
+            except Exception as exc:
+                row.update(status="error", error=f"{type(exc).__name__}: {exc}")
+            rows.append(row)
+            print(_progress(row), flush=True)
+    finally:
+        fixture.close()
+    return rows
+
+def _progress(row: dict) -> str:
+    if row["status"] != "ok":
+        return f"  {row['case']:<60} {row['status']}: {row.get('error', '')}"
+    return f"  {row['case']:<60} {row['median_s'] * 1000:10.1f} ms {row['peak_bytes'] / 2**20:10.1f} MiB"
+
+def scaling_exponents(results: pd.DataFrame) -> pd.DataFrame:
+    """Least-squares slope of log(median time) against log(users) per case."""
+    ok = results[(results["status"] == "ok") & (results["median_s"] >= MIN_FIT_SECONDS)]
+    rows = []
+    for case, group in ok.groupby("case"):
+        if group["n_users"].nunique() < 2:
+            continue
+        slope = np.polyfit(np.log(group["n_users"]), np.log(group["median_s"]), 1)[0]
+        rows.append({"case": case, "exponent": slope, "superlinear": slope > MAX_EXPONENT})
+    return pd.DataFrame(rows, columns=["case", "exponent", "superlinear"])
+
+def compare_baseline(results: pd.DataFrame, baseline: pd.DataFrame) -> pd.DataFrame:
+    keys = ["case", "n_users", "events_per_user"]
+    current = results[results["status"] == "ok"]
+    base = baseline[baseline["status"] == "ok"][keys + ["median_s", "peak_bytes"]]
+    merged = current.merge(base, on=keys, suffixes=("", "_baseline"))
+    merged["time_ratio"] = merged["median_s"] / merged["median_s_baseline"]
+    merged["memory_ratio"] = merged["peak_bytes"] / merged["peak_bytes_baseline"].where(merged["peak_bytes_baseline"] > 0)
+    slower = (merged["time_ratio"] > 1 + TIME_TOLERANCE) & (merged["median_s"] - merged["median_s_baseline"] > MIN_TIME_DELTA)
+    bigger = (merged["memory_ratio"] > 1 + MEMORY_TOLERANCE) & (merged["peak_bytes"] - merged["peak_bytes_baseline"] > MIN_MEMORY_DELTA)
+    merged["regression"] = np.select([slower & bigger, slower, bigger], ["time+memory", "time", "memory"], "")
+    return merged[keys + ["median_s_baseline", "median_s", "time_ratio", "peak_bytes_baseline", "peak_bytes", "memory_ratio", "regression"]]
+
+def plot_scaling(results: pd.DataFrame, out_dir: str) -> list:
+    if plt is None:
+        print("matplotlib is not installed; skipping scaling plots")
+        return []
+    paths = []
+    ok = results[results["status"] == "ok"]
+    for module, group in ok.groupby("module"):
+        fig, (ax_time, ax_mem) = plt.subplots(1, 2, figsize=(14, 5))
+        for case, points in group.groupby("case"):
+            points = points.sort_values("n_users")
+            label = case.split(".", 1)[1]
+            ax_time.plot(points["n_users"], points["median_s"], marker="o", label=label)
+            ax_mem.plot(points["n_users"], points["peak_bytes"] / 2**20, marker="o", label=label)
+        for ax, ylabel in ((ax_time, "median wall time (s)"), (ax_mem, "peak traced memory (MiB)")):
+            ax.set_xscale("log")
+            ax.set_yscale("log")
+            ax.set_xlabel("users")
+            ax.set_ylabel(ylabel)
+            ax.grid(True, which="both", alpha=0.3)
+        ax_mem.legend(fontsize="small", loc="center left", bbox_to_anchor=(1.0, 0.5))
+        fig.suptitle(f"{module} scaling")
+        fig.tight_layout()
+        path = os.path.join(out_dir, f"scaling-{module}.png")
+        fig.savefig(path, dpi=100)
+        plt.close(fig)
+        paths.append(path)
+    return paths
+
+def environment() -> dict:
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def write_results(results: pd.DataFrame, meta: dict, out_dir: str) -> str:
+    os.makedirs(out_dir, exist_ok=True)
+    results.to_csv(os.path.join(out_dir, "results.csv"), index=False)
+    path = os.path.join(out_dir, "results.json")
+    records = json.loads(results.to_json(orient="records"))
+    with open(path, "w") as f:
+        json.dump({"meta": meta, "results": records}, f, indent=1)
+    return path
+
+def read_results(path: str) -> pd.DataFrame:
+    with open(path) as f:
+        return pd.DataFrame(json.load(f)["results"])
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time and memory-profile every public metric function across dataset sizes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="user counts to generate datasets for")
+    parser.add_argument("--events-per-user", type=int, default=35)
+    parser.add_argument("--seed", type=int, default=generate_dataset.RANDOM_SEED)
+    parser.add_argument("--repeat", type=int, default=3, help="timed calls per case and size")
+    parser.add_argument("-k", "--filter", help="only run cases whose name matches this regex")
+    parser.add_argument("--skip-after", type=float, default=120.0, help="skip larger sizes once a case takes longer than this (s)")
+    parser.add_argument("--out", default=RESULTS_DIR, help="directory for results.json/.csv and scaling plots")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="results.json to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--no-plots", action="store_true")
+    parser.add_argument("--list", action="store_true", help="list cases and uncovered public functions, then exit")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    cases = [c for c in CASES if not args.filter or re.search(args.filter, c.name)]
+    missing = uncovered()
+    if args.list:
+        for case in cases:
+            print(case.name)
+        print(f"\n{len(cases)} cases, {len(EXCLUDED)} exclusions, {len(missing)} uncovered public functions")
+        for name in missing:
+            print(f"  uncovered: {name}")
+        return 0
+    for name in missing:
+        print(f"warning: no benchmark case for {name}")
+
+    meta = {**environment(), "sizes": sorted(args.sizes), "events_per_user": args.events_per_user, "seed": args.seed, "repeat": args.repeat}
+    rows, skip = [], set()
+    for n_users in sorted(args.sizes):
+        print(f"== {n_users} users ==", flush=True)
+        rows += run_size(n_users, args.events_per_user, args.seed, cases, args.repeat, skip)
+        skip |= {r["case"] for r in rows if r["status"] == "ok" and r["median_s"] > args.skip_after}
+        # Written after every size so a crash at the largest size keeps the rest.
+        results = pd.DataFrame(rows)
+        path = write_results(results, meta, args.out)
+        gc.collect()
+
+    exponents = scaling_exponents(results)
+    exponents.to_csv(os.path.join(args.out, "exponents.csv"), index=False)
+    flagged = exponents[exponents["superlinear"]]
+    if not args.no_plots:
+        plot_scaling(results, args.out)
+    print(f"\nResults written to {path}")
+
+    errors = results[results["status"] == "error"].drop_duplicates("case")
+    for _, row in errors.iterrows():
+        print(f"error: {row['case']}: {row['error']}")
+    for _, row in flagged.iterrows():
+        print(f"superlinear: {row['case']} scales as n^{row['exponent']:.2f}")
+
+    regressions = pd.DataFrame()
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        comparison = compare_baseline(results, read_results(args.baseline))
+        comparison.to_csv(os.path.join(args.out, "comparison.csv"), index=False)
+        regressions = comparison[comparison["regression"] != ""]
+        for _, row in regressions.iterrows():
+            print(
+                f"regression ({row['regression']}): {row['case']} @ {row['n_users']} users: "
+                f"{row['median_s_baseline'] * 1000:.1f} -> {row['median_s'] * 1000:.1f} ms, "
+                f"{row['peak_bytes_baseline'] / 2**20:.1f} -> {row['peak_bytes'] / 2**20:.1f} MiB"
+            )
+        print(f"{len(comparison)} results compared against {args.baseline}, {len(regressions)} regressions")
+    if args.save_baseline:
+        shutil.copyfile(path, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+    return 1 if len(regressions) or len(flagged) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,115 @@
+import numpy as np
 import pandas as pd
 
+from src.sketches import DEFAULT_PRECISION, build_sketches, estimate
+
+COHORT_LABELS = {"M": ("signup_month", "m"), "W": ("signup_week", "w")}
+
 def build_signup_cohorts(users: pd.DataFrame) -> pd.DataFrame:
     df = users.copy()
     df["signup_month"] = df["signup_date"].dt.to_period("M").dt.to_timestamp()
     cohorts = df.groupby("signup_month")["user_id"].nunique().reset_index(name="num_users")
     return cohorts
 
-def cohort_retention_matrix(users: pd.DataFrame, events: pd.DataFrame) -> pd.DataFrame:
-    df_users = users.copy()
-    df_events = events.copy()
-    df_users["signup_month"] = df_users["signup_date"].dt.to_period("M").dt.to_timestamp()
-    df_events["event_month"] = df_events["event_timestamp"].dt.to_period("M").dt.to_timestamp()
-    merged = df_events.merge(df_users[["user_id", "signup_month"]], on="user_id", how="left")
-    merged["months_since_signup"] = (
-        (merged["event_month"].dt.to_period("M") - merged["signup_month"].dt.to_period("M")).apply(lambda p: p.n)
-    )
-    merged = merged[merged["months_since_signup"] >= 0]
-    cohort_pivot = merged.groupby(["signup_month", "months_since_signup"])["user_id"].nunique().reset_index()
-    cohort_sizes = df_users.groupby("signup_month")["user_id"].nunique().rename("cohort_size")
-    cohort_pivot = cohort_pivot.merge(cohort_sizes, on="signup_month")
-    cohort_pivot["retention"] = cohort_pivot["user_id"] / cohort_pivot["cohort_size"]
-    matrix = cohort_pivot.pivot_table(index="signup_month", columns="months_since_signup", values="retention").fillna(0.0)
-    matrix.columns = [f"m+{c}" for c in matrix.columns]
-    return matrix
+def period_ordinals(timestamps: pd.Series, freq: str = "M") -> np.ndarray:
+    values = timestamps.to_numpy(dtype="datetime64[ns]")
+    if freq == "M":
+        return values.astype("datetime64[M]").astype(np.int64)
+    if freq == "W":
+        # Monday-based weeks, matching pandas' W-SUN period ordinals.
+        return (values.astype("datetime64[D]").astype(np.int64) + 10) // 7
+    raise ValueError(f"Unsupported cohort frequency: {freq!r}")
+
+def period_starts(ordinals, freq: str = "M") -> pd.DatetimeIndex:
+    return pd.PeriodIndex.from_ordinals(np.asarray(ordinals, dtype=np.int64), freq=freq).to_timestamp()
+
+def _user_cohorts(users: pd.DataFrame, freq: str, by):
+    df = users.drop_duplicates("user_id")
+    df = df[df["signup_date"].notna()]
+    cohort = period_ordinals(df["signup_date"], freq)
+    groups = pd.Categorical(df[by]) if by else None
+    return pd.Index(df["user_id"]), cohort, groups
+
+def cohort_sizes(users: pd.DataFrame, freq: str = "M", by=None) -> pd.DataFrame:
+    index, cohort, groups = _user_cohorts(users, freq, by)
+    sizes = pd.DataFrame({"cohort": cohort})
+    keys = ["cohort"]
+    if by:
+        sizes[by] = groups
+        keys = [by, "cohort"]
+    return sizes.groupby(keys, observed=True).size().reset_index(name="cohort_size")
+
+def _event_cells(users: pd.DataFrame, events: pd.DataFrame, freq: str, by):
+    index, cohort, groups = _user_cohorts(users, freq, by)
+    pos = index.get_indexer(events["user_id"])
+    known = (pos >= 0) & events["event_timestamp"].notna().to_numpy()
+    pos = pos[known]
+    offset = period_ordinals(events["event_timestamp"][known], freq) - cohort[pos]
+    keep = offset >= 0
+    return index, pos[keep], offset[keep], cohort, groups
+
+def cohort_activity_counts(users: pd.DataFrame, events: pd.DataFrame, freq: str = "M", by=None) -> pd.DataFrame:
+    _, pos, offset, cohort, groups = _event_cells(users, events, freq, by)
+    if len(pos) == 0:
+        return pd.DataFrame(columns=([by] if by else []) + ["cohort", "offset", "active_users"])
+    # Each (user, period) pair counts once, so dedupe before counting.
+    span = int(offset.max()) + 1
+    pairs = np.unique(pos.astype(np.int64) * span + offset)
+    pos, offset = pairs // span, pairs % span
+    cells = pd.DataFrame({"cohort": cohort[pos], "offset": offset})
+    keys = ["cohort", "offset"]
+    if by:
+        cells.insert(0, by, groups[pos])
+        keys = [by] + keys
+    return cells.groupby(keys, observed=True).size().reset_index(name="active_users")
+
+def retention_matrix_from_counts(counts: pd.DataFrame, sizes: pd.DataFrame, freq: str = "M", by=None) -> pd.DataFrame:
+    if counts.empty:
+        return pd.DataFrame()
+    index_name, prefix = COHORT_LABELS[freq]
+    row_keys = ([by] if by else []) + ["cohort"]
+    counts = counts.merge(sizes, on=row_keys, how="left")
+
+    rows = counts[row_keys].drop_duplicates().sort_values(row_keys).reset_index(drop=True)
+    row_pos = pd.MultiIndex.from_frame(rows).get_indexer(pd.MultiIndex.from_frame(counts[row_keys]))
+    cols, col_pos = np.unique(counts["offset"].to_numpy(dtype=np.int64), return_inverse=True)
+
+    values = np.zeros((len(rows), len(cols)))
+    values[row_pos, col_pos.ravel()] = counts["active_users"].to_numpy() / counts["cohort_size"].to_numpy()
+
+    starts = period_starts(rows["cohort"], freq)
+    if by:
+        index = pd.MultiIndex.from_arrays([rows[by].to_numpy(), starts], names=[by, index_name])
+    else:
+        index = pd.Index(starts, name=index_name)
+    return pd.DataFrame(values, index=index, columns=[f"{prefix}+{c}" for c in cols])
+
+def cohort_retention_matrix(
+    users: pd.DataFrame,
+    events: pd.DataFrame,
+    approx: bool = False,
+    precision: int = DEFAULT_PRECISION,
+    freq: str = "M",
+    by=None,
+) -> pd.DataFrame:
+    if approx:
+        return cohort_retention_matrix_approx(users, events, precision, freq, by)
+    counts = cohort_activity_counts(users, events, freq, by)
+    return retention_matrix_from_counts(counts, cohort_sizes(users, freq, by), freq, by)
+
+def cohort_retention_matrix_approx(
+    users: pd.DataFrame, events: pd.DataFrame, precision: int = DEFAULT_PRECISION, freq: str = "M", by=None
+) -> pd.DataFrame:
+    index, pos, offset, cohort, groups = _event_cells(users, events, freq, by)
+    if len(pos) == 0:
+        return pd.DataFrame()
+    keys = pd.DataFrame({"cohort": cohort[pos], "offset": offset})
+    cell_keys = ["cohort", "offset"]
+    if by:
+        keys.insert(0, by, groups[pos])
+        cell_keys = [by] + cell_keys
+    counts = estimate(build_sketches(keys, index.to_numpy()[pos], precision), cell_keys, precision, name="active_users")
+    sizes = cohort_sizes(users, freq, by)
+    counts = counts.merge(sizes, on=cell_keys[:-1], how="left")
+    counts["active_users"] = np.minimum(counts["active_users"], counts["cohort_size"])
+    return retention_matrix_from_counts(counts.drop(columns="cohort_size"), sizes, freq, by)
@@ -1,19 +1,33 @@
+import numpy as np
 import pandas as pd
 
+from src.intervals import PlanIndex
+
 def feature_usage_counts(events: pd.DataFrame) -> pd.DataFrame:
     df = events.copy()
     df = df[df["feature_name"].notna()]
-    counts = df.groupby("feature_name")["user_id"].count().reset_index(name="event_count")
+    counts = df.groupby("feature_name", observed=True)["user_id"].count().reset_index(name="event_count")
     counts = counts.sort_values("event_count", ascending=False)
     return counts
 
 def feature_usage_by_plan(events: pd.DataFrame, subscriptions: pd.DataFrame) -> pd.DataFrame:
-    df = events.copy()
-    df = df[df["feature_name"].notna()]
-    latest_sub = subscriptions.sort_values("subscription_start_date").drop_duplicates("user_id", keep="last")
-    df = df.merge(latest_sub[["user_id", "plan_type"]], on="user_id", how="left")
-    grouped = df.groupby(["plan_type", "feature_name"])["user_id"].count().reset_index(name="event_count")
-    return grouped
+    # Each event counts toward the plan the user was on when it happened;
+    # events outside any subscription have no plan and are left out.
+    df = events[events["feature_name"].notna()]
+    plans = PlanIndex(subscriptions)
+    plan_codes = plans.plan_codes_at(df["user_id"], df["event_timestamp"])
+    feature_codes, features = pd.factorize(df["feature_name"], sort=True)
+    keep = plan_codes >= 0
+    n_features = len(features)
+    counts = np.bincount(plan_codes[keep] * n_features + feature_codes[keep], minlength=len(plans.plans) * n_features)
+    cells = np.flatnonzero(counts)
+    return pd.DataFrame(
+        {
+            "plan_type": plans.plans.to_numpy()[cells // n_features],
+            "feature_name": np.asarray(features, dtype=object)[cells % n_features],
+            "event_count": counts[cells],
+        }
+    )
 
 def top_features(events: pd.DataFrame, n: int = 10) -> pd.DataFrame:
     counts = feature_usage_counts(events)
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+
+# Below this share of the date-sliced events, gather the selected users'
+# events through the per-user offsets instead of masking the whole slice.
+GATHER_FRACTION = 0.1
+
+def day_after(end) -> pd.Timestamp:
+    # Exclusive upper bound: a date range includes its whole end day, as the daily rollups do.
+    return pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+
+def _codes(values: pd.Series):
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes, pd.Index(uniques)
+
+def _allowed(codes: np.ndarray, uniques: pd.Index, selected) -> np.ndarray:
+    ok = uniques.isin(list(selected))
+    return np.append(ok, False)[codes]
+
+def _ns(values: pd.Series) -> np.ndarray:
+    return values.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+
+class FilterIndex:
+    """Filter indexes built once per loaded dataset.
+
+    Users become a bitmap over integer positions, dimensions are factorized
+    codes, and events are sorted by timestamp with per-user offsets, so a
+    filter is a bitmap intersection plus a binary search on the date range.
+    """
+
+    def __init__(self, users: pd.DataFrame, subs: pd.DataFrame, events: pd.DataFrame, revenue: pd.DataFrame):
+        self.users = users
+        self.user_index = pd.Index(users["user_id"])
+        self.country_codes, self.countries = _codes(users["country"])
+        self.channel_codes, self.channels = _codes(users["acquisition_channel"])
+
+        self.subs = subs
+        self.sub_user_pos = self.user_index.get_indexer(subs["user_id"])
+        self.plan_codes, self.plans = _codes(subs["plan_type"])
+        self.sub_start = _ns(subs["subscription_start_date"])
+        self.sub_open = subs["subscription_end_date"].isna().to_numpy()
+        self.sub_end = _ns(subs["subscription_end_date"])
+
+        order = np.argsort(_ns(events["event_timestamp"]), kind="stable")
+        self.events = events.iloc[order].reset_index(drop=True)
+        self.event_ts = _ns(self.events["event_timestamp"])
+        self.event_user_pos = self.user_index.get_indexer(self.events["user_id"])
+        self.has_unknown_users = bool((self.event_user_pos < 0).any())
+        # CSR layout: events of user u are user_order[user_offsets[u]:user_offsets[u + 1]], in time order.
+        known = np.flatnonzero(self.event_user_pos >= 0)
+        self.user_order = known[np.argsort(self.event_user_pos[known], kind="stable")]
+        self.user_offsets = np.r_[0, np.cumsum(np.bincount(self.event_user_pos[known], minlength=len(users)))]
+
+        self.revenue = revenue.sort_values("month").reset_index(drop=True)
+        self.revenue_month = _ns(self.revenue["month"])
+
+    def date_bounds(self):
+        if len(self.event_ts) == 0:
+            return None, None
+        return pd.Timestamp(self.event_ts[0]), pd.Timestamp(self.event_ts[-1])
+
+    def user_mask(self, country=None, channel=None) -> np.ndarray:
+        mask = np.ones(len(self.users), dtype=bool)
+        if country:
+            mask &= _allowed(self.country_codes, self.countries, country)
+        if channel:
+            mask &= _allowed(self.channel_codes, self.channels, channel)
+        return mask
+
+    def _event_range(self, date_range):
+        if not date_range:
+            return 0, len(self.event_ts)
+        start, end = date_range
+        lo = np.searchsorted(self.event_ts, pd.Timestamp(start).value, side="left")
+        hi = np.searchsorted(self.event_ts, day_after(end).value, side="left")
+        return lo, hi
+
+    def _filter_events(self, mask: np.ndarray, date_range) -> pd.DataFrame:
+        lo, hi = self._event_range(date_range)
+        if mask.all() and not self.has_unknown_users:
+            return self.events.iloc[lo:hi]
+        selected = np.flatnonzero(mask)
+        starts, stops = self.user_offsets[selected], self.user_offsets[selected + 1]
+        n_selected = int((stops - starts).sum())
+        if n_selected < GATHER_FRACTION * (hi - lo):
+            lengths = stops - starts
+            rows = np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths) + np.arange(n_selected)
+            rows = np.sort(self.user_order[rows])
+            rows = rows[(rows >= lo) & (rows < hi)]
+            return self.events.iloc[rows]
+        pos = self.event_user_pos[lo:hi]
+        keep = (pos >= 0) & mask[np.maximum(pos, 0)]
+        return self.events.iloc[lo:hi][keep]
+
+    def _filter_subs(self, mask: np.ndarray, plan, date_range) -> pd.DataFrame:
+        keep = (self.sub_user_pos >= 0) & mask[np.maximum(self.sub_user_pos, 0)]
+        if plan:
+            keep &= _allowed(self.plan_codes, self.plans, plan)
+        if date_range:
+            start, end = date_range
+            keep &= self.sub_start < day_after(end).value
+            keep &= self.sub_open | (self.sub_end >= pd.Timestamp(start).value)
+        return self.subs[keep]
+
+    def _filter_revenue(self, date_range) -> pd.DataFrame:
+        if not date_range:
+            return self.revenue
+        start, end = date_range
+        lo = np.searchsorted(self.revenue_month, start.to_period("M").to_timestamp().value, side="left")
+        hi = np.searchsorted(self.revenue_month, end.to_period("M").to_timestamp().value, side="right")
+        return self.revenue.iloc[lo:hi]
+
+    def filter(self, country=None, plan=None, channel=None, date_range=None):
+        mask = self.user_mask(country, channel)
+        users = self.users if mask.all() else self.users[mask]
+        return (
+            users,
+            self._filter_subs(mask, plan, date_range),
+            self._filter_events(mask, date_range),
+            self._filter_revenue(date_range),
+        )
@@ -1,221 +1,224 @@
+import argparse
 import os
+import shutil
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-import random
+from datetime import datetime
+
+from src.revenue_metrics import revenue_bridge
+from src.storage import parquet_path, write_events_partitioned
+from src.storage import write_table as write_parquet_table
 
 RANDOM_SEED = 42
-np.random.seed(RANDOM_SEED)
-random.seed(RANDOM_SEED)
+CHUNK_USERS = 50_000
+
+COUNTRIES = ["DE", "IT", "CH", "TR", "US", "FR", "NL", "SE"]
+COUNTRY_P = [0.2, 0.15, 0.1, 0.15, 0.15, 0.1, 0.1, 0.05]
+CHANNELS = ["ads", "organic", "referral", "partner"]
+CHANNEL_P = [0.35, 0.4, 0.2, 0.05]
+PLANS = ["free", "pro", "enterprise"]
+PLAN_P = [0.6, 0.3, 0.1]
+
+EVENT_TYPES = [
+    "login",
+    "session_start",
+    "feature_open",
+    "create_project",
+    "share_item",
+    "download_report",
+    "session_end",
+]
+EVENT_TYPE_P = [0.25, 0.15, 0.25, 0.1, 0.1, 0.05, 0.1]
+FEATURE_EVENT_TYPES = ["feature_open", "create_project", "share_item", "download_report"]
+FEATURE_NAMES = [
+    "dashboard",
+    "analytics_page",
+    "billing_page",
+    "reports",
+    "workspace",
+    "team_settings",
+]
 
 def ensure_dirs(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
-def random_dates(start: datetime, end: datetime, n: int) -> np.ndarray:
+def random_dates(start: datetime, end: datetime, n: int, rng: np.random.Generator) -> np.ndarray:
     delta = end - start
-    return np.array([start + timedelta(days=random.randint(0, delta.days)) for _ in range(n)])
-
-def generate_users(n_users: int, start_date: str, end_date: str) -> pd.DataFrame:
-    countries = ["DE", "IT", "CH", "TR", "US", "FR", "NL", "SE"]
-    channels = ["ads", "organic", "referral", "partner"]
-    plans = ["free", "pro", "enterprise"]
+    offsets = rng.integers(0, delta.days + 1, size=n)
+    return np.datetime64(start, "D") + offsets.astype("timedelta64[D]")
 
+def generate_users(n_users: int, start_date: str, end_date: str, rng: np.random.Generator) -> pd.DataFrame:
     start = datetime.fromisoformat(start_date)
     end = datetime.fromisoformat(end_date)
 
-    user_ids = [f"U{idx:05d}" for idx in range(1, n_users + 1)]
-    signup_dates = random_dates(start, end, n_users)
+    user_ids = "U" + pd.Series(np.arange(1, n_users + 1)).astype(str).str.zfill(5)
+    signup_dates = random_dates(start, end, n_users, rng)
 
     df = pd.DataFrame(
         {
             "user_id": user_ids,
-            "country": np.random.choice(countries, size=n_users, p=[0.2, 0.15, 0.1, 0.15, 0.15, 0.1, 0.1, 0.05]),
-            "signup_date": signup_dates,
-            "acquisition_channel": np.random.choice(channels, size=n_users, p=[0.35, 0.4, 0.2, 0.05]),
-            "initial_plan": np.random.choice(plans, size=n_users, p=[0.6, 0.3, 0.1]),
+            "country": rng.choice(COUNTRIES, size=n_users, p=COUNTRY_P),
+            "signup_date": pd.to_datetime(signup_dates),
+            "acquisition_channel": rng.choice(CHANNELS, size=n_users, p=CHANNEL_P),
+            "initial_plan": rng.choice(PLANS, size=n_users, p=PLAN_P),
         }
     )
     return df
 
-def generate_subscriptions(users: pd.DataFrame) -> pd.DataFrame:
+def generate_subscriptions(users: pd.DataFrame, rng: np.random.Generator) -> pd.DataFrame:
     convert_prob = {"free": 0.35, "pro": 0.7, "enterprise": 0.9}
     churn_prob = 0.12
+    max_months = 18
     plan_mrr = {"free": 0.0, "pro": 49.0, "enterprise": 199.0}
 
-    records = []
-    for _, row in users.iterrows():
-        user_id = row["user_id"]
-        signup_date = row["signup_date"]
-        plan = row["initial_plan"]
-
-        p_conv = convert_prob[plan]
-        converted = np.random.rand() < p_conv
-
-        if not converted and plan == "free":
-            records.append(
-                {
-                    "user_id": user_id,
-                    "subscription_start_date": signup_date,
-                    "subscription_end_date": None,
-                    "plan_type": "free",
-                    "is_churned": False,
-                    "mrr": 0.0,
-                }
-            )
-            continue
-
-        start_date = signup_date + timedelta(days=np.random.randint(0, 60))
-        max_months = 18
-        months_active = np.random.geometric(p=churn_prob)
-        months_active = min(months_active, max_months)
-        end_date = start_date + timedelta(days=30 * months_active)
-
-        today = datetime.utcnow()
-        if end_date > today:
-            end_date = None
-            is_churned = False
-        else:
-            is_churned = True
-
-        current_plan = plan
-        if current_plan == "pro" and np.random.rand() < 0.2:
-            current_plan = "enterprise"
-
-        mrr = plan_mrr.get(current_plan, 0.0)
-
-        records.append(
+    n = len(users)
+    plan = users["initial_plan"].to_numpy(dtype=object)
+    signup = users["signup_date"].to_numpy(dtype="datetime64[ns]")
+
+    converted = rng.random(n) < pd.Series(plan).map(convert_prob).to_numpy()
+    stays_free = ~converted & (plan == "free")
+
+    start_offset = rng.integers(0, 60, size=n).astype("timedelta64[D]")
+    months_active = np.minimum(rng.geometric(p=churn_prob, size=n), max_months)
+    upgraded = (plan == "pro") & (rng.random(n) < 0.2)
+
+    start = np.where(stays_free, signup, signup + start_offset)
+    end = start + (30 * months_active).astype("timedelta64[D]")
+    today = np.datetime64(pd.Timestamp.now("UTC").tz_localize(None))
+    is_churned = ~stays_free & (end <= today)
+    end = np.where(is_churned, end, np.datetime64("NaT"))
+
+    current_plan = np.where(stays_free, "free", np.where(upgraded, "enterprise", plan))
+    return pd.DataFrame(
+        {
+            "user_id": users["user_id"].to_numpy(),
+            "subscription_start_date": start,
+            "subscription_end_date": end,
+            "plan_type": current_plan,
+            "is_churned": is_churned,
+            "mrr": pd.Series(current_plan).map(plan_mrr).to_numpy(dtype=float),
+        }
+    )
+
+def iter_event_chunks(
+    users: pd.DataFrame,
+    start_date: str,
+    end_date: str,
+    rng: np.random.Generator,
+    avg_events_per_user: int = 40,
+    chunk_users: int = CHUNK_USERS,
+):
+    start = np.datetime64(datetime.fromisoformat(start_date), "m")
+    delta_days = (datetime.fromisoformat(end_date) - datetime.fromisoformat(start_date)).days
+    feature_type_codes = [EVENT_TYPES.index(t) for t in FEATURE_EVENT_TYPES]
+
+    user_ids = users["user_id"].to_numpy()
+    next_event_id = 1
+    for lo in range(0, len(users), chunk_users):
+        block = user_ids[lo : lo + chunk_users]
+        n_events = np.maximum(5, rng.poisson(lam=avg_events_per_user, size=len(block)))
+        total = int(n_events.sum())
+
+        day_offset = rng.integers(0, delta_days + 1, size=total)
+        hours = rng.integers(0, 24, size=total)
+        minutes = rng.integers(0, 60, size=total)
+        ts = start + (day_offset * 1440 + hours * 60 + minutes).astype("timedelta64[m]")
+
+        type_codes = rng.choice(len(EVENT_TYPES), size=total, p=EVENT_TYPE_P)
+        feature_codes = rng.integers(0, len(FEATURE_NAMES), size=total)
+        feature_codes[~np.isin(type_codes, feature_type_codes)] = -1
+
+        event_ids = np.arange(next_event_id, next_event_id + total)
+        next_event_id += total
+
+        yield pd.DataFrame(
             {
-                "user_id": user_id,
-                "subscription_start_date": start_date,
-                "subscription_end_date": end_date,
-                "plan_type": current_plan,
-                "is_churned": is_churned,
-                "mrr": mrr,
+                "event_id": "E" + pd.Series(event_ids).astype(str).str.zfill(7),
+                "user_id": np.repeat(block, n_events),
+                "event_type": pd.Categorical.from_codes(type_codes, EVENT_TYPES),
+                "event_timestamp": ts.astype("datetime64[s]"),
+                "feature_name": pd.Categorical.from_codes(feature_codes, FEATURE_NAMES),
             }
         )
 
-    return pd.DataFrame(records)
-
 def generate_events(
     users: pd.DataFrame,
     start_date: str,
     end_date: str,
+    rng: np.random.Generator,
     avg_events_per_user: int = 40,
 ) -> pd.DataFrame:
-    start = datetime.fromisoformat(start_date)
-    end = datetime.fromisoformat(end_date)
-    delta_days = (end - start).days
-
-    event_types = [
-        "login",
-        "session_start",
-        "feature_open",
-        "create_project",
-        "share_item",
-        "download_report",
-        "session_end",
-    ]
-    feature_names = [
-        "dashboard",
-        "analytics_page",
-        "billing_page",
-        "reports",
-        "workspace",
-        "team_settings",
-    ]
-
-    records = []
-    event_id_counter = 1
-
-    for _, row in users.iterrows():
-        user_id = row["user_id"]
-        n_events = np.random.poisson(lam=avg_events_per_user)
-        n_events = max(5, n_events)
-
-        for _ in range(n_events):
-            day_offset = np.random.randint(0, delta_days + 1)
-            ts = start + timedelta(days=int(day_offset), hours=np.random.randint(0, 24), minutes=np.random.randint(0, 60))
-            etype = np.random.choice(event_types, p=[0.25, 0.15, 0.25, 0.1, 0.1, 0.05, 0.1])
-            feature = None
-            if etype in ["feature_open", "create_project", "share_item", "download_report"]:
-                feature = np.random.choice(feature_names)
-
-            records.append(
-                {
-                    "event_id": f"E{event_id_counter:07d}",
-                    "user_id": user_id,
-                    "event_type": etype,
-                    "event_timestamp": ts,
-                    "feature_name": feature,
-                }
-            )
-            event_id_counter += 1
-
-    return pd.DataFrame(records)
+    chunks = list(iter_event_chunks(users, start_date, end_date, rng, avg_events_per_user))
+    if not chunks:
+        return pd.DataFrame(columns=["event_id", "user_id", "event_type", "event_timestamp", "feature_name"])
+    return pd.concat(chunks, ignore_index=True)
+
+def write_events(chunks, base_dir: str, fmt: str = "csv") -> int:
+    rows = 0
+    if fmt == "parquet":
+        root = parquet_path(base_dir, "events")
+        if os.path.exists(root):
+            shutil.rmtree(root)
+        for i, chunk in enumerate(chunks):
+            write_events_partitioned(chunk, root, tag=f"chunk{i:05d}")
+            rows += len(chunk)
+        return rows
+
+    path = os.path.join(base_dir, "data", "raw", "events.csv")
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(path, index=False, mode="w" if i == 0 else "a", header=i == 0)
+        rows += len(chunk)
+    return rows
+
+def write_table(df: pd.DataFrame, name: str, base_dir: str, fmt: str = "csv") -> None:
+    if fmt == "parquet":
+        write_parquet_table(df, base_dir, name)
+    else:
+        df.to_csv(os.path.join(base_dir, "data", "raw", f"{name}.csv"), index=False)
 
 def generate_revenue(subscriptions: pd.DataFrame) -> pd.DataFrame:
+    # Every month from the first subscription to now, bridged from the subscriptions themselves.
     if subscriptions.empty:
-        return pd.DataFrame(columns=["month", "mrr", "expansion_mrr", "contraction_mrr", "churn_mrr", "new_mrr"])
-
-    min_date = subscriptions["subscription_start_date"].min().replace(day=1)
-    max_date = datetime.utcnow().replace(day=1)
-    months = pd.date_range(min_date, max_date, freq="MS")
-
-    records = []
-    for month_start in months:
-        month_end = (month_start + pd.offsets.MonthEnd(0)).to_pydatetime()
-        active_mask = (subscriptions["subscription_start_date"] <= month_end) & (
-            (subscriptions["subscription_end_date"].isna()) | (subscriptions["subscription_end_date"] >= month_start)
-        )
-        active_subs = subscriptions[active_mask]
-        mrr = active_subs["mrr"].sum()
-
-        churned_mask = subscriptions["subscription_end_date"].between(month_start, month_end, inclusive="both")
-        churn_mrr = subscriptions[churned_mask]["mrr"].sum()
-
-        expansion_mrr = mrr * np.random.uniform(0.05, 0.15)
-        contraction_mrr = mrr * np.random.uniform(0.01, 0.08)
-        new_mrr = max(0.0, mrr - (mrr - churn_mrr))
-
-        records.append(
-            {
-                "month": month_start,
-                "mrr": float(mrr),
-                "expansion_mrr": float(expansion_mrr),
-                "contraction_mrr": float(contraction_mrr),
-                "churn_mrr": float(churn_mrr),
-                "new_mrr": float(new_mrr),
-            }
-        )
-
-    return pd.DataFrame(records)
-
-def main():
-    base_dir = os.path.dirname(os.path.dirname(__file__))
-    raw_dir = os.path.join(base_dir, "data", "raw")
-    ensure_dirs(raw_dir)
-
-    n_users = 20000
-    start_date = "2023-01-01"
-    end_date = "2024-06-30"
-
-    print(f"Generating {n_users} users...")
-    users = generate_users(n_users, start_date, end_date)
-    users.to_csv(os.path.join(raw_dir, "users.csv"), index=False)
+        return revenue_bridge(subscriptions)
+    first = subscriptions["subscription_start_date"].min().replace(day=1)
+    return revenue_bridge(subscriptions, first, pd.Timestamp.now("UTC").tz_localize(None))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the synthetic SaaS dataset.")
+    parser.add_argument("--users", type=int, default=20000, help="number of users to generate")
+    parser.add_argument("--events-per-user", type=int, default=35, help="mean events per user (Poisson)")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="csv writes data/raw/, parquet writes data/processed/")
+    parser.add_argument("--seed", type=int, default=RANDOM_SEED)
+    parser.add_argument("--start-date", default="2023-01-01")
+    parser.add_argument("--end-date", default="2024-06-30")
+    parser.add_argument("--chunk-users", type=int, default=CHUNK_USERS, help="users per streamed event chunk")
+    parser.add_argument("--base-dir", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    rng = np.random.default_rng(args.seed)
+    out_dir = os.path.join(args.base_dir, "data", "processed" if args.format == "parquet" else "raw")
+    ensure_dirs(out_dir)
+
+    print(f"Generating {args.users} users...")
+    users = generate_users(args.users, args.start_date, args.end_date, rng)
+    write_table(users, "users", args.base_dir, args.format)
 
     print("Generating subscriptions...")
-    subs = generate_subscriptions(users)
-    subs.to_csv(os.path.join(raw_dir, "subscriptions.csv"), index=False)
+    subs = generate_subscriptions(users, rng)
+    write_table(subs, "subscriptions", args.base_dir, args.format)
 
     print("Generating events...")
-    events = generate_events(users, start_date, end_date, avg_events_per_user=35)
-    events.to_csv(os.path.join(raw_dir, "events.csv"), index=False)
+    chunks = iter_event_chunks(users, args.start_date, args.end_date, rng, args.events_per_user, args.chunk_users)
+    n_events = write_events(chunks, args.base_dir, args.format)
+    print(f"  {n_events} events written")
 
     print("Generating revenue...")
     revenue = generate_revenue(subs)
-    revenue.to_csv(os.path.join(raw_dir, "revenue.csv"), index=False)
+    write_table(revenue, "revenue", args.base_dir, args.format)
 
-    print("Done. Files saved under data/raw/.")
+    print(f"Done. Files saved under {os.path.relpath(out_dir, args.base_dir)}/.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,350 @@
+import argparse
+import glob
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from src.cohorts import retention_matrix_from_counts
+from src.filter_engine import FilterIndex
+from src.instrumentation import span
+from src.intervals import PlanIndex
+from src.loader import load_sources
+from src.revenue_metrics import REVENUE_COLUMNS, revenue_bridge
+from src.rollups import build_rollups, load_rollups, save_rollups, update_rollups, user_dimensions
+from src.schema import compact_tables
+from src.storage import TABLES, has_parquet, has_source_version, parquet_path, processed_dir, read_table, stamp_source_version, write_events_partitioned, write_table
+
+try:
+    import pyarrow.dataset as ds
+except ImportError:  # pragma: no cover - ingestion needs the Parquet layout
+    ds = None
+
+MANIFEST_NAME = "manifest.json"
+CUBE_DIMENSIONS = ["country", "acquisition_channel"]
+FEATURE_CUBE_KEYS = ["date"] + CUBE_DIMENSIONS + ["plan_type", "feature_name"]
+
+def manifest_path(base_dir: str) -> str:
+    return os.path.join(processed_dir(base_dir), MANIFEST_NAME)
+
+def read_manifest(base_dir: str) -> dict:
+    path = manifest_path(base_dir)
+    if not os.path.exists(path):
+        return {"version": 0, "watermark": None, "batches": []}
+    with open(path) as f:
+        return json.load(f)
+
+def manifest_version(base_dir: str) -> int:
+    return read_manifest(base_dir)["version"]
+
+def _write_manifest(base_dir: str, manifest: dict) -> None:
+    # Readers poll the manifest, so replace it atomically.
+    path = manifest_path(base_dir)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+def aggregate_dir(base_dir: str) -> str:
+    return os.path.join(processed_dir(base_dir), "aggregates")
+
+def _month(values) -> np.ndarray:
+    return np.asarray(values, dtype="datetime64[ns]").astype("datetime64[M]").astype("datetime64[ns]")
+
+def build_feature_cube(events: pd.DataFrame, dims: pd.DataFrame, plans: PlanIndex) -> pd.DataFrame:
+    """Feature events per (date, country, channel, plan at event time, feature); counts add up across batches.
+
+    Events outside any subscription keep a null plan, so feature totals
+    still count every event.
+    """
+    feats = events[events["feature_name"].notna()]
+    pos = pd.Index(dims["user_id"]).get_indexer(feats["user_id"])
+    known = pos >= 0
+    cube = pd.DataFrame({"date": feats["event_timestamp"].to_numpy(dtype="datetime64[ns]")[known].astype("datetime64[D]")})
+    for col in CUBE_DIMENSIONS:
+        cube[col] = dims[col].to_numpy()[pos[known]]
+    plan_codes = plans.plan_codes_at(feats["user_id"], feats["event_timestamp"])[known]
+    cube["plan_type"] = np.append(plans.plans.to_numpy(dtype=object), None)[plan_codes]
+    cube["feature_name"] = feats["feature_name"].astype(object).to_numpy()[known]
+    cube["date"] = pd.to_datetime(cube["date"])
+    return cube.groupby(FEATURE_CUBE_KEYS, observed=True, dropna=False).size().reset_index(name="event_count")
+
+def merge_feature_cube(cube: pd.DataFrame, fresh: pd.DataFrame) -> pd.DataFrame:
+    if fresh.empty:
+        return cube
+    touched = cube["date"].isin(fresh["date"].unique())
+    merged = pd.concat([cube[touched], fresh], ignore_index=True)
+    merged = merged.groupby(FEATURE_CUBE_KEYS, observed=True, dropna=False)["event_count"].sum()
+    cube = pd.concat([cube[~touched], merged.reset_index()], ignore_index=True)
+    return cube.sort_values(FEATURE_CUBE_KEYS).reset_index(drop=True)
+
+def build_cohort_cells(monthly: pd.DataFrame, users: pd.DataFrame) -> pd.DataFrame:
+    """Distinct active users per (signup month, activity month, country, channel)."""
+    signup = users.drop_duplicates("user_id").set_index("user_id")["signup_date"]
+    cohort = monthly["user_id"].map(signup)
+    cells = monthly[["month", "user_id"] + CUBE_DIMENSIONS].assign(cohort=_month(cohort))
+    cells = cells[cohort.notna().to_numpy() & (cells["month"] >= cells["cohort"])]
+    keys = ["cohort", "month"] + CUBE_DIMENSIONS
+    return cells.groupby(keys, observed=True).size().reset_index(name="active_users").sort_values(keys).reset_index(drop=True)
+
+def save_aggregates(base_dir: str, feature_cube: pd.DataFrame, cohort_cells: pd.DataFrame) -> None:
+    os.makedirs(aggregate_dir(base_dir), exist_ok=True)
+    feature_cube.to_parquet(os.path.join(aggregate_dir(base_dir), "feature_cube.parquet"), index=False)
+    cohort_cells.to_parquet(os.path.join(aggregate_dir(base_dir), "cohort_cells.parquet"), index=False)
+    stamp_source_version(aggregate_dir(base_dir), base_dir)
+
+def load_aggregates(base_dir: str):
+    path = aggregate_dir(base_dir)
+    if not os.path.exists(os.path.join(path, "feature_cube.parquet")) or not has_source_version(path, base_dir):
+        return None
+    return (
+        pd.read_parquet(os.path.join(path, "feature_cube.parquet")),
+        pd.read_parquet(os.path.join(path, "cohort_cells.parquet")),
+    )
+
+def build_aggregates(base_dir: str) -> dict:
+    users = read_table(base_dir, "users")
+    subs = read_table(base_dir, "subscriptions")
+    events = read_table(base_dir, "events", columns=["user_id", "event_timestamp", "feature_name"])
+    daily, monthly = build_rollups(events, users, subs)
+    save_rollups(daily, monthly, base_dir)
+    cube = build_feature_cube(events, user_dimensions(users, subs), PlanIndex(subs))
+    cells = build_cohort_cells(monthly, users)
+    save_aggregates(base_dir, cube, cells)
+    manifest = read_manifest(base_dir)
+    if manifest["watermark"] is None and not events.empty:
+        manifest["watermark"] = events["event_timestamp"].max().isoformat()
+        _write_manifest(base_dir, manifest)
+    return {"daily": len(daily), "monthly": len(monthly), "feature_cube": len(cube), "cohort_cells": len(cells)}
+
+def feature_counts_from_cube(cube: pd.DataFrame, countries=None, channels=None, date_range=None) -> pd.DataFrame:
+    for col, values in zip(CUBE_DIMENSIONS, [countries, channels]):
+        if values:
+            cube = cube[cube[col].isin(values)]
+    if date_range:
+        start, end = date_range
+        cube = cube[(cube["date"] >= start.normalize()) & (cube["date"] <= end)]
+    counts = cube.groupby("feature_name", observed=True)["event_count"].sum().reset_index()
+    return counts.sort_values("event_count", ascending=False)
+
+def feature_usage_by_plan_from_cube(cube: pd.DataFrame, countries=None, channels=None, plans=None, date_range=None) -> pd.DataFrame:
+    """feature_usage_by_plan over any slice of the cube, without touching events."""
+    cube = cube[cube["plan_type"].notna()]
+    if plans:
+        cube = cube[cube["plan_type"].isin(plans)]
+    for col, values in zip(CUBE_DIMENSIONS, [countries, channels]):
+        if values:
+            cube = cube[cube[col].isin(values)]
+    if date_range:
+        start, end = date_range
+        cube = cube[(cube["date"] >= start.normalize()) & (cube["date"] <= end)]
+    counts = cube.groupby(["plan_type", "feature_name"], observed=True)["event_count"].sum()
+    return counts.reset_index()
+
+def retention_from_cells(cells: pd.DataFrame, users: pd.DataFrame, countries=None, channels=None) -> pd.DataFrame:
+    for col, values in zip(CUBE_DIMENSIONS, [countries, channels]):
+        if values:
+            cells = cells[cells[col].isin(values)]
+            users = users[users[col].isin(values)]
+    cohort = _month(cells["cohort"]).astype("datetime64[M]").astype(np.int64)
+    offset = _month(cells["month"]).astype("datetime64[M]").astype(np.int64) - cohort
+    counts = pd.DataFrame({"cohort": cohort, "offset": offset, "active_users": cells["active_users"].to_numpy()})
+    counts = counts.groupby(["cohort", "offset"])["active_users"].sum().reset_index()
+    signup = users.drop_duplicates("user_id")["signup_date"].dropna()
+    sizes = pd.Series(_month(signup).astype("datetime64[M]").astype(np.int64)).value_counts()
+    sizes = sizes.rename_axis("cohort").reset_index(name="cohort_size")
+    return retention_matrix_from_counts(counts, sizes, "M")
+
+def _validate(batch: pd.DataFrame, name: str, required) -> pd.DataFrame:
+    missing = [c for c in required if c not in batch.columns]
+    if missing:
+        raise ValueError(f"{name} batch is missing columns: {missing}")
+    batch = batch.copy()
+    for col in TABLES[name]["parse_dates"]:
+        batch[col] = pd.to_datetime(batch[col])
+    return batch
+
+def append_batch(base_dir: str, events: pd.DataFrame = None, subscriptions: pd.DataFrame = None) -> dict:
+    """Append an event and/or subscription batch and update derived data in place.
+
+    Events land as new files in their month partitions; rollups, the feature
+    cube and cohort cells are recomputed only for the days and months the
+    batch touches, and revenue only from the first month new subscriptions
+    affect. The manifest records the batch, a new version and the watermark.
+    """
+    if not has_parquet(base_dir, "events"):
+        raise FileNotFoundError("Append needs the Parquet dataset; run python -m src.storage first")
+    events = events if events is not None else pd.DataFrame()
+    subscriptions = subscriptions if subscriptions is not None else pd.DataFrame()
+    # Derived data is loaded before the batch touches the tables it was stamped with.
+    rollups, aggregates = load_rollups(base_dir), load_aggregates(base_dir)
+    # Cubes written before plans were tracked per event are rebuilt once.
+    if aggregates is None or "plan_type" not in aggregates[0].columns or rollups is None:
+        build_aggregates(base_dir)
+        rollups, aggregates = load_rollups(base_dir), load_aggregates(base_dir)
+
+    manifest = read_manifest(base_dir)
+    version = manifest["version"] + 1
+    tag = f"batch{version:06d}"
+    entry = {
+        "version": version,
+        "ingested_at": datetime.now(timezone.utc).isoformat(),
+        "event_rows": len(events),
+        "subscription_rows": len(subscriptions),
+        "event_files": [],
+    }
+    users = read_table(base_dir, "users")
+    subs = read_table(base_dir, "subscriptions")
+
+    if not subscriptions.empty:
+        subscriptions = _validate(subscriptions, "subscriptions", list(subs.columns))[list(subs.columns)]
+        subs = pd.concat([subs, subscriptions], ignore_index=True)
+        write_table(subs, base_dir, "subscriptions")
+    dims = user_dimensions(users, subs)
+    plans = PlanIndex(subs)
+
+    daily, monthly = rollups
+    cube, cells = aggregates
+    touched_months = pd.DatetimeIndex([])
+    if not events.empty:
+        schema = ds.dataset(parquet_path(base_dir, "events"), format="parquet", partitioning="hive").schema
+        events = _validate(events, "events", [c for c in schema.names if c != "event_month"])
+        write_events_partitioned(events, parquet_path(base_dir, "events"), tag=tag)
+        root = parquet_path(base_dir, "events")
+        entry["event_files"] = sorted(os.path.relpath(p, root) for p in glob.glob(os.path.join(root, "*", f"{tag}-*.parquet")))
+        ts = events["event_timestamp"]
+        watermark = pd.Timestamp(manifest["watermark"]) if manifest["watermark"] else None
+        entry["event_range"] = [ts.min().isoformat(), ts.max().isoformat()]
+        entry["late_rows"] = int((ts <= watermark).sum()) if watermark is not None else 0
+        manifest["watermark"] = max(ts.max(), watermark).isoformat() if watermark is not None else ts.max().isoformat()
+
+        daily, monthly = update_rollups(daily, monthly, events, dims)
+        cube = merge_feature_cube(cube, build_feature_cube(events, dims, plans))
+        touched_months = pd.DatetimeIndex(np.unique(_month(ts.dropna())))
+
+    if not subscriptions.empty:
+        # A new subscription can change a user's current plan on every rollup row.
+        changed = subscriptions["user_id"].unique()
+        plan = dims.set_index("user_id")["plan_type"]
+        for frame in (daily, monthly):
+            rows = frame["user_id"].isin(changed).to_numpy()
+            frame.loc[rows, "plan_type"] = frame.loc[rows, "user_id"].map(plan).to_numpy()
+
+        # They can also change the plan active at events already in the cube,
+        # so recount the feature cube from the earliest new start onwards.
+        # Rows without a start date bill nothing, so they touch no cube day or revenue month.
+        starts = subscriptions["subscription_start_date"].dropna()
+        if not starts.empty:
+            since = starts.min().normalize()
+            recount = read_table(base_dir, "events", ["user_id", "event_timestamp", "feature_name"], start=since)
+            recount = recount[recount["event_timestamp"] >= since]
+            cube = pd.concat([cube[cube["date"] < since], build_feature_cube(recount, dims, plans)], ignore_index=True)
+            cube = cube.sort_values(FEATURE_CUBE_KEYS).reset_index(drop=True)
+
+            revenue = read_table(base_dir, "revenue")
+            first = starts.min().to_period("M").to_timestamp()
+            last = max(revenue["month"].max(), starts.max().to_period("M").to_timestamp()) if not revenue.empty else starts.max()
+            fresh = revenue_bridge(subs, first, last)
+            revenue = pd.concat([revenue[revenue["month"] < first], fresh], ignore_index=True)[REVENUE_COLUMNS]
+            write_table(revenue, base_dir, "revenue")
+            entry["revenue_months"] = [first.strftime("%Y-%m"), pd.Timestamp(last).strftime("%Y-%m")]
+
+    if len(touched_months):
+        month_rows = monthly[monthly["month"].isin(touched_months)]
+        cells = pd.concat([cells[~cells["month"].isin(touched_months)], build_cohort_cells(month_rows, users)], ignore_index=True)
+        cells = cells.sort_values(["cohort", "month"] + CUBE_DIMENSIONS).reset_index(drop=True)
+        entry["months"] = [m.strftime("%Y-%m") for m in touched_months]
+
+    save_rollups(daily, monthly, base_dir)
+    save_aggregates(base_dir, cube, cells)
+    manifest["version"] = version
+    manifest["batches"].append(entry)
+    _write_manifest(base_dir, manifest)
+    return entry
+
+def read_batch_events(base_dir: str, files, columns=None) -> pd.DataFrame:
+    root = parquet_path(base_dir, "events")
+    paths = [os.path.join(root, f) for f in files]
+    return ds.dataset(paths, format="parquet").to_table(columns=list(columns) if columns else None).to_pandas()
+
+def _append_rows(frame: pd.DataFrame, batch: pd.DataFrame) -> pd.DataFrame:
+    batch = batch[list(frame.columns)].copy()
+    for col in frame.columns:
+        dtype = frame[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            values = batch[col].astype(object)
+            new = pd.Index(values.dropna().unique()).difference(dtype.categories)
+            if len(new):
+                frame = frame.assign(**{col: frame[col].cat.add_categories(new)})
+            batch[col] = values.astype(frame[col].dtype)
+        else:
+            batch[col] = batch[col].astype(dtype)
+    return pd.concat([frame, batch], ignore_index=True)
+
+def load_tables(base_dir: str, event_columns=None, version: int = None):
+    with span("load_sources") as s:
+        tables, stats = load_sources(base_dir, event_columns, version)
+        for row in stats.itertuples():
+            s.set(row.table, f"{row.rows} rows in {row.seconds * 1000:.0f} ms")
+    users, subs, events = compact_tables(tables["users"], tables["subscriptions"], tables["events"])
+    return users, subs, events, tables["revenue"]
+
+class LiveDataset:
+    """Loaded tables and their FilterIndex, kept at the manifest's version.
+
+    refresh() reads only the event files of batches newer than the loaded
+    version, re-reads the small subscription and revenue tables and
+    rebuilds the index in memory, so new data shows up without a cold load.
+    loader(base_dir, event_columns, version) does the initial load.
+    """
+
+    def __init__(self, base_dir: str, event_columns=None, loader=load_tables):
+        self.base_dir = base_dir
+        self.event_columns = list(event_columns) if event_columns else None
+        self._lock = threading.Lock()
+        self.version = manifest_version(base_dir)
+        self.index = FilterIndex(*loader(base_dir, event_columns, self.version))
+
+    def refresh(self) -> bool:
+        if manifest_version(self.base_dir) <= self.version:
+            return False
+        with self._lock:
+            manifest = read_manifest(self.base_dir)
+            if manifest["version"] <= self.version:
+                return False
+            files = [f for b in manifest["batches"] if b["version"] > self.version for f in b["event_files"]]
+            index = self.index
+            events = index.events
+            if files:
+                events = _append_rows(events, read_batch_events(self.base_dir, files, self.event_columns or events.columns))
+            users, subs, events = compact_tables(index.users, read_table(self.base_dir, "subscriptions"), events)
+            self.index = FilterIndex(users, subs, events, read_table(self.base_dir, "revenue"))
+            self.version = manifest["version"]
+            return True
+
+def _read_batch(path: str, name: str) -> pd.DataFrame:
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, parse_dates=TABLES[name]["parse_dates"])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Append event/subscription batches to the processed dataset.")
+    parser.add_argument("--base-dir", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser.add_argument("--events", help="CSV or Parquet file of new events")
+    parser.add_argument("--subscriptions", help="CSV or Parquet file of new subscriptions")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild every aggregate from the stored data")
+    args = parser.parse_args(argv)
+    if args.rebuild:
+        print(build_aggregates(args.base_dir))
+    if args.events or args.subscriptions:
+        events = _read_batch(args.events, "events") if args.events else None
+        subs = _read_batch(args.subscriptions, "subscriptions") if args.subscriptions else None
+        entry = append_batch(args.base_dir, events, subs)
+        print(f"Appended batch v{entry['version']}: {entry['event_rows']} events, {entry['subscription_rows']} subscriptions")
+        print(f"Watermark: {read_manifest(args.base_dir)['watermark']}")
+
+if __name__ == "__main__":
+    main()
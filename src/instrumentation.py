@@ -0,0 +1,293 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+SERVICE_NAME = "saas-analytics-dashboard"
+# Where exported spans go, when not .traces/spans.jsonl under the base dir.
+# Kept out of data/ so exporting never changes the metric cache's data version.
+TRACE_PATH_ENV = "SAAS_TRACE_PATH"
+
+# The active trace of the current script run. Streamlit runs each session's
+# script in its own thread, so sessions never see each other's spans, and
+# with no active trace every span() and traced() call is a single lookup.
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_memory_lock = threading.Lock()
+_memory_users = 0
+
+def count_rows(value):
+    """Rows in a frame, series or array, summed over tuples and lists; points in a Plotly figure."""
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index, np.ndarray)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        counts = [c for c in (count_rows(v) for v in value) if c is not None]
+        return sum(counts) if counts else None
+    if hasattr(value, "to_plotly_json") and hasattr(value, "data"):
+        points = 0
+        for trace in value.data:
+            for prop in ("z", "x", "y"):
+                if prop in trace and trace[prop] is not None:
+                    points += int(np.size(trace[prop]))
+                    break
+        return points
+    return None
+
+def input_rows(args, kwargs=None):
+    # Lists are filter selections, not data, so only frames and arrays count.
+    frames = [v for v in (*args, *(kwargs or {}).values()) if isinstance(v, (pd.DataFrame, pd.Series, np.ndarray))]
+    return sum(len(v) for v in frames) if frames else None
+
+class Span:
+    """One timed block: wall time, rows in and out, peak traced memory and free-form attributes."""
+
+    def __init__(self, trace: "Trace", name: str, parent: "Span" = None, rows_in=None, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.attributes = dict(attributes or {})
+        self.peak_bytes = None
+        self.status = "ok"
+        self.start_ns = self.end_ns = None
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration_s(self) -> float:
+        return (self._stop - self._start) / 1e9 if self.end_ns is not None else None
+
+    def __enter__(self):
+        self.trace._open(self)
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop = time.perf_counter_ns()
+        self.end_ns = self.start_ns + (self._stop - self._start)
+        if exc_type is not None:
+            self.status = "error"
+            self.attributes["exception.type"] = exc_type.__name__
+        self.trace._close(self)
+        return False
+
+class _NullSpan:
+    """Stands in for a span when tracing is off; every operation is a no-op."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, key: str, value) -> None:
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+class Trace:
+    """Spans recorded during one script run, nested by the order they open and close.
+
+    With track_memory, each span's peak is the highest traced allocation
+    above its starting level, including the peaks of the spans it contains.
+    tracemalloc is process-wide, so concurrent traced runs share one tracer.
+    """
+
+    def __init__(self, name: str, track_memory: bool = False):
+        self.trace_id = uuid.uuid4().hex
+        self.track_memory = track_memory
+        self.spans = []
+        self._stack = []
+        self._memory = {}
+        self.root = Span(self, name)
+
+    def _open(self, span: Span) -> None:
+        if self.track_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                parent = self._stack[-1]
+                self._memory[parent.span_id][1] = max(self._memory[parent.span_id][1], peak)
+            tracemalloc.reset_peak()
+            self._memory[span.span_id] = [current, current]
+        self._stack.append(span)
+
+    def _close(self, span: Span) -> None:
+        if self._stack and self._stack[-1] is span:
+            self._stack.pop()
+        if self.track_memory:
+            start, seen = self._memory.pop(span.span_id)
+            peak = max(seen, tracemalloc.get_traced_memory()[1])
+            span.peak_bytes = peak - start
+            if self._stack:
+                parent = self._stack[-1]
+                self._memory[parent.span_id][1] = max(self._memory[parent.span_id][1], peak)
+        self.spans.append(span)
+
+    def span(self, name: str, rows_in=None, **attributes) -> Span:
+        parent = self._stack[-1] if self._stack else None
+        return Span(self, name, parent, rows_in, attributes)
+
+    @property
+    def duration_s(self) -> float:
+        return self.root.duration_s
+
+def _start_memory() -> None:
+    global _memory_users
+    with _memory_lock:
+        if _memory_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _memory_users += 1
+
+def _stop_memory() -> None:
+    global _memory_users
+    with _memory_lock:
+        _memory_users -= 1
+        if _memory_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+def begin_trace(name: str = "rerun", enabled: bool = True, track_memory: bool = False):
+    """Start recording spans for this thread's run; returns None (and records nothing) when disabled."""
+    previous = _current_trace.get()
+    if previous is not None:
+        # A run that stopped early (st.stop, an exception) never ended its trace.
+        end_trace()
+    if not enabled:
+        return None
+    if track_memory:
+        _start_memory()
+    trace = Trace(name, track_memory)
+    _current_trace.set(trace)
+    trace.root.__enter__()
+    return trace
+
+def end_trace():
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    _current_trace.set(None)
+    while trace._stack:
+        trace._stack[-1].__exit__(None, None, None)
+    if trace.track_memory:
+        _stop_memory()
+    return trace
+
+@contextmanager
+def tracing(name: str = "run", enabled: bool = True, track_memory: bool = False):
+    trace = begin_trace(name, enabled, track_memory)
+    try:
+        yield trace
+    finally:
+        if trace is not None:
+            end_trace()
+
+def current_trace():
+    return _current_trace.get()
+
+def span(name: str, rows_in=None, **attributes):
+    trace = _current_trace.get()
+    if trace is None:
+        return NULL_SPAN
+    return trace.span(name, rows_in, **attributes)
+
+def traced(name: str = None):
+    """Record a span per call: rows in from the frame arguments, rows out from the result."""
+
+    def decorate(fn):
+        span_name = name or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = _current_trace.get()
+            if trace is None:
+                return fn(*args, **kwargs)
+            with trace.span(span_name, input_rows(args, kwargs)) as s:
+                result = fn(*args, **kwargs)
+                s.rows_out = count_rows(result)
+            return result
+
+        return wrapper
+
+    return decorate
+
+def spans_frame(trace: Trace) -> pd.DataFrame:
+    """Spans in start order, names indented by depth, for the performance panel."""
+    spans = sorted(trace.spans, key=lambda s: (s.start_ns, -s.end_ns))
+    total = trace.duration_s or 0.0
+    rows = []
+    for s in spans:
+        rows.append(
+            {
+                "span": "  " * s.depth + s.name,
+                "ms": s.duration_s * 1000,
+                "share": s.duration_s / total if total else 0.0,
+                "rows_in": s.rows_in,
+                "rows_out": s.rows_out,
+                "peak_mib": s.peak_bytes / 2**20 if s.peak_bytes is not None else None,
+                "detail": ", ".join(f"{k}={v}" for k, v in s.attributes.items()),
+            }
+        )
+    return pd.DataFrame(rows, columns=["span", "ms", "share", "rows_in", "rows_out", "peak_mib", "detail"])
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, (bool, np.bool_)):
+        return {"key": key, "value": {"boolValue": bool(value)}}
+    if isinstance(value, (int, np.integer)):
+        # OTLP/JSON encodes 64-bit integers as strings.
+        return {"key": key, "value": {"intValue": str(int(value))}}
+    if isinstance(value, (float, np.floating)):
+        return {"key": key, "value": {"doubleValue": float(value)}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+def to_otlp(trace: Trace, service_name: str = SERVICE_NAME) -> dict:
+    """The trace as an OTLP/JSON ExportTraceServiceRequest."""
+    spans = []
+    for s in trace.spans:
+        attributes = dict(s.attributes)
+        for key, value in (("rows.in", s.rows_in), ("rows.out", s.rows_out), ("memory.peak_bytes", s.peak_bytes)):
+            if value is not None:
+                attributes[key] = value
+        spans.append(
+            {
+                "traceId": trace.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [_attribute(k, v) for k, v in attributes.items()],
+                "status": {"code": 2 if s.status == "error" else 1},
+            }
+        )
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [_attribute("service.name", service_name)]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }
+        ]
+    }
+
+def trace_path(base_dir: str) -> str:
+    return os.environ.get(TRACE_PATH_ENV) or os.path.join(base_dir, ".traces", "spans.jsonl")
+
+def export_trace(trace: Trace, path: str, service_name: str = SERVICE_NAME) -> None:
+    """Append the trace to a JSON-lines file, one OTLP request per line like the collector's file exporter."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(to_otlp(trace, service_name)) + "\n")
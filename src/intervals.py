@@ -0,0 +1,227 @@
+import numpy as np
+import pandas as pd
+
+GRAINS = {"D": "D", "W": "W", "M": "M"}
+
+def period_bounds(grain: str, start, end) -> pd.DatetimeIndex:
+    if grain not in GRAINS:
+        raise ValueError(f"Unsupported grain: {grain!r}")
+    periods = pd.period_range(pd.Timestamp(start), pd.Timestamp(end), freq=GRAINS[grain])
+    return periods.start_time.append(pd.DatetimeIndex([(periods[-1] + 1).start_time]))
+
+def _ns(values: pd.Series) -> np.ndarray:
+    return values.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+
+class SubscriptionIntervals:
+    """Sorted index over (subscription_start_date, subscription_end_date).
+
+    Period queries map every interval to the first and last period it
+    overlaps with two binary searches, then answer all periods at once with
+    difference arrays instead of one boolean mask per period.
+    """
+
+    def __init__(self, subscriptions: pd.DataFrame):
+        subs = subscriptions[subscriptions["subscription_start_date"].notna()]
+        self.user_codes, self.user_ids = pd.factorize(subs["user_id"])
+        self.plan_codes, self.plans = pd.factorize(subs["plan_type"], sort=True)
+        self.start = _ns(subs["subscription_start_date"])
+        end = subs["subscription_end_date"]
+        self.open = end.isna().to_numpy()
+        self.end = np.where(self.open, np.iinfo(np.int64).max, _ns(end))
+        self.mrr = subs["mrr"].to_numpy(dtype=float)
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def default_range(self):
+        # The date columns hold naive UTC, so "now" is too, whatever the host's timezone.
+        now = pd.Timestamp.now("UTC").tz_localize(None)
+        if len(self) == 0:
+            return now, now
+        return pd.Timestamp(self.start.min()), now
+
+    def _spans(self, bounds: pd.DatetimeIndex):
+        # Period i is [bounds[i], bounds[i + 1]); an interval is active in i
+        # when it starts before the period ends and ends on or after it starts.
+        b = bounds.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        first = np.searchsorted(b, self.start, side="right") - 1
+        last = np.searchsorted(b, self.end, side="right") - 1
+        return first, last
+
+    def _bounds(self, grain, start, end):
+        default_start, default_end = self.default_range()
+        return period_bounds(grain, default_start if start is None else start, default_end if end is None else end)
+
+    def _active_spans(self, bounds):
+        n_periods = len(bounds) - 1
+        first, last = self._spans(bounds)
+        first = np.maximum(first, 0)
+        last = np.minimum(last, n_periods - 1)
+        valid = first <= last
+        return first, last, valid
+
+    @staticmethod
+    def _distinct(keys, first, last, n_periods, n_groups=1, groups=None):
+        # Coalesce overlapping period ranges per key so each key counts once.
+        if len(keys) == 0:
+            return np.zeros((n_groups, n_periods), dtype=np.int64)
+        order = np.lexsort((first, keys))
+        keys, first, last = keys[order], first[order], last[order]
+        groups = np.zeros(len(keys), dtype=np.int64) if groups is None else groups[order]
+        stride = n_periods + 2
+        reach = np.maximum.accumulate(keys.astype(np.int64) * stride + last) - keys.astype(np.int64) * stride
+        new_key = np.r_[True, keys[1:] != keys[:-1]]
+        new_seg = new_key | np.r_[True, first[1:] > reach[:-1] + 1]
+        seg_starts = np.flatnonzero(new_seg)
+        seg_first = first[seg_starts]
+        seg_last = np.maximum.reduceat(last, seg_starts)
+        seg_group = groups[seg_starts]
+        size = n_groups * (n_periods + 1)
+        diff = np.bincount(seg_group * (n_periods + 1) + seg_first, minlength=size)
+        diff -= np.bincount(seg_group * (n_periods + 1) + seg_last + 1, minlength=size)
+        return np.cumsum(diff.reshape(n_groups, n_periods + 1), axis=1)[:, :n_periods]
+
+    def active(self, grain: str = "M", start=None, end=None) -> pd.DataFrame:
+        bounds = self._bounds(grain, start, end)
+        n_periods = len(bounds) - 1
+        first, last, valid = self._active_spans(bounds)
+        users = self._distinct(self.user_codes[valid], first[valid], last[valid], n_periods)[0]
+        subs = np.cumsum(
+            np.bincount(first[valid], minlength=n_periods + 1) - np.bincount(last[valid] + 1, minlength=n_periods + 1)
+        )[:n_periods]
+        mrr_diff = np.bincount(first[valid], weights=self.mrr[valid], minlength=n_periods + 1)
+        mrr_diff -= np.bincount(last[valid] + 1, weights=self.mrr[valid], minlength=n_periods + 1)
+        return pd.DataFrame(
+            {
+                "period": bounds[:-1],
+                "active_users": users,
+                "active_subscriptions": subs,
+                "mrr": np.round(np.cumsum(mrr_diff)[:n_periods], 6),
+            }
+        )
+
+    def active_by_plan(self, grain: str = "M", start=None, end=None) -> pd.DataFrame:
+        bounds = self._bounds(grain, start, end)
+        n_periods = len(bounds) - 1
+        first, last, valid = self._active_spans(bounds)
+        n_plans = len(self.plans)
+        keys = self.user_codes[valid].astype(np.int64) * max(n_plans, 1) + self.plan_codes[valid]
+        counts = self._distinct(keys, first[valid], last[valid], n_periods, n_plans, self.plan_codes[valid])
+        out = pd.DataFrame(counts.T, columns=pd.Index(self.plans, name="plan_type"))
+        out.insert(0, "period", bounds[:-1])
+        return out.melt(id_vars="period", var_name="plan_type", value_name="active_users")
+
+    def ended(self, grain: str = "M", start=None, end=None) -> pd.DataFrame:
+        bounds = self._bounds(grain, start, end)
+        n_periods = len(bounds) - 1
+        _, last = self._spans(bounds)
+        inside = ~self.open & (last >= 0) & (last < n_periods)
+        return pd.DataFrame(
+            {
+                "period": bounds[:-1],
+                "ended_subscriptions": np.bincount(last[inside], minlength=n_periods),
+                "ended_mrr": np.bincount(last[inside], weights=self.mrr[inside], minlength=n_periods),
+            }
+        )
+
+    def mrr_bridge(self, grain: str = "M", start=None, end=None) -> pd.DataFrame:
+        bounds = self._bounds(grain, start, end)
+        n_periods = len(bounds) - 1
+        # Prepend the previous period so the first bridge row has a real baseline.
+        prev_start = (pd.Period(bounds[0], freq=GRAINS[grain]) - 1).start_time
+        first, last = self._spans(pd.DatetimeIndex([prev_start]).append(bounds))
+        keep = (last >= 0) & (self.mrr != 0)
+        first = np.maximum(first[keep], 0)
+        last = last[keep]
+        users = self.user_codes[keep].astype(np.int64)
+        mrr = self.mrr[keep]
+
+        closes = last + 1 <= n_periods
+        idx = np.r_[first, last[closes] + 1]
+        delta = np.r_[mrr, -mrr[closes]]
+        owner = np.r_[users, users[closes]]
+        stride = n_periods + 2
+        cells, inverse = np.unique(owner * stride + idx, return_inverse=True)
+        change = np.bincount(inverse.ravel(), weights=delta)
+        cell_user, cell_idx = cells // stride, cells % stride
+
+        # Running MRR per user: cumulative sum restarted at each user boundary.
+        total = np.cumsum(change)
+        user_start = np.r_[True, cell_user[1:] != cell_user[:-1]]
+        offset = np.maximum.accumulate(np.where(user_start, np.arange(len(total)), 0))
+        base = np.r_[0.0, total][offset]
+        cur = np.round(total - base, 6)
+        prev = np.round(cur - change, 6)
+
+        new = np.where((prev <= 0) & (cur > 0), cur, 0.0)
+        churn = np.where((prev > 0) & (cur <= 0), prev, 0.0)
+        expansion = np.where((prev > 0) & (cur > prev), cur - prev, 0.0)
+        contraction = np.where((prev > 0) & (cur > 0) & (cur < prev), prev - cur, 0.0)
+
+        in_range = (cell_idx >= 1) & (cell_idx <= n_periods)
+        period_idx = cell_idx[in_range] - 1
+        bridge = pd.DataFrame({"period": bounds[:-1]})
+        for name, values in [("new_mrr", new), ("expansion_mrr", expansion), ("contraction_mrr", contraction), ("churn_mrr", churn)]:
+            bridge[name] = np.bincount(period_idx, weights=values[in_range], minlength=n_periods)
+        bridge.insert(1, "mrr", self.active(grain, bounds[0], bounds[-2])["mrr"].to_numpy())
+        return bridge
+
+def _positions(index: pd.Index, values) -> np.ndarray:
+    # Categorical ids resolve once per category instead of once per row.
+    if isinstance(getattr(values, "dtype", None), pd.CategoricalDtype):
+        values = pd.Categorical(values)
+        pos = np.append(index.get_indexer(values.categories), -1)
+        return pos[values.codes]
+    return index.get_indexer(values)
+
+class PlanIndex:
+    """Point-in-time plan lookup: the plan each user was on at a given moment.
+
+    Subscriptions are sorted by (user, start) once, with per-user offsets as
+    in FilterIndex. A lookup binary-searches every row's own user segment
+    at once for the subscription that started most recently at or before
+    the timestamp, like a merge_asof by user, and keeps it only while that
+    subscription has not ended.
+    """
+
+    def __init__(self, subscriptions: pd.DataFrame):
+        subs = subscriptions[subscriptions["subscription_start_date"].notna()]
+        user_codes, self.user_ids = pd.factorize(subs["user_id"].astype(object))
+        self.user_ids = pd.Index(self.user_ids)
+        plan_codes, self.plans = pd.factorize(subs["plan_type"].astype(object), sort=True)
+        self.plans = pd.Index(self.plans, name="plan_type")
+        start = _ns(subs["subscription_start_date"])
+        end = subs["subscription_end_date"]
+        end = np.where(end.isna().to_numpy(), np.iinfo(np.int64).max, _ns(end))
+        order = np.lexsort((start, user_codes))
+        self.start, self.end, self.plan_codes = start[order], end[order], plan_codes[order]
+        counts = np.bincount(user_codes, minlength=len(self.user_ids))
+        self.user_offsets = np.r_[0, np.cumsum(counts)]
+        self.depth = int(np.ceil(np.log2(counts.max() + 1))) if len(counts) else 0
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def plan_codes_at(self, user_ids, timestamps) -> np.ndarray:
+        """Position in self.plans of each row's plan at its timestamp, or -1 without an active subscription."""
+        pos = _positions(self.user_ids, user_ids)
+        t = np.asarray(timestamps, dtype="datetime64[ns]").astype(np.int64)
+        if len(self) == 0:
+            return np.full(len(t), -1, dtype=np.int64)
+        known = pos >= 0
+        first = np.where(known, self.user_offsets[np.maximum(pos, 0)], 0)
+        lo, hi = first, np.where(known, self.user_offsets[np.maximum(pos, 0) + 1], 0)
+        # bisect_right within each row's user: lo ends one past the last start <= t.
+        # NaT is the smallest int64, so it never finds a subscription.
+        for _ in range(self.depth):
+            mid = (lo + hi) // 2
+            searching = lo < hi
+            right = searching & (self.start[np.minimum(mid, len(self) - 1)] <= t)
+            lo = np.where(right, mid + 1, lo)
+            hi = np.where(searching & ~right, mid, hi)
+        sub = np.maximum(lo - 1, 0)
+        found = (lo > first) & (self.end[sub] >= t)
+        return np.where(found, self.plan_codes[sub], -1)
+
+    def plans_at(self, user_ids, timestamps) -> pd.Categorical:
+        return pd.Categorical.from_codes(self.plan_codes_at(user_ids, timestamps), categories=self.plans)
@@ -0,0 +1,129 @@
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from src.ingest import manifest_path
+from src.storage import stat_version, table_paths
+from src.visualizations import data_hash
+
+DEFAULT_MAX_ENTRIES = 256
+
+def _normalize(values):
+    if not values:
+        return ()
+    return tuple(sorted(str(v) for v in values))
+
+def filter_fingerprint(countries=None, plans=None, channels=None, date_range=None) -> tuple:
+    dates = ()
+    if date_range:
+        dates = tuple(pd.Timestamp(d).isoformat() for d in date_range)
+    return (_normalize(countries), _normalize(plans), _normalize(channels), dates)
+
+def data_version(base_dir: str) -> str:
+    """Hash of the size and mtime of every table file storage reads, plus the ingest manifest."""
+    return stat_version([manifest_path(base_dir)] + table_paths(base_dir))
+
+class MetricCache:
+    """Size-bounded LRU cache for metric results.
+
+    Entries are keyed on the metric name, a normalized filter fingerprint,
+    the metric arguments and the data version; changing the data version
+    drops every entry. Positional arguments are keyed on a content hash of
+    each one, unless the caller passes args_key to stand in for them.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, data_version: str = None):
+        self.max_entries = max_entries
+        self.data_version = data_version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def set_data_version(self, version: str) -> None:
+        with self._lock:
+            if version != self.data_version:
+                self._entries.clear()
+                self.data_version = version
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _key(self, name: str, fingerprint: tuple, args: tuple, kwargs: dict, args_key=None) -> tuple:
+        if args_key is None:
+            args_key = tuple(data_hash(a) for a in args)
+        return (name, fingerprint, args_key, tuple(sorted(kwargs.items())), self.data_version)
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def _store(self, key, result) -> None:
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, name: str, fingerprint: tuple, fn, *args, args_key=None, **kwargs):
+        key = self._key(name, fingerprint, args, kwargs, args_key)
+        found, result = self._lookup(key)
+        if found:
+            return result
+        result = fn(*args, **kwargs)
+        self._store(key, result)
+        return result
+
+    def get_or_compute_many(self, fingerprint: tuple, calls: dict, runner=None, args_key=None) -> dict:
+        """Resolve {name: (fn, args, kwargs)} calls, computing the misses together.
+
+        runner receives the missing calls in the same shape and returns
+        {name: result}, e.g. MetricExecutor.run_all to compute them in parallel.
+        """
+        results, missing, keys = {}, {}, {}
+        for name, (fn, args, kwargs) in calls.items():
+            keys[name] = self._key(name, fingerprint, args, kwargs, args_key)
+            found, result = self._lookup(keys[name])
+            if found:
+                results[name] = result
+            else:
+                missing[name] = (fn, args, kwargs)
+        if missing:
+            if runner is None:
+                computed = {name: fn(*args, **kwargs) for name, (fn, args, kwargs) in missing.items()}
+            else:
+                computed = runner(missing)
+            for name, result in computed.items():
+                self._store(keys[name], result)
+                results[name] = result
+        return {name: results[name] for name in calls}
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+            "data_version": self.data_version,
+        }
+
+default_cache = MetricCache()
+
+def cached_metric(name: str, fingerprint: tuple, fn, *args, cache: MetricCache = None, args_key=None, **kwargs):
+    return (cache or default_cache).get_or_compute(name, fingerprint, fn, *args, args_key=args_key, **kwargs)
@@ -0,0 +1,204 @@
+import multiprocessing as mp
+import os
+import tempfile
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src.cohorts import cohort_activity_counts, cohort_sizes, period_ordinals, retention_matrix_from_counts
+from src.feature_usage import feature_usage_counts
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - CSV-only installs run metrics serially
+    pa = None
+
+SHM_DIR = "/dev/shm"
+WORKER_OPEN_TABLES = 8
+
+@dataclass(frozen=True)
+class FrameHandle:
+    """Picklable reference to a frame written as an Arrow IPC file, plus a row range."""
+
+    path: str
+    start: int = 0
+    stop: int = None
+
+    def rows(self, start: int, stop: int) -> "FrameHandle":
+        return FrameHandle(self.path, self.start + start, self.start + stop)
+
+# Per-worker memory maps, so repeated tasks over one frame do not reopen it.
+_open_tables = OrderedDict()
+
+def _read_shared(handle: FrameHandle) -> pd.DataFrame:
+    table = _open_tables.get(handle.path)
+    if table is None:
+        table = pa.ipc.open_file(pa.memory_map(handle.path)).read_all()
+        _open_tables[handle.path] = table
+        while len(_open_tables) > WORKER_OPEN_TABLES:
+            _open_tables.popitem(last=False)
+    _open_tables.move_to_end(handle.path)
+    stop = table.num_rows if handle.stop is None else handle.stop
+    return table.slice(handle.start, stop - handle.start).to_pandas()
+
+def _resolve(value):
+    return _read_shared(value) if isinstance(value, FrameHandle) else value
+
+def _call(fn, args, kwargs):
+    return fn(*[_resolve(a) for a in args], **{k: _resolve(v) for k, v in kwargs.items()})
+
+def _remove_shared(shared: dict) -> None:
+    for _, handle in list(shared.values()):
+        try:
+            os.remove(handle.path)
+        except FileNotFoundError:
+            pass
+    shared.clear()
+
+def _done(fn, args, kwargs) -> Future:
+    future = Future()
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except Exception as exc:
+        future.set_exception(exc)
+    return future
+
+class MetricExecutor:
+    """Process pool for independent metric calls.
+
+    DataFrame arguments are written once to memory-mapped Arrow IPC files
+    and workers receive a small FrameHandle instead of a pickled copy.
+    With one worker, or without pyarrow, calls run inline.
+    """
+
+    def __init__(self, max_workers: int = None, shm_dir: str = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.shm_dir = shm_dir or (SHM_DIR if os.path.isdir(SHM_DIR) else tempfile.gettempdir())
+        self._pool = None
+        self._shared = {}
+        self._lock = threading.Lock()
+        # Frames still alive at interpreter exit would otherwise leave their files behind.
+        weakref.finalize(self, _remove_shared, self._shared)
+
+    @property
+    def parallel(self) -> bool:
+        return self.max_workers > 1 and pa is not None
+
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: forking a process that already runs server threads is unsafe.
+                self._pool = ProcessPoolExecutor(self.max_workers, mp_context=mp.get_context("spawn"))
+            return self._pool
+
+    def share(self, df: pd.DataFrame) -> FrameHandle:
+        key = id(df)
+        with self._lock:
+            entry = self._shared.get(key)
+            if entry is not None and entry[0]() is df:
+                return entry[1]
+        path = os.path.join(self.shm_dir, f"metrics-{os.getpid()}-{uuid.uuid4().hex}.arrow")
+        table = pa.Table.from_pandas(df)
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        handle = FrameHandle(path)
+        # The file lives as long as the frame it mirrors.
+        ref = weakref.ref(df, lambda _, key=key, path=path: self._release(key, path))
+        with self._lock:
+            self._shared[key] = (ref, handle)
+        return handle
+
+    def _release(self, key, path: str) -> None:
+        with self._lock:
+            entry = self._shared.get(key)
+            if entry is not None and entry[1].path == path:
+                del self._shared[key]
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def rows(self, df: pd.DataFrame, start: int, stop: int):
+        """A row range of df, as a handle slice when running in the pool."""
+        if self.parallel:
+            return self.share(df).rows(start, stop)
+        return df.iloc[start:stop]
+
+    def _pack(self, value):
+        return self.share(value) if isinstance(value, pd.DataFrame) else value
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        if not self.parallel:
+            return _done(fn, args, kwargs)
+        packed_args = [self._pack(a) for a in args]
+        packed_kwargs = {k: self._pack(v) for k, v in kwargs.items()}
+        return self._ensure_pool().submit(_call, fn, packed_args, packed_kwargs)
+
+    def run_all(self, calls: dict) -> dict:
+        """Run {name: (fn, args, kwargs)} concurrently and return {name: result}."""
+        futures = {name: self.submit(fn, *args, **kwargs) for name, (fn, args, kwargs) in calls.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+            _remove_shared(self._shared)
+        if pool is not None:
+            pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _time_sorted(events: pd.DataFrame) -> pd.DataFrame:
+    if events["event_timestamp"].is_monotonic_increasing:
+        return events
+    return events.sort_values("event_timestamp", kind="stable")
+
+def period_partitions(timestamps: pd.Series, n_parts: int, freq: str = "M") -> list:
+    """Split time-sorted rows into at most n_parts row ranges on period boundaries."""
+    n_rows = len(timestamps)
+    if n_rows == 0:
+        return []
+    ordinals = period_ordinals(timestamps, freq)
+    boundaries = np.flatnonzero(np.diff(ordinals)) + 1
+    targets = np.linspace(0, n_rows, n_parts + 1)[1:-1]
+    idx = np.searchsorted(boundaries, targets)
+    cuts = np.unique(boundaries[idx[idx < len(boundaries)]])
+    edges = np.r_[0, cuts, n_rows]
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+def parallel_cohort_retention_matrix(
+    executor: MetricExecutor, users: pd.DataFrame, events: pd.DataFrame, freq: str = "M", by=None
+) -> pd.DataFrame:
+    # Partitions hold whole activity periods, so every (cohort, offset) cell
+    # is counted in exactly one partial and the partials simply add up.
+    events = _time_sorted(events[["user_id", "event_timestamp"]])
+    users = users[["user_id", "signup_date"] + ([by] if by else [])]
+    parts = period_partitions(events["event_timestamp"], executor.max_workers, freq)
+    futures = [executor.submit(cohort_activity_counts, users, executor.rows(events, lo, hi), freq, by) for lo, hi in parts]
+    partials = [f.result() for f in futures]
+    partials = [p for p in partials if not p.empty]
+    if not partials:
+        return pd.DataFrame()
+    keys = ([by] if by else []) + ["cohort", "offset"]
+    counts = pd.concat(partials, ignore_index=True).groupby(keys, observed=True)["active_users"].sum().reset_index()
+    return retention_matrix_from_counts(counts, cohort_sizes(users, freq, by), freq, by)
+
+def parallel_feature_usage_counts(executor: MetricExecutor, events: pd.DataFrame) -> pd.DataFrame:
+    events = _time_sorted(events[["user_id", "feature_name", "event_timestamp"]])
+    parts = period_partitions(events["event_timestamp"], executor.max_workers, "M")
+    futures = [executor.submit(feature_usage_counts, executor.rows(events, lo, hi)) for lo, hi in parts]
+    partials = [f.result() for f in futures]
+    if not partials:
+        return feature_usage_counts(events)
+    counts = pd.concat(partials, ignore_index=True).groupby("feature_name", observed=True)["event_count"].sum()
+    return counts.reset_index().sort_values("event_count", ascending=False)
@@ -0,0 +1,318 @@
+import argparse
+import itertools
+import os
+import sys
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+
+from src.cohorts import cohort_retention_matrix
+from src.filter_engine import FilterIndex, day_after
+from src.funnel import funnel_from_flags, user_stage_flags
+from src.ingest import build_feature_cube, feature_usage_by_plan_from_cube, load_aggregates, load_tables
+from src.intervals import PlanIndex
+from src.loader import resolve_base_dir
+from src.parallel import MetricExecutor
+from src.revenue_metrics import arpu, cohort_ltv, ltv_estimate, monthly_mrr
+from src.rollups import build_rollups, dau_from_rollup, load_rollups, mau_from_rollup, user_dimensions
+from src.storage import read_table
+from src.streaming import CHUNK_ROWS, EventAggregates, stream_event_aggregates
+
+# Slice dimensions, in FilterIndex.filter order.
+DIMENSIONS = ("country", "plan_type", "acquisition_channel")
+EVENT_COLUMNS = ["user_id", "event_type", "event_timestamp", "feature_name"]
+FORMATS = ("parquet", "csv")
+
+def funnel_for_users(flags: pd.DataFrame, users: pd.DataFrame) -> pd.DataFrame:
+    # Stage flags are per user, so a slice's funnel is the slice's rows of the shared flags.
+    return funnel_from_flags(flags[flags.index.isin(users["user_id"])], len(users))
+
+def _retention_rows(matrix: pd.DataFrame) -> pd.DataFrame:
+    if matrix.empty:
+        return pd.DataFrame(columns=["cohort", "offset", "retention"])
+    long = matrix.rename_axis(columns="offset").stack().rename("retention").reset_index()
+    long["offset"] = long["offset"].str.split("+").str[1].astype(int)
+    return long.rename(columns={long.columns[0]: "cohort"})
+
+def _scalar_rows(name: str):
+    return lambda value: pd.DataFrame({name: [float(value)]})
+
+@dataclass(frozen=True)
+class ReportMetric:
+    """A metric, the slice dimensions it varies with, and how to call it for one slice."""
+
+    name: str
+    dims: tuple
+    task: callable
+    tidy: callable = None
+
+def _selected(value):
+    return [value] if value is not None else None
+
+def _dau_task(report, sel):
+    daily, _ = report.rollups
+    return dau_from_rollup, (daily, _selected(sel["country"]), _selected(sel["acquisition_channel"]), None, report.date_range), {}
+
+def _mau_task(report, sel):
+    daily, monthly = report.rollups
+    countries, channels = _selected(sel["country"]), _selected(sel["acquisition_channel"])
+    return mau_from_rollup, (monthly, daily, countries, channels, None, report.date_range), {}
+
+def _retention_task(report, sel):
+    users, _, events, _ = report.slice(sel)
+    return cohort_retention_matrix, (users, events), {"freq": report.freq}
+
+def _funnel_task(report, sel):
+    users = report.slice(sel)[0]
+    return funnel_for_users, (report.flags[sel["plan_type"]], users), {}
+
+def _feature_task(report, sel):
+    countries, plans, channels = (_selected(sel[d]) for d in DIMENSIONS)
+    return feature_usage_by_plan_from_cube, (report.feature_cube, countries, channels, plans, report.date_range), {}
+
+def _mrr_task(report, sel):
+    return monthly_mrr, (report.slice(sel)[3],), {}
+
+def _arpu_task(report, sel):
+    _, subs, _, revenue = report.slice(sel)
+    return arpu, (subs, revenue), {}
+
+def _ltv_task(report, sel):
+    return ltv_estimate, (report.slice(sel)[1],), {}
+
+def _cohort_ltv_task(report, sel):
+    users, subs, _, _ = report.slice(sel)
+    return cohort_ltv, (subs, users), {}
+
+# Dimensions follow the dashboard's filters: plan narrows subscriptions only,
+# and revenue is a company-level table that only the date range slices.
+POPULATION = ("country", "acquisition_channel")
+METRICS = {
+    m.name: m
+    for m in [
+        ReportMetric("dau", POPULATION, _dau_task),
+        ReportMetric("mau", POPULATION, _mau_task),
+        ReportMetric("retention", POPULATION, _retention_task, _retention_rows),
+        ReportMetric("funnel", DIMENSIONS, _funnel_task),
+        ReportMetric("feature_usage_by_plan", DIMENSIONS, _feature_task),
+        ReportMetric("mrr", (), _mrr_task),
+        ReportMetric("arpu", DIMENSIONS, _arpu_task),
+        ReportMetric("ltv", DIMENSIONS, _ltv_task, _scalar_rows("ltv")),
+        # Already broken down by plan and channel.
+        ReportMetric("cohort_ltv", ("country",), _cohort_ltv_task),
+    ]
+}
+
+class BatchReport:
+    """Tables, filter index and intermediate aggregates shared by every slice of one run.
+
+    Tables are loaded and indexed once. Filtered frames are memoized per
+    dimension key, so every plan of a country reuses one event slice. Each
+    metric runs once per distinct value of the dimensions it varies with, and
+    the slices run concurrently on a MetricExecutor.
+    """
+
+    def __init__(self, base_dir: str, executor: MetricExecutor, start=None, end=None, freq: str = "M"):
+        self.base_dir = resolve_base_dir(base_dir)
+        self.executor = executor
+        self.freq = freq
+        self.index = FilterIndex(*load_tables(self.base_dir, EVENT_COLUMNS))
+        self.date_range = None
+        if start is not None or end is not None:
+            # An open end falls back to the data's bounds, as the date filter's defaults do.
+            first, last = self.index.date_bounds()
+            self.date_range = (pd.Timestamp(start) if start is not None else first.normalize(), pd.Timestamp(end) if end is not None else last)
+        self.flags = {}
+        self._rollups = None
+        self._feature_cube = None
+        self._populations = {}
+        self._subs = {}
+
+    def values(self, dim: str) -> list:
+        uniques = {"country": self.index.countries, "plan_type": self.index.plans, "acquisition_channel": self.index.channels}
+        return uniques[dim].tolist()
+
+    @property
+    def rollups(self):
+        if self._rollups is None:
+            self._rollups = load_rollups(self.base_dir)
+            if self._rollups is None:
+                self._rollups = build_rollups(self.index.events, self.index.users, self.index.subs)
+        return self._rollups
+
+    @property
+    def feature_cube(self):
+        if self._feature_cube is None:
+            aggregates = load_aggregates(self.base_dir)
+            if aggregates is not None:
+                self._feature_cube = aggregates[0]
+            else:
+                index = self.index
+                self._feature_cube = build_feature_cube(index.events, user_dimensions(index.users, index.subs), PlanIndex(index.subs))
+        return self._feature_cube
+
+    def slice(self, sel: dict):
+        """(users, subs, events, revenue) for a selection of one value (or None) per dimension."""
+        country, plan, channel = (sel.get(d) for d in DIMENSIONS)
+        population = (country, channel)
+        if population not in self._populations:
+            self._populations[population] = self.index.filter(_selected(country), None, _selected(channel), self.date_range)
+        users, subs, events, revenue = self._populations[population]
+        if plan is not None:
+            key = (country, plan, channel)
+            if key not in self._subs:
+                self._subs[key] = subs[subs["plan_type"] == plan]
+            subs = self._subs[key]
+        return users, subs, events, revenue
+
+    def selections(self, dims: tuple, by) -> list:
+        sliced = [d for d in DIMENSIONS if d in by and d in dims]
+        combos = itertools.product(*(self.values(d) for d in sliced))
+        return [dict(zip(sliced, combo)) for combo in combos]
+
+    def prepare_flags(self, plans) -> None:
+        # Funnel stage flags are computed once per plan over all users and
+        # then sliced per country and channel.
+        calls = {}
+        for plan in plans:
+            users, subs, events, _ = self.slice({"plan_type": plan})
+            calls[plan] = (user_stage_flags, (users, events, subs), {})
+        self.flags.update(self.executor.run_all(calls))
+
+    def run(self, metrics, by=()) -> tuple:
+        """Compute each metric for every slice; returns ({metric: frame}, {metric: error})."""
+        metrics = [METRICS[m] for m in metrics]
+        if any(m.name == "funnel" for m in metrics):
+            self.prepare_flags(self.values("plan_type") if "plan_type" in by else [None])
+        futures = {}
+        for metric in metrics:
+            for sel in self.selections(metric.dims, by):
+                fn, args, kwargs = metric.task(self, {d: sel.get(d) for d in DIMENSIONS})
+                futures[metric.name, tuple(sel.items())] = self.executor.submit(fn, *args, **kwargs)
+
+        frames, errors = {}, {}
+        for (name, sel), future in futures.items():
+            if name in errors:
+                continue
+            try:
+                result = future.result()
+            except Exception as exc:
+                errors[name] = f"{type(exc).__name__}: {exc}"
+                continue
+            tidy = METRICS[name].tidy
+            frame = (tidy(result) if tidy else result).reset_index(drop=True)
+            # feature_usage_by_plan already has a plan_type column, equal to the slice's plan.
+            frame = frame.drop(columns=[dim for dim, _ in sel if dim in frame.columns])
+            for pos, (dim, value) in enumerate(sel):
+                frame.insert(pos, dim, value)
+            frames.setdefault(name, []).append(frame)
+        return {name: pd.concat(parts, ignore_index=True) for name, parts in frames.items() if name not in errors}, errors
+
+# Metrics a single pass over the events can answer. The funnel needs each
+# user's ordered events and --by needs per-slice events, so neither streams.
+STREAMING_METRICS = [m for m in METRICS if m != "funnel"]
+
+def _streaming_tasks(aggregates: EventAggregates, users, subs, revenue, freq: str) -> dict:
+    return {
+        "dau": aggregates.daily_active_users,
+        "mau": aggregates.monthly_active_users,
+        "retention": lambda: aggregates.cohort_retention_matrix(users, freq=freq),
+        "feature_usage_by_plan": aggregates.feature_usage_by_plan,
+        "mrr": lambda: monthly_mrr(revenue),
+        "arpu": lambda: arpu(subs, revenue),
+        "ltv": lambda: ltv_estimate(subs),
+        "cohort_ltv": lambda: cohort_ltv(subs, users),
+    }
+
+def streaming_report(base_dir: str, metrics, start=None, end=None, freq: str = "M", chunk_rows: int = CHUNK_ROWS) -> tuple:
+    """Company-wide metrics from one chunked pass over the events; returns ({metric: frame}, {metric: error}).
+
+    Only users, subscriptions and revenue are loaded whole, so memory is
+    bounded by the chunk size and the distinct (user, day) pairs.
+    """
+    base_dir = resolve_base_dir(base_dir)
+    users, subs, revenue = (read_table(base_dir, name) for name in ("users", "subscriptions", "revenue"))
+    if start is not None:
+        subs = subs[subs["subscription_end_date"].isna() | (subs["subscription_end_date"] >= pd.Timestamp(start))]
+        revenue = revenue[revenue["month"] >= pd.Timestamp(start).to_period("M").to_timestamp()]
+    if end is not None:
+        subs = subs[subs["subscription_start_date"] < day_after(end)]
+        revenue = revenue[revenue["month"] <= pd.Timestamp(end).to_period("M").to_timestamp()]
+    aggregates = stream_event_aggregates(base_dir, users, subs, chunk_rows, start, end)
+    tasks = _streaming_tasks(aggregates, users, subs, revenue, freq)
+    frames, errors = {}, {}
+    for name in metrics:
+        try:
+            result = tasks[name]()
+        except Exception as exc:
+            errors[name] = f"{type(exc).__name__}: {exc}"
+            continue
+        tidy = METRICS[name].tidy
+        frames[name] = (tidy(result) if tidy else result).reset_index(drop=True)
+    return frames, errors
+
+def write_report(frames: dict, out_dir: str, formats=("parquet",)) -> list:
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for name, frame in frames.items():
+        for fmt in formats:
+            path = os.path.join(out_dir, f"{name}.{fmt}")
+            if fmt == "parquet":
+                frame.to_parquet(path, index=False)
+            else:
+                frame.to_csv(path, index=False)
+            paths.append(path)
+    return paths
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compute dashboard metrics for every combination of filter values, without the app.")
+    parser.add_argument("--base-dir", default=REPO_DIR, help="directory, file:// URI or object-store URI (see src.loader)")
+    parser.add_argument("--metrics", nargs="+", choices=list(METRICS), default=list(METRICS))
+    parser.add_argument("--by", nargs="*", choices=DIMENSIONS, default=[], help="dimensions to slice by; every combination of their values is computed")
+    parser.add_argument("--start", help="first day of the date range (as the dashboard's date filter)")
+    parser.add_argument("--end", help="last day of the date range")
+    parser.add_argument("--freq", choices=["M", "W"], default="M", help="retention cohort grain")
+    parser.add_argument("--format", nargs="+", choices=FORMATS, default=["parquet"], dest="formats")
+    parser.add_argument("--out", default=os.path.join(REPO_DIR, "reports"), help="output directory (default: reports/ at the repository root)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU; 1 runs inline)")
+    parser.add_argument(
+        "--streaming", action="store_true", help="fold the events in chunks instead of loading them; company-wide metrics only, no funnel or --by"
+    )
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="events per chunk with --streaming")
+    args = parser.parse_args(argv)
+    if args.streaming:
+        if args.by:
+            parser.error("--streaming computes company-wide metrics; drop --by")
+        unsupported = [m for m in args.metrics if m not in STREAMING_METRICS]
+        if unsupported and args.metrics != list(METRICS):
+            parser.error(f"--streaming cannot compute {', '.join(unsupported)}")
+        args.metrics = [m for m in args.metrics if m in STREAMING_METRICS]
+    return args
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    started = time.perf_counter()
+    if args.streaming:
+        frames, errors = streaming_report(args.base_dir, args.metrics, args.start, args.end, args.freq, args.chunk_rows)
+        paths = write_report(frames, args.out, args.formats)
+        print(f"Streamed the events in chunks of {args.chunk_rows:,} rows and wrote {len(paths)} files in {time.perf_counter() - started:.1f}s")
+    else:
+        with MetricExecutor(args.workers) as executor:
+            report = BatchReport(args.base_dir, executor, args.start, args.end, args.freq)
+            loaded = time.perf_counter()
+            frames, errors = report.run(args.metrics, args.by)
+        paths = write_report(frames, args.out, args.formats)
+        done = time.perf_counter()
+        print(f"Loaded in {loaded - started:.1f}s, computed and wrote {len(paths)} files in {done - loaded:.1f}s ({executor.max_workers} workers)")
+    for name, frame in frames.items():
+        print(f"  {name:<24} {len(frame):>10,} rows")
+    for name, error in errors.items():
+        print(f"error: {name}: {error}", file=sys.stderr)
+    print(f"Reports written to {args.out}")
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,15 @@
+import numpy as np
 import pandas as pd
 
+from src.intervals import SubscriptionIntervals
+
+REVENUE_COLUMNS = ["month", "mrr", "expansion_mrr", "contraction_mrr", "churn_mrr", "new_mrr"]
+# Billing months are average calendar months; LTV counts at most this many of them.
+MONTH = pd.Timedelta(days=365.25 / 12)
+LTV_HORIZON = 36
+LTV_SEGMENTS = ["cohort", "plan_type", "acquisition_channel"]
+LTV_COLUMNS = ["subscriptions", "avg_mrr", "expected_months", "ltv"]
+
 def monthly_mrr(revenue: pd.DataFrame) -> pd.DataFrame:
     df = revenue.copy().sort_values("month")
     return df[["month", "mrr"]]
@@ -10,28 +20,122 @@ def net_mrr_growth(revenue: pd.DataFrame) -> pd.DataFrame:
     df["net_mrr_growth"] = df["mrr"] - df["prev_mrr"].fillna(0)
     return df[["month", "net_mrr_growth"]]
 
+def revenue_bridge(subscriptions: pd.DataFrame, start=None, end=None) -> pd.DataFrame:
+    """Monthly MRR and its new, expansion, contraction and churn parts, in the revenue table's layout."""
+    if subscriptions.empty:
+        return pd.DataFrame(columns=REVENUE_COLUMNS)
+    bridge = SubscriptionIntervals(subscriptions).mrr_bridge("M", start, end)
+    return bridge.rename(columns={"period": "month"})[REVENUE_COLUMNS]
+
 def arpu(subscriptions: pd.DataFrame, revenue: pd.DataFrame) -> pd.DataFrame:
-    df_rev = revenue.copy().sort_values("month")
-    subs = subscriptions.copy()
-    records = []
-    for _, row in df_rev.iterrows():
-        month = row["month"]
-        month_end = (month + pd.offsets.MonthEnd(0)).to_pydatetime()
-        active_mask = (subs["subscription_start_date"] <= month_end) & (
-            subs["subscription_end_date"].isna() | (subs["subscription_end_date"] >= month)
-        )
-        active_users = subs[active_mask]["user_id"].nunique()
-        mrr = row["mrr"]
-        arpu_val = mrr / active_users if active_users > 0 else 0.0
-        records.append({"month": month, "arpu": arpu_val})
-    return pd.DataFrame(records)
-
-def ltv_estimate(subscriptions: pd.DataFrame, revenue: pd.DataFrame) -> float:
+    df_rev = revenue.sort_values("month")
+    if df_rev.empty:
+        return pd.DataFrame(columns=["month", "arpu"])
+    active = SubscriptionIntervals(subscriptions).active("M", df_rev["month"].min(), df_rev["month"].max())
+    active_users = df_rev["month"].map(active.set_index("period")["active_users"]).fillna(0).to_numpy()
+    mrr = df_rev["mrr"].to_numpy(dtype=float)
+    arpu_val = np.divide(mrr, active_users, out=np.zeros(len(mrr)), where=active_users > 0)
+    return pd.DataFrame({"month": df_rev["month"].to_numpy(), "arpu": arpu_val})
+
+def default_as_of() -> pd.Timestamp:
+    # Today, tz-naive like the date columns; one value per day keeps results stable across reruns.
+    return pd.Timestamp.now("UTC").tz_localize(None).normalize()
+
+def survival_counts(subscriptions: pd.DataFrame, segments: pd.DataFrame = None, horizon: int = LTV_HORIZON, as_of=None) -> pd.DataFrame:
+    """Subscriptions and their MRR per (segment, billed months, churned); still-open ones are censored at as_of."""
+    as_of = pd.Timestamp(as_of) if as_of is not None else default_as_of()
+    start = subscriptions["subscription_start_date"].to_numpy(dtype="datetime64[ns]")
+    end = subscriptions["subscription_end_date"].to_numpy(dtype="datetime64[ns]")
+    churned = ~np.isnat(end) & (end <= as_of.to_datetime64())
+    stop = np.where(churned, end, as_of.to_datetime64())
+    months = np.ceil((stop - start) / MONTH.to_timedelta64())
+    counts = pd.DataFrame({"months": np.clip(months, 1, horizon), "churned": churned, "mrr": subscriptions["mrr"].to_numpy(dtype=float)})
+    keys = []
+    if segments is not None:
+        keys = list(segments.columns)
+        for col in keys:
+            counts[col] = segments[col].to_numpy()
+    counts = counts[~np.isnat(start)]
+    grouped = counts.groupby(keys + ["months", "churned"], observed=True, sort=True)
+    out = grouped["mrr"].agg(["size", "sum"]).rename(columns={"size": "subscriptions", "sum": "mrr"}).reset_index()
+    out["months"] = out["months"].astype(np.int64)
+    return out
+
+def _survival(counts: pd.DataFrame, keys: list, horizon: int):
+    # Kaplan-Meier per segment: a subscription billed for m months is at risk
+    # in months 0..m-1 and, when churned, ends after month m-1.
+    if keys:
+        codes, segments = pd.MultiIndex.from_frame(counts[keys]).factorize(sort=True)
+        segments = segments.to_frame(index=False, name=keys)
+    else:
+        codes, segments = np.zeros(len(counts), dtype=np.int64), pd.DataFrame(index=[0])
+    n = len(segments)
+    cell = codes * (horizon + 1) + counts["months"].to_numpy()
+    size = n * (horizon + 1)
+    observed = np.bincount(cell, weights=counts["subscriptions"], minlength=size).reshape(n, horizon + 1)
+    ended = np.bincount(cell, weights=counts["subscriptions"] * counts["churned"], minlength=size).reshape(n, horizon + 1)
+    at_risk = np.cumsum(observed[:, ::-1], axis=1)[:, ::-1][:, 1:]
+    churned = ended[:, 1:]
+    hazard = np.divide(churned, at_risk, out=np.zeros(at_risk.shape), where=at_risk > 0)
+    survival = np.cumprod(np.c_[np.ones(n), 1 - hazard[:, :-1]], axis=1)
+    mrr = np.bincount(codes, weights=counts["mrr"], minlength=n)
+    return segments, at_risk, churned, survival, observed.sum(axis=1), mrr
+
+def survival_curves_from_counts(counts: pd.DataFrame, keys: list, horizon: int = LTV_HORIZON) -> pd.DataFrame:
+    """Per segment and billing month: subscriptions at risk, churned, and the share still billing."""
+    segments, at_risk, churned, survival, _, _ = _survival(counts, keys, horizon)
+    curves = segments.loc[segments.index.repeat(horizon)].reset_index(drop=True) if keys else pd.DataFrame(index=range(horizon))
+    curves["month"] = np.tile(np.arange(horizon), len(segments))
+    curves["at_risk"] = at_risk.ravel().astype(np.int64)
+    curves["churned"] = churned.ravel().astype(np.int64)
+    curves["survival"] = survival.ravel()
+    return curves
+
+def ltv_from_counts(counts: pd.DataFrame, keys: list, horizon: int = LTV_HORIZON) -> pd.DataFrame:
+    """Per segment: average MRR times the expected billed months within the horizon."""
+    segments, _, _, survival, subs, mrr = _survival(counts, keys, horizon)
+    out = segments if keys else pd.DataFrame(index=range(len(segments)))
+    out["subscriptions"] = subs.astype(np.int64)
+    out["avg_mrr"] = np.divide(mrr, subs, out=np.zeros(len(subs)), where=subs > 0)
+    out["expected_months"] = survival.sum(axis=1)
+    out["ltv"] = out["avg_mrr"] * out["expected_months"]
+    return out
+
+def cohort_segments(subscriptions: pd.DataFrame, users: pd.DataFrame) -> pd.DataFrame:
+    """Signup month, plan and acquisition channel of every subscription, row-aligned with it."""
+    users = users.drop_duplicates("user_id")
+    pos = pd.Index(users["user_id"]).get_indexer(subscriptions["user_id"])
+    # Unknown users (position -1) pick up the missing value appended last.
+    signup = users["signup_date"].to_numpy(dtype="datetime64[ns]").astype("datetime64[M]").astype("datetime64[ns]")
+    channel = users["acquisition_channel"].astype(object).to_numpy()
+    return pd.DataFrame(
+        {
+            "cohort": np.append(signup, np.datetime64("NaT"))[pos],
+            "plan_type": subscriptions["plan_type"].astype(object).to_numpy(),
+            "acquisition_channel": np.append(channel, None)[pos],
+        }
+    )
+
+def survival_curves(subscriptions: pd.DataFrame, users: pd.DataFrame, horizon: int = LTV_HORIZON, as_of=None) -> pd.DataFrame:
+    if subscriptions.empty:
+        return pd.DataFrame(columns=LTV_SEGMENTS + ["month", "at_risk", "churned", "survival"])
+    counts = survival_counts(subscriptions, cohort_segments(subscriptions, users), horizon, as_of)
+    return survival_curves_from_counts(counts, LTV_SEGMENTS, horizon)
+
+def cohort_ltv(subscriptions: pd.DataFrame, users: pd.DataFrame, horizon: int = LTV_HORIZON, as_of=None) -> pd.DataFrame:
+    if subscriptions.empty:
+        return pd.DataFrame(columns=LTV_SEGMENTS + LTV_COLUMNS)
+    counts = survival_counts(subscriptions, cohort_segments(subscriptions, users), horizon, as_of)
+    return ltv_from_counts(counts, LTV_SEGMENTS, horizon)
+
+def ltv_from_plan_counts(counts: pd.DataFrame, horizon: int = LTV_HORIZON) -> float:
+    ltv = ltv_from_counts(counts, ["plan_type"], horizon)
+    total = ltv["subscriptions"].sum()
+    return float((ltv["ltv"] * ltv["subscriptions"]).sum() / total) if total else 0.0
+
+def ltv_estimate(subscriptions: pd.DataFrame, *, horizon: int = LTV_HORIZON, as_of=None) -> float:
+    """Expected revenue per subscription: each plan's LTV, weighted by its share of subscriptions."""
     if subscriptions.empty:
         return 0.0
-    subs = subscriptions.copy()
-    subs["end"] = subs["subscription_end_date"].fillna(pd.Timestamp.utcnow())
-    subs["lifetime_months"] = (subs["end"] - subs["subscription_start_date"]) / pd.Timedelta(days=30)
-    avg_lifetime = subs["lifetime_months"].mean()
-    avg_mrr = subs["mrr"].mean()
-    return float(avg_mrr * avg_lifetime)
+    plans = pd.DataFrame({"plan_type": subscriptions["plan_type"].astype(object).to_numpy()})
+    return ltv_from_plan_counts(survival_counts(subscriptions, plans, horizon, as_of), horizon)
@@ -0,0 +1,124 @@
+import os
+import pandas as pd
+
+from src.storage import has_source_version, processed_dir, read_table, stamp_source_version
+
+DIMENSIONS = ["country", "acquisition_channel", "plan_type"]
+
+def user_dimensions(users: pd.DataFrame, subscriptions: pd.DataFrame) -> pd.DataFrame:
+    latest_sub = subscriptions.sort_values("subscription_start_date").drop_duplicates("user_id", keep="last")
+    dims = users[["user_id", "country", "acquisition_channel", "initial_plan"]].merge(
+        latest_sub[["user_id", "plan_type"]], on="user_id", how="left"
+    )
+    dims["plan_type"] = dims["plan_type"].astype(object).fillna(dims["initial_plan"].astype(object))
+    dims = dims.drop(columns="initial_plan").drop_duplicates("user_id").reset_index(drop=True)
+    for col in ["user_id"] + DIMENSIONS:
+        dims[col] = dims[col].astype("category")
+    return dims
+
+def _attach_dimensions(pairs: pd.DataFrame, dims: pd.DataFrame, pos) -> pd.DataFrame:
+    for col in ["user_id"] + DIMENSIONS:
+        pairs[col] = dims[col].take(pos).to_numpy()
+    return pairs
+
+def build_daily_rollup(events: pd.DataFrame, dims: pd.DataFrame) -> pd.DataFrame:
+    pos = pd.Index(dims["user_id"]).get_indexer(events["user_id"])
+    known = pos >= 0
+    pairs = pd.DataFrame(
+        {
+            "date": events["event_timestamp"].to_numpy()[known].astype("datetime64[D]"),
+            "user_pos": pos[known],
+        }
+    ).drop_duplicates()
+    pairs = _attach_dimensions(pairs, dims, pairs["user_pos"].to_numpy())
+    pairs["date"] = pd.to_datetime(pairs["date"])
+    return pairs.drop(columns="user_pos").sort_values(["date", "user_id"]).reset_index(drop=True)
+
+def build_monthly_rollup(daily: pd.DataFrame) -> pd.DataFrame:
+    monthly = daily.assign(month=daily["date"].dt.to_period("M").dt.to_timestamp())
+    monthly = monthly.drop(columns="date").drop_duplicates(["month", "user_id"])
+    return monthly[["month", "user_id"] + DIMENSIONS].sort_values(["month", "user_id"]).reset_index(drop=True)
+
+def build_rollups(events: pd.DataFrame, users: pd.DataFrame, subscriptions: pd.DataFrame):
+    daily = build_daily_rollup(events, user_dimensions(users, subscriptions))
+    return daily, build_monthly_rollup(daily)
+
+def update_rollups(daily: pd.DataFrame, monthly: pd.DataFrame, new_events: pd.DataFrame, dims: pd.DataFrame):
+    fresh = build_daily_rollup(new_events, dims)
+    if fresh.empty:
+        return daily, monthly
+    touched_days = daily["date"].isin(fresh["date"].unique())
+    merged = pd.concat([daily[touched_days], fresh], ignore_index=True).drop_duplicates(["date", "user_id"])
+    daily = pd.concat([daily[~touched_days], merged], ignore_index=True)
+    daily = daily.sort_values(["date", "user_id"]).reset_index(drop=True)
+
+    fresh_months = fresh["date"].dt.to_period("M").dt.to_timestamp().unique()
+    touched_months = monthly["month"].isin(fresh_months)
+    month_days = daily[daily["date"].dt.to_period("M").dt.to_timestamp().isin(fresh_months)]
+    monthly = pd.concat([monthly[~touched_months], build_monthly_rollup(month_days)], ignore_index=True)
+    monthly = monthly.sort_values(["month", "user_id"]).reset_index(drop=True)
+    return daily, monthly
+
+def _filter_dimensions(df: pd.DataFrame, countries=None, channels=None, plans=None) -> pd.DataFrame:
+    for col, values in zip(DIMENSIONS, [countries, channels, plans]):
+        if values:
+            df = df[df[col].isin(values)]
+    return df
+
+def dau_from_rollup(daily: pd.DataFrame, countries=None, channels=None, plans=None, date_range=None) -> pd.DataFrame:
+    df = _filter_dimensions(daily, countries, channels, plans)
+    if date_range:
+        start, end = date_range
+        df = df[(df["date"] >= start.normalize()) & (df["date"] <= end)]
+    dau = df.groupby("date").size().reset_index(name="dau")
+    dau["date"] = dau["date"].dt.date
+    return dau
+
+def mau_from_rollup(
+    monthly: pd.DataFrame, daily: pd.DataFrame, countries=None, channels=None, plans=None, date_range=None
+) -> pd.DataFrame:
+    df = _filter_dimensions(monthly, countries, channels, plans)
+    if date_range:
+        start, end = date_range
+        first = start.to_period("M").to_timestamp()
+        last = end.to_period("M").to_timestamp()
+        full = df[(df["month"] > first) & (df["month"] < last)]
+        # Boundary months only partly overlap the range, so recount them from the daily table.
+        edges = _filter_dimensions(daily, countries, channels, plans)
+        edges = edges[(edges["date"] >= start.normalize()) & (edges["date"] <= end)]
+        edges = edges[(edges["date"] < first + pd.offsets.MonthBegin(1)) | (edges["date"] >= last)]
+        df = pd.concat([full, build_monthly_rollup(edges)], ignore_index=True)
+    mau = df.groupby("month").size().reset_index(name="mau")
+    return mau
+
+def rollup_dir(base_dir: str) -> str:
+    return os.path.join(processed_dir(base_dir), "rollups")
+
+def save_rollups(daily: pd.DataFrame, monthly: pd.DataFrame, base_dir: str) -> None:
+    os.makedirs(rollup_dir(base_dir), exist_ok=True)
+    daily.to_parquet(os.path.join(rollup_dir(base_dir), "daily.parquet"), index=False)
+    monthly.to_parquet(os.path.join(rollup_dir(base_dir), "monthly.parquet"), index=False)
+    stamp_source_version(rollup_dir(base_dir), base_dir)
+
+def load_rollups(base_dir: str):
+    path = rollup_dir(base_dir)
+    # Rollups built from other versions of the tables are ignored.
+    if not os.path.exists(os.path.join(path, "daily.parquet")) or not has_source_version(path, base_dir):
+        return None
+    return (
+        pd.read_parquet(os.path.join(path, "daily.parquet")),
+        pd.read_parquet(os.path.join(path, "monthly.parquet")),
+    )
+
+def main():
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    users = read_table(base_dir, "users")
+    subs = read_table(base_dir, "subscriptions")
+    events = read_table(base_dir, "events", columns=["user_id", "event_timestamp"])
+    print("Building daily/monthly activity rollups...")
+    daily, monthly = build_rollups(events, users, subs)
+    save_rollups(daily, monthly, base_dir)
+    print(f"Done. {len(daily)} user-days and {len(monthly)} user-months saved under data/processed/rollups/.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import os
+import pandas as pd
+
+from src.storage import read_table
+
+# Columns that share one dictionary across users, subscriptions and events.
+SHARED_CATEGORIES = {
+    "user_id": [("users", "user_id"), ("subscriptions", "user_id"), ("events", "user_id")],
+    "country": [("users", "country")],
+    "acquisition_channel": [("users", "acquisition_channel")],
+    "plan": [("users", "initial_plan"), ("subscriptions", "plan_type")],
+    "event_type": [("events", "event_type")],
+    "feature_name": [("events", "feature_name")],
+}
+
+def _values(series: pd.Series) -> pd.Index:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return pd.Index(series.cat.categories)
+    return pd.Index(series.dropna().unique())
+
+def build_dictionaries(tables: dict) -> dict:
+    dtypes = {}
+    for name, columns in SHARED_CATEGORIES.items():
+        values = pd.Index([])
+        for table, col in columns:
+            if table in tables and col in tables[table].columns:
+                values = values.union(_values(tables[table][col]))
+        dtypes[name] = pd.CategoricalDtype(values.sort_values())
+    return dtypes
+
+def _downcast(df: pd.DataFrame) -> pd.DataFrame:
+    for col in df.select_dtypes(include="integer").columns:
+        df[col] = pd.to_numeric(df[col], downcast="integer")
+    return df
+
+def compact_tables(users: pd.DataFrame, subs: pd.DataFrame, events: pd.DataFrame, keep_event_id: bool = False):
+    tables = {"users": users, "subscriptions": subs, "events": events}
+    dtypes = build_dictionaries(tables)
+    out = {}
+    for name, df in tables.items():
+        df = df.copy()
+        if name == "events" and not keep_event_id and "event_id" in df.columns:
+            df = df.drop(columns="event_id")
+        for key, columns in SHARED_CATEGORIES.items():
+            for table, col in columns:
+                if table != name or col not in df.columns:
+                    continue
+                if isinstance(df[col].dtype, pd.CategoricalDtype):
+                    df[col] = df[col].cat.set_categories(dtypes[key].categories)
+                else:
+                    df[col] = df[col].astype(dtypes[key])
+        # Floats stay float64: float32 sums over millions of MRR rows lose cents.
+        out[name] = _downcast(df)
+    return out["users"], out["subscriptions"], out["events"]
+
+def _frame_bytes(df: pd.DataFrame, seen: set) -> int:
+    # Shared dictionaries are one object in memory, so only the first table
+    # that references a dictionary is charged for it.
+    total = int(df.index.memory_usage(deep=True))
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            total += series.cat.codes.nbytes
+            categories = series.cat.categories
+            if id(categories) not in seen:
+                seen.add(id(categories))
+                total += int(categories.memory_usage(deep=True))
+        else:
+            total += int(series.memory_usage(index=False, deep=True))
+    return total
+
+def memory_report(before: dict, after: dict) -> pd.DataFrame:
+    rows = []
+    seen_before, seen_after = set(), set()
+    for name in before:
+        b = _frame_bytes(before[name], seen_before)
+        a = _frame_bytes(after[name], seen_after)
+        n = max(len(before[name]), 1)
+        rows.append(
+            {
+                "table": name,
+                "rows": len(before[name]),
+                "bytes_per_row_before": b / n,
+                "bytes_per_row_after": a / n,
+                "reduction": 1 - a / b if b else 0.0,
+            }
+        )
+    return pd.DataFrame(rows)
+
+def main():
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    users = read_table(base_dir, "users")
+    subs = read_table(base_dir, "subscriptions")
+    events = read_table(base_dir, "events")
+    compact = compact_tables(users, subs, events)
+    before = {"users": users, "subscriptions": subs, "events": events}
+    after = dict(zip(before, compact))
+    print(memory_report(before, after).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
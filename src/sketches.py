@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+from src.rollups import DIMENSIONS
+
+# HyperLogLog with 2**precision registers. Sketches are kept in sparse long
+# form (group keys..., register, rank) so a cell never holds more than
+# 2**precision rows and two sketches merge with a group-by max.
+DEFAULT_PRECISION = 12
+
+def relative_error(precision: int = DEFAULT_PRECISION) -> float:
+    return 1.04 / np.sqrt(1 << precision)
+
+def hash_user_ids(user_ids) -> np.ndarray:
+    return pd.util.hash_pandas_object(pd.Series(user_ids), index=False).to_numpy()
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    x = x.copy()
+    n = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= np.uint64(1 << shift)
+        n[big] += shift
+        x[big] >>= np.uint64(shift)
+    return n + (x > 0)
+
+def register_ranks(hashes: np.ndarray, precision: int = DEFAULT_PRECISION):
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    register = (hashes >> np.uint64(64 - precision)).astype(np.uint16)
+    # The guard bit caps the rank at 64 - precision + 1 for an all-zero suffix.
+    w = (hashes << np.uint64(precision)) | np.uint64(1 << (precision - 1))
+    rank = (65 - _bit_length(w)).astype(np.uint8)
+    return register, rank
+
+def merge_sketches(sketch: pd.DataFrame, by) -> pd.DataFrame:
+    by = list(by)
+    return sketch.groupby(by + ["register"], observed=True, sort=False)["rank"].max().reset_index()
+
+def build_sketches(keys: pd.DataFrame, user_ids, precision: int = DEFAULT_PRECISION) -> pd.DataFrame:
+    register, rank = register_ranks(hash_user_ids(user_ids), precision)
+    cells = keys.reset_index(drop=True).assign(register=register, rank=rank)
+    return merge_sketches(cells, keys.columns)
+
+def estimate(sketch: pd.DataFrame, by, precision: int = DEFAULT_PRECISION, name: str = "estimate") -> pd.DataFrame:
+    by = list(by)
+    m = 1 << precision
+    alpha = 0.7213 / (1 + 1.079 / m)
+    merged = merge_sketches(sketch, by)
+    merged["harmonic"] = np.exp2(-merged["rank"].astype(float))
+    agg = merged.groupby(by, observed=True).agg(harmonic=("harmonic", "sum"), filled=("register", "size"))
+    zeros = m - agg["filled"].to_numpy()
+    raw = alpha * m * m / (agg["harmonic"].to_numpy() + zeros)
+    small = (raw <= 2.5 * m) & (zeros > 0)
+    linear = m * np.log(m / np.where(zeros > 0, zeros, 1))
+    agg[name] = np.rint(np.where(small, linear, raw)).astype(int)
+    return agg[[name]].reset_index()
+
+def distinct_count(sketch: pd.DataFrame, precision: int = DEFAULT_PRECISION) -> int:
+    if sketch.empty:
+        return 0
+    est = estimate(sketch.assign(_all=0), ["_all"], precision)
+    return int(est["estimate"].iloc[0])
+
+def daily_active_users_approx(events: pd.DataFrame, precision: int = DEFAULT_PRECISION) -> pd.DataFrame:
+    keys = pd.DataFrame({"date": events["event_timestamp"].dt.normalize().to_numpy()})
+    dau = estimate(build_sketches(keys, events["user_id"], precision), ["date"], precision, name="dau")
+    dau = dau.sort_values("date").reset_index(drop=True)
+    dau["date"] = dau["date"].dt.date
+    return dau
+
+def monthly_active_users_approx(events: pd.DataFrame, precision: int = DEFAULT_PRECISION) -> pd.DataFrame:
+    keys = pd.DataFrame({"month": events["event_timestamp"].dt.to_period("M").dt.to_timestamp().to_numpy()})
+    mau = estimate(build_sketches(keys, events["user_id"], precision), ["month"], precision, name="mau")
+    return mau.sort_values("month").reset_index(drop=True)
+
+def activity_sketches(daily: pd.DataFrame, precision: int = DEFAULT_PRECISION) -> pd.DataFrame:
+    return build_sketches(daily[["date"] + DIMENSIONS], daily["user_id"], precision)
+
+def active_users_from_sketches(
+    sketches: pd.DataFrame,
+    grain: str = "D",
+    countries=None,
+    channels=None,
+    plans=None,
+    date_range=None,
+    precision: int = DEFAULT_PRECISION,
+) -> pd.DataFrame:
+    df = sketches
+    for col, values in zip(DIMENSIONS, [countries, channels, plans]):
+        if values:
+            df = df[df[col].isin(values)]
+    if date_range:
+        start, end = date_range
+        df = df[(df["date"] >= start.normalize()) & (df["date"] <= end)]
+    if grain == "D":
+        dau = estimate(df, ["date"], precision, name="dau").sort_values("date").reset_index(drop=True)
+        dau["date"] = dau["date"].dt.date
+        return dau
+    df = df.assign(month=df["date"].dt.to_period("M").dt.to_timestamp())
+    return estimate(df, ["month"], precision, name="mau").sort_values("month").reset_index(drop=True)
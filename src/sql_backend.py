@@ -0,0 +1,379 @@
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.cohorts import COHORT_LABELS, retention_matrix_from_counts
+from src.filter_engine import FilterIndex, day_after
+from src.funnel import DEFAULT_STEPS, KEY_EVENTS
+from src.revenue_metrics import LTV_COLUMNS, LTV_HORIZON, LTV_SEGMENTS, MONTH, default_as_of, ltv_from_counts, ltv_from_plan_counts
+from src.storage import TABLES, has_parquet, parquet_path, raw_dir, read_table
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover - the pandas backend needs no SQL engine
+    duckdb = None
+
+BACKENDS = ["pandas", "DuckDB"]
+
+# Period ordinals matching src.cohorts.period_ordinals.
+PERIOD_SQL = {
+    "M": "((year({col}) - 1970) * 12 + month({col}) - 1)",
+    "W": "CAST(floor((date_diff('day', DATE '1970-01-01', CAST({col} AS DATE)) + 10) / 7) AS BIGINT)",
+}
+
+def _source(base_dir: str, name: str) -> str:
+    if has_parquet(base_dir, name):
+        path = parquet_path(base_dir, name)
+        if name == "events":
+            return f"read_parquet('{os.path.join(path, '**', '*.parquet')}', hive_partitioning = true)"
+        return f"read_parquet('{path}')"
+    return f"read_csv_auto('{os.path.join(raw_dir(base_dir), name + '.csv')}')"
+
+def _period(col: str, freq: str) -> str:
+    if freq not in PERIOD_SQL:
+        raise ValueError(f"Unsupported cohort frequency: {freq!r}")
+    return PERIOD_SQL[freq].format(col=col)
+
+def _filtered(countries=None, plans=None, channels=None, date_range=None):
+    """WITH clause for the filtered tables u, s, e and r, plus its parameters.
+
+    Mirrors FilterIndex.filter: subscriptions and events keep only filtered
+    users, and the date range clips events, subscriptions and revenue months.
+    """
+    params = {}
+    users, subs, events, revenue = ["TRUE"], ["user_id IN (SELECT user_id FROM u)"], ["user_id IN (SELECT user_id FROM u)"], ["TRUE"]
+    if countries:
+        users.append("list_contains($countries, country)")
+        params["countries"] = [str(c) for c in countries]
+    if channels:
+        users.append("list_contains($channels, acquisition_channel)")
+        params["channels"] = [str(c) for c in channels]
+    if plans:
+        subs.append("list_contains($plans, plan_type)")
+        params["plans"] = [str(p) for p in plans]
+    if date_range:
+        start, end = (pd.Timestamp(d) for d in date_range)
+        params.update(
+            start=start.to_pydatetime(),
+            day_after=day_after(end).to_pydatetime(),
+            start_month=start.to_period("M").to_timestamp().to_pydatetime(),
+            end_month=end.to_period("M").to_timestamp().to_pydatetime(),
+        )
+        subs += ["subscription_start_date < $day_after", "(subscription_end_date IS NULL OR subscription_end_date >= $start)"]
+        events.append("event_timestamp >= $start AND event_timestamp < $day_after")
+        revenue.append("month BETWEEN $start_month AND $end_month")
+    sql = (
+        f"WITH u AS (SELECT * FROM users WHERE {' AND '.join(users)}), "
+        f"s AS (SELECT * FROM subscriptions WHERE {' AND '.join(subs)}), "
+        f"e AS (SELECT * FROM events WHERE {' AND '.join(events)}), "
+        f"r AS (SELECT * FROM revenue WHERE {' AND '.join(revenue)}) "
+    )
+    return sql, params
+
+class SqlBackend:
+    """Metric queries pushed down to an embedded DuckDB database.
+
+    Views read the on-disk Parquet (or raw CSV) tables, so events are never
+    loaded into pandas; each metric takes the dashboard filters and returns
+    the small frame the pandas function of the same name returns.
+    """
+
+    def __init__(self, base_dir: str, database: str = ":memory:"):
+        if duckdb is None:
+            raise ImportError("The SQL backend requires duckdb (pip install duckdb)")
+        self.base_dir = base_dir
+        self._con = duckdb.connect(database)
+        self._lock = threading.Lock()
+        for name, spec in TABLES.items():
+            casts = ", ".join(f"CAST({col} AS TIMESTAMP) AS {col}" for col in spec["parse_dates"])
+            replace = f" REPLACE ({casts})" if casts else ""
+            self._con.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT *{replace} FROM {_source(base_dir, name)}")
+
+    def query(self, sql: str, params: dict = None) -> pd.DataFrame:
+        # One cursor per query: DuckDB connections are not safe to share across threads.
+        with self._lock:
+            cursor = self._con.cursor()
+        try:
+            return cursor.execute(sql, params or {}).df()
+        finally:
+            cursor.close()
+
+    def _filtered_query(self, body: str, filters, extra: dict = None) -> pd.DataFrame:
+        with_clause, params = _filtered(*filters)
+        return self.query(with_clause + body, {**params, **(extra or {})})
+
+    def dimension_values(self):
+        countries = self.query("SELECT DISTINCT country FROM users WHERE country IS NOT NULL ORDER BY 1")["country"].tolist()
+        plans = self.query("SELECT DISTINCT plan_type FROM subscriptions WHERE plan_type IS NOT NULL ORDER BY 1")["plan_type"].tolist()
+        channels = self.query(
+            "SELECT DISTINCT acquisition_channel FROM users WHERE acquisition_channel IS NOT NULL ORDER BY 1"
+        )["acquisition_channel"].tolist()
+        return countries, plans, channels
+
+    def date_bounds(self):
+        row = self.query("SELECT min(event_timestamp) AS lo, max(event_timestamp) AS hi FROM events").iloc[0]
+        if pd.isna(row["lo"]):
+            return None, None
+        return pd.Timestamp(row["lo"]), pd.Timestamp(row["hi"])
+
+    def user_count(self, *filters) -> int:
+        return int(self._filtered_query("SELECT count(*) AS n FROM u", filters)["n"].iloc[0])
+
+    def daily_active_users(self, *filters, approx: bool = False) -> pd.DataFrame:
+        count = "approx_count_distinct(user_id)" if approx else "count(DISTINCT user_id)"
+        df = self._filtered_query(
+            f"SELECT CAST(event_timestamp AS DATE) AS date, {count} AS dau FROM e "
+            "WHERE event_timestamp IS NOT NULL GROUP BY 1 ORDER BY 1",
+            filters,
+        )
+        df["date"] = pd.to_datetime(df["date"]).dt.date
+        return df
+
+    def monthly_active_users(self, *filters, approx: bool = False) -> pd.DataFrame:
+        count = "approx_count_distinct(user_id)" if approx else "count(DISTINCT user_id)"
+        return self._filtered_query(
+            f"SELECT date_trunc('month', event_timestamp) AS month, {count} AS mau FROM e "
+            "WHERE event_timestamp IS NOT NULL GROUP BY 1 ORDER BY 1",
+            filters,
+        )
+
+    def churn_rate(self, *filters) -> float:
+        df = self._filtered_query("SELECT count(*) AS n, count(*) FILTER (WHERE is_churned) AS churned FROM s", filters)
+        n = int(df["n"].iloc[0])
+        return float(df["churned"].iloc[0]) / float(n) if n else 0.0
+
+    def conversion_funnel(self, *filters) -> pd.DataFrame:
+        df = self._filtered_query(
+            "SELECT (SELECT count(*) FROM u) AS signed_up, "
+            "(SELECT count(DISTINCT user_id) FROM e WHERE list_contains($key_events, event_type)) AS activated, "
+            "(SELECT count(DISTINCT user_id) FROM s WHERE mrr > 0) AS paying, "
+            "(SELECT count(DISTINCT user_id) FROM s WHERE NOT is_churned AND mrr > 0) AS retained",
+            filters,
+            {"key_events": list(KEY_EVENTS)},
+        )
+        return pd.DataFrame({"step": [step.name for step in DEFAULT_STEPS], "count": df.iloc[0].astype(int).to_numpy()})
+
+    def activation_rate(self, *filters) -> float:
+        funnel = self.conversion_funnel(*filters).set_index("step")["count"]
+        signed_up = funnel[DEFAULT_STEPS[0].name]
+        return float(funnel[DEFAULT_STEPS[1].name]) / float(signed_up) if signed_up else 0.0
+
+    def build_signup_cohorts(self, *filters) -> pd.DataFrame:
+        return self._filtered_query(
+            "SELECT date_trunc('month', signup_date) AS signup_month, count(DISTINCT user_id) AS num_users FROM u "
+            "WHERE signup_date IS NOT NULL GROUP BY 1 ORDER BY 1",
+            filters,
+        )
+
+    def cohort_retention_matrix(self, *filters, approx: bool = False, freq: str = "M", by=None) -> pd.DataFrame:
+        if freq not in COHORT_LABELS:
+            raise ValueError(f"Unsupported cohort frequency: {freq!r}")
+        if by is not None and by not in ("country", "acquisition_channel"):
+            raise ValueError(f"Unsupported cohort grouping: {by!r}")
+        group = f"{by}, " if by else ""
+        cells = (
+            f", uc AS (SELECT user_id, {group}{_period('signup_date', freq)} AS cohort FROM u WHERE signup_date IS NOT NULL), "
+            f"cells AS (SELECT e.user_id, {'uc.' + group if by else ''}uc.cohort, "
+            f"{_period('e.event_timestamp', freq)} - uc.cohort AS \"offset\" "
+            "FROM e JOIN uc USING (user_id) WHERE e.event_timestamp IS NOT NULL) "
+        )
+        count = "approx_count_distinct(user_id)" if approx else "count(DISTINCT user_id)"
+        counts = self._filtered_query(
+            cells + f"SELECT {group}cohort, \"offset\", {count} AS active_users FROM cells WHERE \"offset\" >= 0 GROUP BY ALL",
+            filters,
+        )
+        sizes = self._filtered_query(cells + f"SELECT {group}cohort, count(*) AS cohort_size FROM uc GROUP BY ALL", filters)
+        if approx and not counts.empty:
+            keys = ([by] if by else []) + ["cohort"]
+            capped = counts.merge(sizes, on=keys, how="left")
+            counts["active_users"] = np.minimum(capped["active_users"], capped["cohort_size"]).to_numpy()
+        return retention_matrix_from_counts(counts, sizes, freq, by)
+
+    def feature_usage_counts(self, *filters) -> pd.DataFrame:
+        return self._filtered_query(
+            "SELECT feature_name, count(user_id) AS event_count FROM e WHERE feature_name IS NOT NULL "
+            "GROUP BY 1 ORDER BY event_count DESC, feature_name",
+            filters,
+        )
+
+    def top_features(self, *filters, n: int = 10) -> pd.DataFrame:
+        return self.feature_usage_counts(*filters).head(n)
+
+    def feature_usage_by_plan(self, *filters) -> pd.DataFrame:
+        # The plan at each event: the latest subscription started by then, if it has not ended.
+        return self._filtered_query(
+            "SELECT s.plan_type, e.feature_name, count(e.user_id) AS event_count "
+            "FROM e ASOF JOIN s ON e.user_id = s.user_id AND e.event_timestamp >= s.subscription_start_date "
+            "WHERE e.feature_name IS NOT NULL AND s.plan_type IS NOT NULL "
+            "AND (s.subscription_end_date IS NULL OR s.subscription_end_date >= e.event_timestamp) "
+            "GROUP BY ALL ORDER BY 1, 2",
+            filters,
+        )
+
+    def revenue(self, *filters) -> pd.DataFrame:
+        return self._filtered_query("SELECT * FROM r ORDER BY month", filters)
+
+    def monthly_mrr(self, *filters) -> pd.DataFrame:
+        return self._filtered_query("SELECT month, mrr FROM r ORDER BY month", filters)
+
+    def arpu(self, *filters) -> pd.DataFrame:
+        # Active in a month: started before it ends and ended on or after it starts.
+        return self._filtered_query(
+            "SELECT r.month, CASE WHEN count(DISTINCT s.user_id) > 0 THEN r.mrr / count(DISTINCT s.user_id) ELSE 0 END AS arpu "
+            "FROM r LEFT JOIN s ON s.subscription_start_date < r.month + INTERVAL 1 MONTH "
+            "AND (s.subscription_end_date IS NULL OR s.subscription_end_date >= r.month) "
+            "GROUP BY r.month, r.mrr ORDER BY r.month",
+            filters,
+        )
+
+    def survival_counts(self, keys: dict, filters, horizon: int = LTV_HORIZON, as_of=None) -> pd.DataFrame:
+        """revenue_metrics.survival_counts in SQL; keys maps each segment column to its expression over s and u."""
+        as_of = pd.Timestamp(as_of) if as_of is not None else default_as_of()
+        select = "".join(f"{expr} AS {name}, " for name, expr in keys.items())
+        present = "".join(f" AND {expr} IS NOT NULL" for expr in keys.values())
+        return self._filtered_query(
+            f"SELECT {select}"
+            "CAST(least(greatest(ceil((epoch_us(CASE WHEN churned THEN subscription_end_date ELSE $as_of END) "
+            "- epoch_us(subscription_start_date)) / $month_us), 1), $horizon) AS BIGINT) AS months, "
+            "churned, count(*) AS subscriptions, sum(mrr) AS mrr "
+            "FROM (SELECT *, coalesce(subscription_end_date <= $as_of, false) AS churned FROM s) s JOIN u USING (user_id) "
+            f"WHERE subscription_start_date IS NOT NULL{present} GROUP BY ALL ORDER BY ALL",
+            filters,
+            {"as_of": as_of.to_pydatetime(), "month_us": MONTH // pd.Timedelta(microseconds=1), "horizon": horizon},
+        )
+
+    def cohort_ltv(self, *filters, horizon: int = LTV_HORIZON) -> pd.DataFrame:
+        keys = {"cohort": "date_trunc('month', signup_date)", "plan_type": "plan_type", "acquisition_channel": "u.acquisition_channel"}
+        counts = self.survival_counts(keys, filters, horizon)
+        if counts.empty:
+            return pd.DataFrame(columns=LTV_SEGMENTS + LTV_COLUMNS)
+        return ltv_from_counts(counts, LTV_SEGMENTS, horizon)
+
+    def ltv_estimate(self, *filters, horizon: int = LTV_HORIZON) -> float:
+        counts = self.survival_counts({"plan_type": "plan_type"}, filters, horizon)
+        if counts.empty:
+            return 0.0
+        return ltv_from_plan_counts(counts, horizon)
+
+def _normalize(value):
+    if not isinstance(value, pd.DataFrame):
+        return value
+    # Named indexes (cohort labels) are data; positional ones are not.
+    df = value.reset_index(drop=all(name is None for name in value.index.names))
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object or pd.api.types.is_string_dtype(series):
+            converted = pd.to_datetime(series, errors="coerce") if series.dtype == object else None
+            if converted is not None and converted.notna().all() and len(series):
+                df[col] = converted.astype("datetime64[ns]")
+            else:
+                df[col] = series.astype(object)
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            df[col] = series.astype("datetime64[ns]")
+        elif pd.api.types.is_numeric_dtype(series):
+            df[col] = series.astype(float)
+    keys = [c for c in df.columns if not pd.api.types.is_float_dtype(df[c])]
+    return df.sort_values(keys or list(df.columns), kind="stable").reset_index(drop=True)
+
+def _compare(expected, actual) -> str:
+    expected, actual = _normalize(expected), _normalize(actual)
+    if isinstance(expected, pd.DataFrame):
+        try:
+            pd.testing.assert_frame_equal(expected, actual, check_dtype=False, check_exact=False, rtol=1e-9)
+        except AssertionError as exc:
+            return " ".join(str(exc).split())
+        return ""
+    if math.isclose(float(expected), float(actual), rel_tol=1e-6, abs_tol=1e-9):
+        return ""
+    return f"{expected!r} != {actual!r}"
+
+def parity_cases(base_dir: str):
+    """(metric name, pandas reference, SQL backend method, keyword args)."""
+    from src import analytics, cohorts, feature_usage, revenue_metrics
+
+    return [
+        ("daily_active_users", lambda u, s, e, r: analytics.daily_active_users(e), "daily_active_users", {}),
+        ("monthly_active_users", lambda u, s, e, r: analytics.monthly_active_users(e), "monthly_active_users", {}),
+        ("churn_rate", lambda u, s, e, r: analytics.churn_rate(s), "churn_rate", {}),
+        ("activation_rate", lambda u, s, e, r: analytics.activation_rate(u, e), "activation_rate", {}),
+        ("conversion_funnel", lambda u, s, e, r: analytics.conversion_funnel(u, e, s), "conversion_funnel", {}),
+        ("build_signup_cohorts", lambda u, s, e, r: cohorts.build_signup_cohorts(u), "build_signup_cohorts", {}),
+        ("cohort_retention_matrix", lambda u, s, e, r: cohorts.cohort_retention_matrix(u, e), "cohort_retention_matrix", {}),
+        (
+            "cohort_retention_matrix[W, country]",
+            lambda u, s, e, r: cohorts.cohort_retention_matrix(u, e, freq="W", by="country"),
+            "cohort_retention_matrix",
+            {"freq": "W", "by": "country"},
+        ),
+        ("feature_usage_counts", lambda u, s, e, r: feature_usage.feature_usage_counts(e), "feature_usage_counts", {}),
+        ("feature_usage_by_plan", lambda u, s, e, r: feature_usage.feature_usage_by_plan(e, s), "feature_usage_by_plan", {}),
+        ("top_features", lambda u, s, e, r: feature_usage.top_features(e, n=3), "top_features", {"n": 3}),
+        ("monthly_mrr", lambda u, s, e, r: revenue_metrics.monthly_mrr(r), "monthly_mrr", {}),
+        ("arpu", lambda u, s, e, r: revenue_metrics.arpu(s, r), "arpu", {}),
+        ("ltv_estimate", lambda u, s, e, r: revenue_metrics.ltv_estimate(s), "ltv_estimate", {}),
+        ("cohort_ltv", lambda u, s, e, r: revenue_metrics.cohort_ltv(s, u), "cohort_ltv", {}),
+    ]
+
+def default_filter_sets(countries, plans, channels, date_bounds) -> dict:
+    lo, hi = date_bounds
+    mid = lo + (hi - lo) / 2
+    return {
+        "all": (None, None, None, None),
+        "country": (countries[:2], None, None, None),
+        "plan+channel": (None, plans[-1:], channels[:1], None),
+        "date range": (None, None, None, (lo.normalize(), mid.normalize())),
+        "combined": (countries[:3], plans[:2], channels[1:], (mid.normalize(), hi.normalize())),
+    }
+
+def parity_report(base_dir: str, filter_sets: dict = None) -> pd.DataFrame:
+    """Compare every SQL metric with its pandas reference under each filter set."""
+    backend = SqlBackend(base_dir)
+    index = FilterIndex(*(read_table(base_dir, name) for name in ("users", "subscriptions", "events", "revenue")))
+    filter_sets = filter_sets or default_filter_sets(*backend.dimension_values(), backend.date_bounds())
+    rows = []
+    for label, filters in filter_sets.items():
+        frames = index.filter(*filters)
+        for name, reference, method, kwargs in parity_cases(base_dir):
+            row = {"filters": label, "metric": name, "status": "ok", "detail": "", "pandas_s": np.nan, "sql_s": np.nan}
+            rows.append(row)
+            try:
+                started = time.perf_counter()
+                expected = reference(*frames)
+                row["pandas_s"] = time.perf_counter() - started
+            except Exception as exc:
+                row.update(status="reference error", detail=repr(exc))
+                continue
+            try:
+                started = time.perf_counter()
+                actual = getattr(backend, method)(*filters, **kwargs)
+                row["sql_s"] = time.perf_counter() - started
+            except Exception as exc:
+                row.update(status="sql error", detail=repr(exc))
+                continue
+            row["detail"] = _compare(expected, actual)
+            if row["detail"]:
+                row["status"] = "mismatch"
+    return pd.DataFrame(rows)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check the DuckDB backend against the pandas metrics.")
+    parser.add_argument("--base-dir", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    args = parser.parse_args(argv)
+    report = parity_report(args.base_dir)
+    with pd.option_context("display.max_colwidth", 80, "display.width", 200):
+        print(report.to_string(index=False, float_format="{:.3f}".format))
+    counts = report["status"].value_counts()
+    print(
+        f"\n{counts.get('ok', 0)} ok, {counts.get('mismatch', 0)} mismatches, {counts.get('sql error', 0)} SQL errors, "
+        f"{counts.get('reference error', 0)} skipped (pandas reference raised)"
+    )
+    return 1 if counts.get("mismatch", 0) or counts.get("sql error", 0) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
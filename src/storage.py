@@ -0,0 +1,201 @@
+import glob
+import hashlib
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - CSV-only installs
+    pa = None
+
+# "columns" maps each required column to the kind of dtype a valid file
+# loads as: datetime, number, flag (bool) or text (str, object or category).
+TABLES = {
+    "users": {
+        "parse_dates": ["signup_date"],
+        "categories": ["user_id", "country", "acquisition_channel", "initial_plan"],
+        "columns": {"user_id": "text", "country": "text", "signup_date": "datetime", "acquisition_channel": "text", "initial_plan": "text"},
+    },
+    "subscriptions": {
+        "parse_dates": ["subscription_start_date", "subscription_end_date"],
+        "categories": ["user_id", "plan_type"],
+        "columns": {
+            "user_id": "text",
+            "subscription_start_date": "datetime",
+            "subscription_end_date": "datetime",
+            "plan_type": "text",
+            "is_churned": "flag",
+            "mrr": "number",
+        },
+    },
+    "events": {
+        "parse_dates": ["event_timestamp"],
+        "categories": ["user_id", "event_type", "feature_name"],
+        "columns": {"user_id": "text", "event_type": "text", "event_timestamp": "datetime", "feature_name": "text"},
+    },
+    "revenue": {
+        "parse_dates": ["month"],
+        "categories": [],
+        "columns": {"month": "datetime", "mrr": "number", "expansion_mrr": "number", "contraction_mrr": "number", "churn_mrr": "number", "new_mrr": "number"},
+    },
+}
+
+EVENTS_PARTITION = "event_month"
+CSV_CHUNK_ROWS = 1_000_000
+
+def raw_dir(base_dir: str) -> str:
+    return os.path.join(base_dir, "data", "raw")
+
+def processed_dir(base_dir: str) -> str:
+    return os.path.join(base_dir, "data", "processed")
+
+def parquet_path(base_dir: str, name: str) -> str:
+    if name == "events":
+        return os.path.join(processed_dir(base_dir), "events")
+    return os.path.join(processed_dir(base_dir), f"{name}.parquet")
+
+def has_parquet(base_dir: str, name: str) -> bool:
+    return pa is not None and os.path.exists(parquet_path(base_dir, name))
+
+def _typed(df: pd.DataFrame, name: str) -> pd.DataFrame:
+    for col in TABLES[name]["categories"]:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+def write_table(df: pd.DataFrame, base_dir: str, name: str) -> None:
+    _typed(df.copy(), name).to_parquet(parquet_path(base_dir, name), index=False)
+
+def write_events_partitioned(events: pd.DataFrame, root: str, tag: str = "part") -> None:
+    # Sorting keeps each month contiguous so the writer emits one row group
+    # per partition instead of many small ones that each repeat the dictionaries.
+    df = _typed(events.sort_values("event_timestamp", kind="stable"), "events")
+    months = df["event_timestamp"].to_numpy().astype("datetime64[M]")
+    uniques, codes = np.unique(months, return_inverse=True)
+    df[EVENTS_PARTITION] = pd.Categorical.from_codes(codes.ravel(), np.datetime_as_string(uniques, unit="M"))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_to_dataset(
+        table,
+        root,
+        partition_cols=[EVENTS_PARTITION],
+        basename_template=f"{tag}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+def ingest_csv_to_parquet(base_dir: str, chunk_rows: int = CSV_CHUNK_ROWS) -> dict:
+    if pa is None:
+        raise ImportError("pyarrow is required to ingest data to Parquet")
+    os.makedirs(processed_dir(base_dir), exist_ok=True)
+    written = {}
+    for name, spec in TABLES.items():
+        path = csv_path(base_dir, name)
+        if not os.path.exists(path):
+            continue
+        out = parquet_path(base_dir, name)
+        if name == "events":
+            if os.path.exists(out):
+                shutil.rmtree(out)
+            rows = 0
+            reader = pd.read_csv(path, parse_dates=spec["parse_dates"], chunksize=chunk_rows)
+            for i, chunk in enumerate(reader):
+                write_events_partitioned(chunk, out, tag=f"chunk{i:05d}")
+                rows += len(chunk)
+        else:
+            df = pd.read_csv(path, parse_dates=spec["parse_dates"])
+            write_table(df, base_dir, name)
+            rows = len(df)
+        written[name] = rows
+    return written
+
+def _month_filter(start=None, end=None):
+    expr = None
+    if start is not None:
+        expr = ds.field(EVENTS_PARTITION) >= pd.Timestamp(start).strftime("%Y-%m")
+    if end is not None:
+        upper = ds.field(EVENTS_PARTITION) <= pd.Timestamp(end).strftime("%Y-%m")
+        expr = upper if expr is None else expr & upper
+    return expr
+
+def read_table(base_dir: str, name: str, columns=None, start=None, end=None) -> pd.DataFrame:
+    spec = TABLES[name]
+    columns = list(columns) if columns is not None else None
+    if has_parquet(base_dir, name):
+        if name == "events":
+            dataset = ds.dataset(parquet_path(base_dir, name), format="parquet", partitioning="hive")
+            if columns is None:
+                columns = [f for f in dataset.schema.names if f != EVENTS_PARTITION]
+            return dataset.to_table(columns=columns, filter=_month_filter(start, end)).to_pandas()
+        return pd.read_parquet(parquet_path(base_dir, name), columns=columns)
+    parse_dates = [c for c in spec["parse_dates"] if columns is None or c in columns]
+    df = pd.read_csv(csv_path(base_dir, name), usecols=columns, parse_dates=parse_dates)
+    return df
+
+def csv_path(base_dir: str, name: str) -> str:
+    return os.path.join(raw_dir(base_dir), f"{name}.csv")
+
+def table_paths(base_dir: str) -> list:
+    """Every file or directory the tables are read from; a new batch bumps its month partition's mtime."""
+    paths = []
+    for name in TABLES:
+        paths += [csv_path(base_dir, name), parquet_path(base_dir, name)]
+    events = parquet_path(base_dir, "events")
+    if os.path.isdir(events):
+        paths += sorted(entry.path for entry in os.scandir(events) if entry.is_dir())
+    return paths
+
+def stat_version(paths) -> str:
+    digest = hashlib.sha1()
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+# Derived data (rollups, aggregates) records the table_version it was built
+# from, so a regenerated or re-ingested dataset is never served stale results.
+SOURCE_VERSION_NAME = "source_version"
+
+def stamp_source_version(directory: str, base_dir: str) -> None:
+    with open(os.path.join(directory, SOURCE_VERSION_NAME), "w") as f:
+        f.write(stat_version(table_paths(base_dir)))
+
+def has_source_version(directory: str, base_dir: str) -> bool:
+    path = os.path.join(directory, SOURCE_VERSION_NAME)
+    if not os.path.exists(path):
+        return False
+    with open(path) as f:
+        return f.read() == stat_version(table_paths(base_dir))
+
+def _batch_version(path: str):
+    name = os.path.basename(path)
+    return int(name[5:11]) if name.startswith("batch") else None
+
+def read_events_snapshot(base_dir: str, version: int, columns=None) -> pd.DataFrame:
+    """Events as of a manifest version: files of later batches are skipped.
+
+    A batch's files are written before its manifest entry, so a plain read
+    can see rows whose version the reader has not recorded yet.
+    """
+    root = parquet_path(base_dir, "events")
+    paths = sorted(glob.glob(os.path.join(root, "*", "*.parquet")))
+    paths = [p for p in paths if (_batch_version(p) or 0) <= version]
+    dataset = ds.dataset(paths, format="parquet", partitioning="hive", partition_base_dir=root)
+    if columns is None:
+        columns = [f for f in dataset.schema.names if f != EVENTS_PARTITION]
+    return dataset.to_table(columns=list(columns)).to_pandas()
+
+def main():
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    print("Converting data/raw/*.csv to Parquet...")
+    for name, rows in ingest_csv_to_parquet(base_dir).items():
+        print(f"  {name}: {rows} rows")
+    print("Done. Files saved under data/processed/.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import os
+import numpy as np
+import pandas as pd
+
+from src.analytics import conversion_funnel
+from src.cohorts import cohort_retention_matrix
+from src.filter_engine import day_after
+from src.funnel import KEY_EVENTS
+from src.intervals import PlanIndex
+from src.storage import TABLES, has_parquet, parquet_path, raw_dir
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:  # pragma: no cover - CSV-only installs
+    pa = ds = None
+
+CHUNK_ROWS = 1_000_000
+STREAM_COLUMNS = ["user_id", "event_type", "event_timestamp", "feature_name"]
+
+# (user, day) pairs are packed into one int64: user position in the high
+# bits, days since DAY_ORIGIN in the low DAY_BITS bits. DAY_ORIGIN is the
+# first day a nanosecond timestamp can hold, so every offset is non-negative
+# and the ~213k days up to 2262 fit.
+DAY_BITS = 20
+DAY_ORIGIN = np.datetime64(pd.Timestamp.min.date(), "D")
+
+def read_event_chunks(base_dir: str, columns=None, chunk_rows: int = CHUNK_ROWS):
+    columns = list(columns or STREAM_COLUMNS)
+    if has_parquet(base_dir, "events"):
+        dataset = ds.dataset(parquet_path(base_dir, "events"), format="parquet", partitioning="hive")
+        # Row groups are per partition file; coalesce them into chunk_rows-sized frames.
+        buffered, rows = [], 0
+        for batch in dataset.to_batches(columns=columns, batch_size=chunk_rows):
+            buffered.append(batch)
+            rows += batch.num_rows
+            if rows >= chunk_rows:
+                yield pa.Table.from_batches(buffered).to_pandas()
+                buffered, rows = [], 0
+        if buffered:
+            yield pa.Table.from_batches(buffered).to_pandas()
+        return
+    path = os.path.join(raw_dir(base_dir), "events.csv")
+    parse_dates = [c for c in TABLES["events"]["parse_dates"] if c in columns]
+    yield from pd.read_csv(path, usecols=columns, parse_dates=parse_dates, chunksize=chunk_rows)
+
+def _add_counts(total, counts: pd.Series) -> pd.Series:
+    if total is None:
+        return counts.astype("int64")
+    return total.add(counts, fill_value=0).astype("int64")
+
+class EventAggregates:
+    """Mergeable partial aggregates over event chunks.
+
+    Holds feature counts, (plan at event time, feature) counts, the set of (user, day)
+    pairs and a bitmap of activated users, which is everything the event
+    metrics need; peak memory is bounded by distinct pairs, not events.
+    """
+
+    def __init__(self, plans: PlanIndex = None, known_users=None):
+        self.plans = plans
+        self.user_index = pd.Index(known_users if known_users is not None else [], dtype=object)
+        self.feature_counts = None
+        self.plan_feature_counts = None
+        self.user_days = np.empty(0, dtype=np.int64)
+        self.activated = np.zeros(len(self.user_index), dtype=bool)
+        self._pending = []
+        self._pending_rows = 0
+
+    def _positions(self, user_ids) -> np.ndarray:
+        user_ids = pd.Index(pd.Series(user_ids).astype(object).to_numpy())
+        pos = self.user_index.get_indexer(user_ids)
+        missing = pos < 0
+        if missing.any():
+            self.user_index = self.user_index.append(user_ids[missing].unique())
+            pos[missing] = self.user_index.get_indexer(user_ids[missing])
+            self.activated = np.r_[self.activated, np.zeros(len(self.user_index) - len(self.activated), dtype=bool)]
+        return pos.astype(np.int64)
+
+    def _add_pairs(self, keys: np.ndarray) -> None:
+        self._pending.append(np.unique(keys))
+        self._pending_rows += len(self._pending[-1])
+        if self._pending_rows > max(len(self.user_days), CHUNK_ROWS):
+            self._compact()
+
+    def _compact(self) -> None:
+        if self._pending:
+            self.user_days = np.unique(np.concatenate([self.user_days] + self._pending))
+            self._pending = []
+            self._pending_rows = 0
+
+    def fold(self, chunk: pd.DataFrame) -> "EventAggregates":
+        chunk = chunk[chunk["user_id"].notna()]
+        if chunk.empty:
+            return self
+        pos = self._positions(chunk["user_id"])
+
+        if "event_timestamp" in chunk.columns:
+            ts = chunk["event_timestamp"]
+            valid = ts.notna().to_numpy()
+            days = (ts.to_numpy(dtype="datetime64[ns]")[valid].astype("datetime64[D]") - DAY_ORIGIN).astype(np.int64)
+            self._add_pairs((pos[valid] << DAY_BITS) | days)
+
+        if "event_type" in chunk.columns:
+            key = chunk["event_type"].isin(list(KEY_EVENTS)).to_numpy()
+            self.activated[pos[key]] = True
+
+        if "feature_name" in chunk.columns:
+            feats = chunk[chunk["feature_name"].notna()]
+            names = feats["feature_name"].astype(object)
+            self.feature_counts = _add_counts(self.feature_counts, names.value_counts())
+            if self.plans is not None and "event_timestamp" in feats.columns:
+                plans = self.plans.plans_at(feats["user_id"], feats["event_timestamp"]).astype(object)
+                by_plan = pd.DataFrame({"plan_type": plans, "feature_name": names.to_numpy()})
+                by_plan = by_plan.groupby(["plan_type", "feature_name"]).size()
+                self.plan_feature_counts = _add_counts(self.plan_feature_counts, by_plan)
+        return self
+
+    def merge(self, other: "EventAggregates") -> "EventAggregates":
+        self._compact()
+        other._compact()
+        remap = self._positions(other.user_index)
+        other_pos = other.user_days >> DAY_BITS
+        days = other.user_days & ((1 << DAY_BITS) - 1)
+        self._add_pairs((remap[other_pos] << DAY_BITS) | days)
+        self.activated[remap[other.activated]] = True
+        for name in ("feature_counts", "plan_feature_counts"):
+            if getattr(other, name) is not None:
+                setattr(self, name, _add_counts(getattr(self, name), getattr(other, name)))
+        return self
+
+    def _pairs_frame(self) -> pd.DataFrame:
+        self._compact()
+        pos = self.user_days >> DAY_BITS
+        days = DAY_ORIGIN + (self.user_days & ((1 << DAY_BITS) - 1)).astype("timedelta64[D]")
+        return pd.DataFrame({"user_id": self.user_index.to_numpy()[pos], "event_timestamp": pd.to_datetime(days)})
+
+    def daily_active_users(self) -> pd.DataFrame:
+        pairs = self._pairs_frame()
+        pairs["date"] = pairs["event_timestamp"].dt.date
+        return pairs.groupby("date")["user_id"].nunique().reset_index(name="dau")
+
+    def monthly_active_users(self) -> pd.DataFrame:
+        pairs = self._pairs_frame()
+        pairs["month"] = pairs["event_timestamp"].dt.to_period("M").dt.to_timestamp()
+        return pairs.groupby("month")["user_id"].nunique().reset_index(name="mau")
+
+    def cohort_retention_matrix(self, users: pd.DataFrame, **kwargs) -> pd.DataFrame:
+        return cohort_retention_matrix(users, self._pairs_frame(), **kwargs)
+
+    def feature_usage_counts(self) -> pd.DataFrame:
+        if self.feature_counts is None:
+            return pd.DataFrame(columns=["feature_name", "event_count"])
+        counts = self.feature_counts.sort_index().rename_axis("feature_name").reset_index(name="event_count")
+        return counts.sort_values("event_count", ascending=False)
+
+    def top_features(self, n: int = 10) -> pd.DataFrame:
+        return self.feature_usage_counts().head(n)
+
+    def feature_usage_by_plan(self) -> pd.DataFrame:
+        if self.plan_feature_counts is None:
+            return pd.DataFrame(columns=["plan_type", "feature_name", "event_count"])
+        grouped = self.plan_feature_counts.sort_index()
+        grouped.index = grouped.index.set_names(["plan_type", "feature_name"])
+        return grouped.reset_index(name="event_count")
+
+    def activated_users(self) -> np.ndarray:
+        return self.user_index.to_numpy()[np.flatnonzero(self.activated)]
+
+    def activation_rate(self, users: pd.DataFrame) -> float:
+        if len(users) == 0:
+            return 0.0
+        return float(self.activated.sum()) / float(len(users))
+
+    def conversion_funnel(self, users: pd.DataFrame, subscriptions: pd.DataFrame) -> pd.DataFrame:
+        activated = pd.DataFrame({"user_id": self.activated_users(), "event_type": KEY_EVENTS[0]})
+        return conversion_funnel(users, activated, subscriptions)
+
+def stream_event_aggregates(
+    base_dir: str, users: pd.DataFrame, subscriptions: pd.DataFrame, chunk_rows: int = CHUNK_ROWS, start=None, end=None
+) -> EventAggregates:
+    # start and end bound the events as the dashboard's date filter does; either may be open.
+    aggregates = EventAggregates(PlanIndex(subscriptions), users["user_id"].astype(object).unique())
+    for chunk in read_event_chunks(base_dir, chunk_rows=chunk_rows):
+        ts = chunk["event_timestamp"]
+        if start is not None:
+            chunk = chunk[(ts >= pd.Timestamp(start)).to_numpy()]
+        if end is not None:
+            chunk = chunk[(chunk["event_timestamp"] < day_after(end)).to_numpy()]
+        aggregates.fold(chunk)
+    return aggregates
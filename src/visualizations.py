@@ -1,29 +1,118 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 
-def dau_mau_chart(dau: pd.DataFrame, mau: pd.DataFrame):
-    fig = go.Figure()
+from src.instrumentation import traced
+
+# Line figures with more points than this (over all traces) render with
+# WebGL; SVG slows down badly past a few thousand points.
+WEBGL_POINTS = 1500
+# Longer series are downsampled server-side to this many points per trace.
+MAX_LINE_POINTS = 2000
+# Retention heatmaps above this many cells merge adjacent cohort rows.
+MAX_HEATMAP_CELLS = 20_000
+HEATMAP_DECIMALS = 4
+FIGURE_CACHE_BYTES = 64 << 20
+
+def _numeric(values) -> np.ndarray:
+    values = np.asarray(values)
+    if values.dtype.kind in "iufb":
+        return values.astype(np.float64)
+    return pd.to_datetime(values).to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(np.float64)
+
+def lttb_indices(x, y, n_out: int) -> np.ndarray:
+    """Positions kept by Largest-Triangle-Three-Buckets downsampling to n_out points.
+
+    The first and last points are always kept; every bucket in between keeps
+    the point forming the largest triangle with the point kept before it
+    and the mean of the next bucket, which preserves peaks and troughs.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = _numeric(x)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    cx, cy = np.r_[0.0, np.cumsum(x)], np.r_[0.0, np.cumsum(y)]
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            nlo, nhi = edges[i + 1], edges[i + 2]
+            mx, my = (cx[nhi] - cx[nlo]) / (nhi - nlo), (cy[nhi] - cy[nlo]) / (nhi - nlo)
+        else:
+            mx, my = x[-1], y[-1]
+        area = np.abs((x[a] - mx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (my - y[a]))
+        a = lo + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+def line_traces(series, max_points: int = MAX_LINE_POINTS, webgl_points: int = WEBGL_POINTS) -> list:
+    """Line traces for [(x, y, name), ...], downsampled with LTTB and switched to WebGL when large."""
+    points = []
+    for x, y, name in series:
+        x, y = np.asarray(x), np.asarray(y, dtype=np.float64)
+        if max_points and len(y) > max_points:
+            keep = lttb_indices(x, y, max_points)
+            x, y = x[keep], y[keep]
+        points.append((x, y, name))
+    trace = go.Scattergl if sum(len(y) for _, y, _ in points) > webgl_points else go.Scatter
+    return [trace(x=x, y=y, mode="lines", name=name) for x, y, name in points]
+
+def _compact_heatmap(matrix: pd.DataFrame, max_cells: int):
+    """Average blocks of adjacent cohort rows until the matrix fits in max_cells."""
+    values = matrix.to_numpy(dtype=np.float64)
+    n_rows, n_cols = values.shape
+    per_row = max(1, -(-n_rows * n_cols // max_cells))
+    if per_row == 1:
+        return values, matrix.index, 1
+    starts = np.arange(0, n_rows, per_row)
+    filled = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(filled, values, 0.0), starts, axis=0)
+    counts = np.add.reduceat(filled, starts, axis=0)
+    with np.errstate(invalid="ignore"):
+        return sums / np.where(counts > 0, counts, np.nan), matrix.index[starts], per_row
+
+@traced()
+def dau_mau_chart(dau: pd.DataFrame, mau: pd.DataFrame, max_points: int = MAX_LINE_POINTS):
+    series = []
     if not dau.empty:
-        fig.add_trace(go.Scatter(x=dau["date"], y=dau["dau"], mode="lines", name="DAU"))
+        series.append((dau["date"], dau["dau"], "DAU"))
     if not mau.empty:
-        fig.add_trace(go.Scatter(x=mau["month"], y=mau["mau"], mode="lines", name="MAU"))
+        series.append((mau["month"], mau["mau"], "MAU"))
+    fig = go.Figure(line_traces(series, max_points))
     fig.update_layout(title="Daily & Monthly Active Users", xaxis_title="Date", yaxis_title="Users")
     return fig
 
-def retention_heatmap(matrix: pd.DataFrame):
+@traced()
+def retention_heatmap(matrix: pd.DataFrame, max_cells: int = MAX_HEATMAP_CELLS):
     if matrix.empty:
         return go.Figure()
+    weekly = matrix.index.name == "signup_week"
+    period = "week" if weekly else "month"
+    values, cohorts, per_row = _compact_heatmap(matrix, max_cells)
     fig = px.imshow(
-        matrix.values,
-        labels=dict(x="Months since signup", y="Cohort (signup month)", color="Retention"),
+        np.round(values, HEATMAP_DECIMALS),
+        labels=dict(x=f"{period.title()}s since signup", y=f"Cohort (signup {period})", color="Retention"),
         x=matrix.columns,
-        y=[d.strftime("%Y-%m") for d in matrix.index],
+        y=[d.strftime("%Y-%m-%d" if weekly else "%Y-%m") for d in cohorts],
         color_continuous_scale="Blues",
     )
-    fig.update_layout(title="Cohort Retention Heatmap")
+    title = "Cohort Retention Heatmap"
+    if per_row > 1:
+        title += f" ({per_row} {period}ly cohorts per row)"
+    fig.update_layout(title=title)
     return fig
 
+@traced()
 def feature_usage_bar(feature_usage_df: pd.DataFrame):
     if feature_usage_df.empty:
         return go.Figure()
@@ -31,6 +120,7 @@ def feature_usage_bar(feature_usage_df: pd.DataFrame):
     fig.update_layout(xaxis_title="Feature", yaxis_title="Event count")
     return fig
 
+@traced()
 def funnel_chart(funnel_df: pd.DataFrame):
     if funnel_df.empty:
         return go.Figure()
@@ -44,16 +134,108 @@ def funnel_chart(funnel_df: pd.DataFrame):
     fig.update_layout(title="Signup → Activation → Paying → Retained Funnel")
     return fig
 
-def mrr_trend_chart(mrr_df: pd.DataFrame):
+@traced()
+def funnel_breakdown_chart(breakdown: pd.DataFrame, by: str):
+    if breakdown.empty:
+        return go.Figure()
+    fig = px.bar(breakdown, x="step", y="conversion", color=by, barmode="group", title=f"Funnel Conversion by {by}")
+    fig.update_layout(xaxis_title="Step", yaxis_title="Share of signups", yaxis_tickformat=".0%")
+    return fig
+
+@traced()
+def mrr_trend_chart(mrr_df: pd.DataFrame, max_points: int = MAX_LINE_POINTS):
     if mrr_df.empty:
         return go.Figure()
-    fig = px.line(mrr_df, x="month", y="mrr", title="Monthly Recurring Revenue (MRR)")
-    fig.update_layout(xaxis_title="Month", yaxis_title="MRR")
+    fig = go.Figure(line_traces([(mrr_df["month"], mrr_df["mrr"], "MRR")], max_points))
+    fig.update_layout(title="Monthly Recurring Revenue (MRR)", xaxis_title="Month", yaxis_title="MRR")
     return fig
 
-def churn_trend_chart(revenue_df: pd.DataFrame):
+@traced()
+def churn_trend_chart(revenue_df: pd.DataFrame, max_points: int = MAX_LINE_POINTS):
     if revenue_df.empty or "churn_mrr" not in revenue_df.columns:
         return go.Figure()
-    fig = px.line(revenue_df, x="month", y="churn_mrr", title="Churn MRR Trend")
-    fig.update_layout(xaxis_title="Month", yaxis_title="Churn MRR")
+    fig = go.Figure(line_traces([(revenue_df["month"], revenue_df["churn_mrr"], "Churn MRR")], max_points))
+    fig.update_layout(title="Churn MRR Trend", xaxis_title="Month", yaxis_title="Churn MRR")
     return fig
+
+def _hash_values(values, digest) -> None:
+    if isinstance(values, pd.MultiIndex):
+        values = values.to_frame(index=False)
+    if isinstance(values, pd.DataFrame):
+        for _, col in values.items():
+            _hash_values(col, digest)
+        return
+    if isinstance(getattr(values, "dtype", None), pd.CategoricalDtype):
+        # Codes plus categories, instead of materializing every label.
+        values = pd.Categorical(values)
+        _hash_values(values.categories, digest)
+        values = values.codes
+    array = values.to_numpy() if isinstance(values, (pd.Series, pd.Index)) else np.asarray(values)
+    if array.dtype.kind in "biufcmM":
+        # Raw bytes: much cheaper than hash_pandas_object on wide numeric matrices.
+        digest.update(np.ascontiguousarray(array).tobytes())
+    else:
+        digest.update(pd.util.hash_pandas_object(pd.Series(array), index=False).to_numpy().tobytes())
+
+def data_hash(value) -> str:
+    """Content hash of chart inputs: frames by values, index, columns and dtypes; anything else by repr."""
+    digest = hashlib.sha1()
+    if isinstance(value, pd.DataFrame):
+        frame = value.to_numpy() if len(set(value.dtypes)) == 1 and value.dtypes.iloc[0].kind in "biufcmM" else value
+        _hash_values(frame, digest)
+        _hash_values(value.index, digest)
+        digest.update(repr((list(value.columns), [str(d) for d in value.dtypes], value.index.names)).encode())
+    elif isinstance(value, pd.Series):
+        _hash_values(value, digest)
+        _hash_values(value.index, digest)
+        digest.update(repr((value.name, str(value.dtype), value.index.names)).encode())
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            digest.update(data_hash(item).encode())
+    else:
+        digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+class FigureCache:
+    """LRU cache of serialized figures, keyed on the chart function and a hash of its inputs.
+
+    Figures are stored as JSON, so a cached chart can't be mutated by a
+    caller; hits are rebuilt without re-validation, which costs a small
+    fraction of building the figure again. Size is bounded in JSON bytes.
+    """
+
+    def __init__(self, max_bytes: int = FIGURE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(self, fn, args, kwargs) -> tuple:
+        return (fn.__module__, fn.__qualname__, data_hash(list(args)), data_hash(sorted(kwargs.items())))
+
+    def get_or_build(self, fn, *args, **kwargs) -> go.Figure:
+        key = self.key(fn, args, kwargs)
+        with self._lock:
+            spec = self._entries.get(key)
+            if spec is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if spec is None:
+            spec = fn(*args, **kwargs).to_json()
+            with self._lock:
+                self.misses += 1
+                if key not in self._entries and len(spec) <= self.max_bytes:
+                    self._entries[key] = spec
+                    self.bytes += len(spec)
+                while self.bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.bytes -= len(evicted)
+        return go.Figure(json.loads(spec), _validate=False)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from src import generate_dataset
+from src.feature_usage import feature_usage_by_plan
+from src.filter_engine import FilterIndex
+from src.ingest import build_feature_cube, feature_usage_by_plan_from_cube
+from src.intervals import PlanIndex
+from src.rollups import user_dimensions
+from src.storage import read_table
+
+@pytest.fixture(scope="module")
+def tables(tmp_path_factory):
+    base_dir = str(tmp_path_factory.mktemp("cube"))
+    generate_dataset.main(["--users", "300", "--events-per-user", "10", "--format", "parquet", "--base-dir", base_dir])
+    return [read_table(base_dir, name) for name in ("users", "subscriptions", "events", "revenue")]
+
+def _sorted(df):
+    return df.sort_values(["plan_type", "feature_name"]).reset_index(drop=True).astype({"plan_type": object, "feature_name": object})
+
+@pytest.mark.parametrize("selection", ["all", "country+plan", "date range"])
+def test_cube_matches_event_level_feature_usage_by_plan(tables, selection):
+    users, subs, events, _ = tables
+    index = FilterIndex(users, subs, events, tables[3])
+    lo, hi = index.date_bounds()
+    mid = (lo + (hi - lo) / 2).normalize()
+    countries = sorted(users["country"].unique())[:2] if selection == "country+plan" else None
+    plans = sorted(subs["plan_type"].unique())[:1] if selection == "country+plan" else None
+    date_range = (lo.normalize() + pd.Timedelta(days=20), mid) if selection == "date range" else None
+    _, subs_f, events_f, _ = index.filter(countries, plans, None, date_range)
+    expected = feature_usage_by_plan(events_f, subs_f)
+    cube = build_feature_cube(events, user_dimensions(users, subs), PlanIndex(subs))
+    actual = feature_usage_by_plan_from_cube(cube, countries, None, plans, date_range)
+    pd.testing.assert_frame_equal(_sorted(actual), _sorted(expected), check_dtype=False)
@@ -0,0 +1,109 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from src import analytics, generate_dataset
+from src.funnel import DEFAULT_STEPS, KEY_EVENTS, RETAINED, SIGNED_UP, FunnelStep, activation_from_flags, funnel_counts, funnel_from_flags, user_stage_flags
+from src.storage import read_table
+
+WINDOWED_STEPS = (
+    SIGNED_UP,
+    FunnelStep("Activated in 7d", "events", KEY_EVENTS, within_days=7),
+    FunnelStep("Paying in 30d", "paying", within_days=30),
+    RETAINED,
+)
+
+@pytest.fixture(scope="module")
+def tables(tmp_path_factory):
+    base_dir = str(tmp_path_factory.mktemp("funnel"))
+    generate_dataset.main(["--users", "300", "--events-per-user", "10", "--format", "parquet", "--seed", "7", "--base-dir", base_dir])
+    tables = {name: read_table(base_dir, name) for name in ("users", "subscriptions", "events")}
+    # Generated subscriptions run at most 18 months, so older datasets are fully churned;
+    # keep every third one active so the Retained step is exercised.
+    subs = tables["subscriptions"]
+    subs.loc[subs.index % 3 == 0, "is_churned"] = False
+    return tables
+
+@pytest.fixture(params=["all", "filtered"])
+def selection(request, tables):
+    users, subs, events = tables["users"], tables["subscriptions"], tables["events"]
+    if request.param == "filtered":
+        # Filtering users only, so events and subscriptions include users outside the table.
+        users = users[users["country"].isin(users["country"].unique()[:2])]
+    return users, subs, events
+
+def _previous_activation_rate(users, events):
+    activated_users = events[events["event_type"].isin(KEY_EVENTS)]["user_id"].unique()
+    if len(users) == 0:
+        return 0.0
+    return float(len(activated_users)) / float(len(users))
+
+def _previous_conversion_funnel(users, events, subscriptions):
+    activated = events[events["event_type"].isin(KEY_EVENTS)]["user_id"].drop_duplicates().tolist()
+    paying = subscriptions[subscriptions["mrr"] > 0]["user_id"].unique().tolist()
+    retained = subscriptions[~subscriptions["is_churned"] & (subscriptions["mrr"] > 0)]["user_id"].unique()
+    steps = ["Signed up", "Activated", "Paying", "Retained"]
+    return pd.DataFrame({"step": steps, "count": [len(users), len(activated), len(paying), len(retained)]})
+
+def _naive_hit(step, user_id, signup, events_by_user, subs_by_user):
+    if step.source == "signup":
+        return user_id in signup.index
+    if step.within_days is not None and user_id not in signup.index:
+        return False
+    if step.source == "events":
+        rows = events_by_user.get(user_id, events_by_user["empty"])
+        rows = rows[rows["event_type"].isin(step.event_types)]
+        times = rows["event_timestamp"]
+    else:
+        rows = subs_by_user.get(user_id, subs_by_user["empty"])
+        rows = rows[rows["mrr"] > 0]
+        if step.source == "retained":
+            rows = rows[~rows["is_churned"].astype(bool)]
+        times = rows["subscription_start_date"]
+    if step.within_days is not None:
+        times = times[times <= signup[user_id] + pd.Timedelta(days=step.within_days)]
+    return not times.empty
+
+def _naive_funnel(users, events, subscriptions, steps, ordered):
+    # One user at a time, straight from the step definitions.
+    signup = users.drop_duplicates("user_id").set_index("user_id")["signup_date"]
+    events_by_user = dict(tuple(events.groupby("user_id", observed=True)))
+    events_by_user["empty"] = events.iloc[:0]
+    subs_by_user = dict(tuple(subscriptions.groupby("user_id", observed=True)))
+    subs_by_user["empty"] = subscriptions.iloc[:0]
+    everyone = set(users["user_id"]) | set(events["user_id"]) | set(subscriptions["user_id"])
+    counts = dict.fromkeys((step.name for step in steps), 0)
+    for user_id in everyone:
+        previous = True
+        for step in steps:
+            hit = _naive_hit(step, user_id, signup, events_by_user, subs_by_user)
+            if ordered:
+                hit = previous = hit and previous
+            counts[step.name] += int(hit)
+    return pd.DataFrame({"step": list(counts), "count": list(counts.values())})
+
+def test_default_funnel_matches_previous_implementation(selection):
+    users, subs, events = selection
+    flags = user_stage_flags(users, events, subs, DEFAULT_STEPS)
+    expected = _previous_conversion_funnel(users, events, subs)
+    pd.testing.assert_frame_equal(funnel_from_flags(flags, len(users)), expected, check_dtype=False)
+    pd.testing.assert_frame_equal(analytics.conversion_funnel(users, events, subs), expected, check_dtype=False)
+    assert activation_from_flags(flags, len(users)) == _previous_activation_rate(users, events)
+    assert analytics.activation_rate(users, events) == _previous_activation_rate(users, events)
+
+@pytest.mark.parametrize("steps", [DEFAULT_STEPS, WINDOWED_STEPS], ids=["default", "within_days"])
+@pytest.mark.parametrize("ordered", [False, True])
+def test_stage_flags_match_per_user_reference(selection, steps, ordered):
+    users, subs, events = selection
+    flags = user_stage_flags(users, events, subs, steps, ordered=ordered)
+    expected = _naive_funnel(users, events, subs, steps, ordered)
+    pd.testing.assert_frame_equal(funnel_counts(flags), expected, check_dtype=False)
+
+def test_windows_and_order_only_narrow_the_funnel(tables):
+    users, subs, events = tables["users"], tables["subscriptions"], tables["events"]
+    loose = funnel_counts(user_stage_flags(users, events, subs, DEFAULT_STEPS))["count"].to_numpy()
+    windowed = funnel_counts(user_stage_flags(users, events, subs, WINDOWED_STEPS))["count"].to_numpy()
+    ordered = funnel_counts(user_stage_flags(users, events, subs, WINDOWED_STEPS, ordered=True))["count"].to_numpy()
+    assert (windowed <= loose).all() and (ordered <= windowed).all()
+    assert (ordered[1:] <= ordered[:-1]).all()
@@ -0,0 +1,22 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from src import generate_dataset
+from src.ingest import append_batch, manifest_version
+from src.storage import read_table
+
+def test_subscriptions_batch_without_start_dates(tmp_path):
+    base_dir = str(tmp_path)
+    generate_dataset.main(["--users", "100", "--events-per-user", "5", "--format", "parquet", "--base-dir", base_dir])
+    revenue = read_table(base_dir, "revenue")
+    subs = read_table(base_dir, "subscriptions")
+    batch = subs.head(2).astype({"user_id": object, "plan_type": object})
+    batch["subscription_start_date"] = pd.NaT
+    entry = append_batch(base_dir, subscriptions=batch)
+    assert entry["subscription_rows"] == 2
+    assert "revenue_months" not in entry
+    assert manifest_version(base_dir) == entry["version"]
+    assert len(read_table(base_dir, "subscriptions")) == len(subs) + 2
+    pd.testing.assert_frame_equal(read_table(base_dir, "revenue"), revenue)
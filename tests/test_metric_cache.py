@@ -0,0 +1,23 @@
+import pandas as pd
+
+from src.metric_cache import MetricCache
+
+def total(df):
+    return int(df["x"].sum())
+
+def test_frames_with_the_same_shape_get_their_own_entries():
+    cache = MetricCache()
+    a = pd.DataFrame({"x": [1, 2, 3]})
+    b = pd.DataFrame({"x": [10, 20, 30]})
+    assert cache.get_or_compute("sum", (), total, a) == 6
+    assert cache.get_or_compute("sum", (), total, b) == 60
+    assert cache.get_or_compute("sum", (), total, a.copy()) == 6
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_args_key_stands_in_for_the_arguments():
+    cache = MetricCache()
+    a = pd.DataFrame({"x": [1, 2, 3]})
+    assert cache.get_or_compute("sum", ("f",), total, a, args_key="filtered") == 6
+    assert cache.get_or_compute("sum", ("f",), total, a * 10, args_key="filtered") == 6
+    results = cache.get_or_compute_many(("f",), {"sum": (total, (a * 10,), {})})
+    assert results == {"sum": 60}
@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from src import generate_dataset
+from src.ingest import build_aggregates, load_aggregates
+from src.rollups import load_rollups
+
+def generate(base_dir, seed):
+    generate_dataset.main(["--users", "100", "--events-per-user", "5", "--format", "parquet", "--seed", str(seed), "--base-dir", base_dir])
+
+def test_derived_data_from_a_previous_dataset_is_not_served(tmp_path):
+    base_dir = str(tmp_path)
+    generate(base_dir, 1)
+    build_aggregates(base_dir)
+    assert load_rollups(base_dir) is not None
+    assert load_aggregates(base_dir) is not None
+    generate(base_dir, 2)
+    assert load_rollups(base_dir) is None
+    assert load_aggregates(base_dir) is None
@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("duckdb")
+pytest.importorskip("pyarrow")
+
+from src import generate_dataset
+from src.filter_engine import FilterIndex
+from src.sql_backend import SqlBackend, _compare, default_filter_sets, parity_cases
+from src.storage import read_table
+
+CASES = {name: (reference, method, kwargs) for name, reference, method, kwargs in parity_cases(None)}
+FILTER_SETS = ["all", "country", "plan+channel", "date range", "combined"]
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    base_dir = str(tmp_path_factory.mktemp("parity"))
+    generate_dataset.main(["--users", "300", "--events-per-user", "8", "--format", "parquet", "--base-dir", base_dir])
+    backend = SqlBackend(base_dir)
+    index = FilterIndex(*(read_table(base_dir, name) for name in ("users", "subscriptions", "events", "revenue")))
+    return backend, index, default_filter_sets(*backend.dimension_values(), backend.date_bounds())
+
+@pytest.mark.parametrize("label", FILTER_SETS)
+@pytest.mark.parametrize("name", list(CASES))
+def test_sql_matches_pandas(dataset, name, label):
+    backend, index, filter_sets = dataset
+    reference, method, kwargs = CASES[name]
+    filters = filter_sets[label]
+    expected = reference(*index.filter(*filters))
+    actual = getattr(backend, method)(*filters, **kwargs)
+    assert _compare(expected, actual) == ""
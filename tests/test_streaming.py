@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from src import analytics, generate_dataset
+from src.feature_usage import feature_usage_counts
+from src.parallel import MetricExecutor
+from src.report import STREAMING_METRICS, BatchReport, streaming_report
+from src.storage import read_table
+from src.streaming import EventAggregates, read_event_chunks, stream_event_aggregates
+
+@pytest.fixture(scope="module")
+def base_dir(tmp_path_factory):
+    base_dir = str(tmp_path_factory.mktemp("streaming"))
+    generate_dataset.main(["--users", "300", "--events-per-user", "10", "--format", "parquet", "--base-dir", base_dir])
+    return base_dir
+
+@pytest.fixture(scope="module")
+def tables(base_dir):
+    return {name: read_table(base_dir, name) for name in ("users", "subscriptions", "events")}
+
+def _merged(base_dir):
+    # Fold alternate chunks into two partials, as separate workers would, then merge them.
+    parts = [EventAggregates(), EventAggregates()]
+    for i, chunk in enumerate(read_event_chunks(base_dir, chunk_rows=700)):
+        parts[i % 2].fold(chunk)
+    return parts[0].merge(parts[1])
+
+def _same(actual, expected):
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False, check_categorical=False)
+
+def test_fold_and_merge_match_in_memory_metrics(base_dir, tables):
+    aggregates = _merged(base_dir)
+    events = tables["events"]
+    _same(aggregates.daily_active_users(), analytics.daily_active_users(events))
+    _same(aggregates.monthly_active_users(), analytics.monthly_active_users(events))
+    expected = feature_usage_counts(events).astype({"feature_name": object})
+    _same(aggregates.feature_usage_counts().sort_values("feature_name"), expected.sort_values("feature_name"))
+    _same(aggregates.conversion_funnel(tables["users"], tables["subscriptions"]), analytics.conversion_funnel(tables["users"], events, tables["subscriptions"]))
+
+def test_stream_respects_the_date_range(base_dir, tables):
+    start, end = pd.Timestamp("2023-04-01"), pd.Timestamp("2023-09-30")
+    aggregates = stream_event_aggregates(base_dir, tables["users"], tables["subscriptions"], chunk_rows=500, start=start, end=end)
+    ts = tables["events"]["event_timestamp"]
+    events = tables["events"][(ts >= start) & (ts < end + pd.Timedelta(days=1))]
+    _same(aggregates.daily_active_users(), analytics.daily_active_users(events))
+
+def test_streaming_report_matches_batch_report(base_dir):
+    start, end = "2023-03-01", "2024-02-15"
+    streamed, errors = streaming_report(base_dir, STREAMING_METRICS, start, end, chunk_rows=800)
+    assert errors == {}
+    with MetricExecutor(1) as executor:
+        loaded, errors = BatchReport(base_dir, executor, start, end).run(STREAMING_METRICS)
+    assert errors == {}
+    for name in STREAMING_METRICS:
+        _same(streamed[name].astype(object), loaded[name].astype(object))